@@ -1,8 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import inspect
 from dataclasses import dataclass
 from typing import Any, Callable
 
+from core.engine import EXECUTION_ENGINE, IsolatedCall
+from core.jobs import add_work, complete_work
+from core.progress import error_of, report_host
+
+# The argument that asks for a background capability to be run as a job.
+BACKGROUND_ARGUMENT = "run_in_background"
+
 
 class CapabilityRunner:
     """
@@ -16,10 +25,81 @@ class CapabilityRunner:
         self.description = capability.description
         self.capability = capability
         self.argument = argument
+        self._schema = None
 
     def __call__(self, *args, **kwargs):
+        """
+        The __call__ method executes the capability on the calling thread. A
+        coroutine capability is run through run_async, on a new event loop
+        when the thread has none, and otherwise returned to be awaited, since
+        the running loop cannot be blocked on.
+        """
+        if self.is_coroutine:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self.run_async(*args, **kwargs))
+            return self.run_async(*args, **kwargs)
+        if self.is_isolatable and EXECUTION_ENGINE.isolated:
+            return self.run_isolated(*args, **kwargs)
+        return self.capability.callable(self.argument, *args, **kwargs)
+
+    async def run_async(self, *args, **kwargs):
+        """
+        The run_async method executes the capability without blocking the
+        event loop. Coroutine capabilities are awaited directly, while
+        blocking capabilities are run on the shared ExecutionEngine.
+        """
         new_args = [self.argument] + list(args)
-        return self.capability.callable(*new_args, **kwargs)
+        if self.is_coroutine:
+            return await self.capability.callable(*new_args, **kwargs)
+        if self.is_isolatable and EXECUTION_ENGINE.isolated:
+            return await EXECUTION_ENGINE.run_blocking(self.run_isolated, *args, **kwargs)
+        return await EXECUTION_ENGINE.run_blocking(self.capability.callable, *new_args, **kwargs)
+
+    def run_isolated(self, *args, **kwargs):
+        """
+        The run_isolated method executes the capability on one of the
+        ExecutionEngine's worker processes. Progress and host events cannot
+        cross the process boundary, so the hosts of the call are reported
+        together once it returns.
+        """
+        hostnames = kwargs.get("hostnames") or []
+        add_work(len(hostnames))
+        result = EXECUTION_ENGINE.run_isolated(IsolatedCall(
+            owner=type(self.argument),
+            name=self.capability.name,
+            settings=self.argument.settings,
+            args=args,
+            kwargs=kwargs,
+        ))
+        if hostnames:
+            for host in hostnames:
+                output = result.get(host) if isinstance(result, dict) else None
+                report_host(host, error_of(output))
+            complete_work(len(hostnames))
+        return result
+
+    @property
+    def is_coroutine(self) -> bool:
+        """
+        The is_coroutine prop returns whether the capability is defined as a
+        coroutine function.
+        """
+        return inspect.iscoroutinefunction(self.capability.callable)
+
+    @property
+    def is_isolatable(self) -> bool:
+        """
+        The is_isolatable prop returns whether the capability can be run on a
+        worker process. It must block rather than be a coroutine, and be
+        defined on a class that can be rebuilt from its settings, such as a
+        device platform or a plugin.
+        """
+        return (self.capability.isolatable
+                and not self.is_coroutine
+                and getattr(type(self.argument), self.capability.name, None) is self.capability
+                and hasattr(self.argument, "settings"))
 
     @classmethod
     def make(cls, argument: Any):
@@ -40,36 +120,54 @@ class CapabilityRunner:
         """
         The parameters prop returns a Parameters
         object that describes the parameters that are required by the
-        LanguageFunction.
+        LanguageFunction. Capabilities that may be run in the background
+        take an extra argument asking for it.
         """
+        properties = dict(self.capability.properties or {})
+        if self.capability.background:
+            properties[BACKGROUND_ARGUMENT] = Property(
+                type="boolean",
+                description="Run as a background job and return its job id at once, instead of waiting for the "
+                            "result. Use it for large networks or many devices, then check the job later.",
+                required=False,
+            )
         return Parameters(
             type="object",
-            properties={name: prop for name, prop in self.capability.properties.items()},
-            required=[name for name, prop in self.capability.properties.items() if prop.required]
+            properties=properties,
+            required=[name for name, prop in properties.items() if prop.required]
         )
 
     def __dict__(self):
-        return {
-            "name": self.name,
-            "description": self.description,
-            "parameters": self.parameters.__dict__(),
-        }
+        # The schema is sent with every request, so it is built only once.
+        if self._schema is None:
+            self._schema = {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters.__dict__(),
+            }
+        return self._schema
 
 
 @dataclass
 class Capability:
     """
     A Capability is an abstract base class that defines the interface
-    for a callable that can be implemented by a class.
+    for a callable that can be implemented by a class. A background
+    capability takes long enough that it may be run as a background job. A
+    capability that is not isolatable always runs in the API process, even
+    when the ExecutionEngine isolates blocking capabilities.
     """
 
     name: str
     description: str
     callable: Callable[[Any], Any]
     properties: dict[str, Property] = None
+    background: bool = False
+    isolatable: bool = True
 
     @classmethod
-    def make(cls, description: str, properties: dict[str, Property] = None):
+    def make(cls, description: str, properties: dict[str, Property] = None, background: bool = False,
+             isolatable: bool = True):
         """
         The make decorator is used to decorate a function into a Capability.
         """
@@ -79,7 +177,9 @@ class Capability:
                 name=func.__name__,
                 description=description,
                 properties=properties,
-                callable=func
+                callable=func,
+                background=background,
+                isolatable=isolatable,
             )
 
         return decorator
@@ -6,7 +6,6 @@ from __future__ import annotations
 
 from typing import Any
 
-from netmiko import ConnectHandler
 from netmiko.exceptions import NetmikoTimeoutException
 from napalm import get_network_driver
 
@@ -16,6 +15,8 @@ from capabilities import Capability, Property
 
 class CiscoIOSPlatform(NetworkDevicePlatform):
     vendor = "Cisco IOS"
+    netmiko_device_type = "cisco_ios"
+    parser_platform = "cisco_ios"
 
     def __init__(self, settings: NetworkSettings):
         super().__init__(settings)
@@ -45,36 +46,26 @@ class CiscoIOSPlatform(NetworkDevicePlatform):
         """
         if not command.startswith("show"):
             raise Exception("Only show commands are supported.")
-        device_outputs = {}
-        for host in hostnames:
-            try:
-                with ConnectHandler(
-                    device_type="cisco_ios",
-                    host=host,
-                    username=self.settings.username,
-                    password=self.settings.password,
-                ) as device:
-                    device.enable()
-                    output = device.send_command(command)
-                    if not output:
-                        output = "No output from command."
-                    device_outputs.update(
-                        {
-                            host: {
-                                "command": command,
-                                "output": output,
-                            }
-                        }
-                    )
-            except NetmikoTimeoutException as e:
-                device_outputs.update(
-                    {
-                        host: {
-                            "error connecting": str(e),
-                        }
-                    }
-                )
-        return device_outputs
+        return self.fan_out(hostnames, lambda host: self._execute_on_host(host, command))
+
+    def _execute_on_host(self, host: str, command: str) -> dict[str, Any]:
+        """
+        The _execute_on_host function executes the specified command on a single device.
+        """
+        try:
+            output = self.send_command(host, command)
+            if not output:
+                output = "No output from command."
+            else:
+                output = self.structured(host, command, output)
+            return {
+                "command": command,
+                "output": output,
+            }
+        except NetmikoTimeoutException as e:
+            return {
+                "error connecting": str(e),
+            }
 
     @Capability.make(
         description='Get the LLDP neighbors of Cisco IOS devices.',
@@ -93,12 +84,4 @@ class CiscoIOSPlatform(NetworkDevicePlatform):
         The get_lldp_neighbors function returns a dictionary of the LLDP neighbors
         for the device.
         """
-        device_outputs = {}
-        for host in hostnames:
-            with self.driver(
-                hostname=host,
-                username=self.settings.username,
-                password=self.settings.password,
-            ) as device:
-                device_outputs.update({host: device.get_lldp_neighbors()})
-        return device_outputs
+        return self.fan_out(hostnames, self.lldp_neighbors)
@@ -7,18 +7,23 @@ from __future__ import annotations
 
 from typing import Any
 
-from netmiko import ConnectHandler
 from napalm import get_network_driver
+from netmiko.exceptions import NetmikoTimeoutException
 
 from capabilities import Capability, Property
 from clients.schema import NetworkSettings, NetworkDevicePlatform
 
+# The number of log lines gathered from each device.
+LOG_LINES = 100
+
 
 class CiscoNXOSPlatform(NetworkDevicePlatform):
     """
     The CiscoNXOSPlatform class defines the interface for connecting to and troubleshooting Cisco NX-OS devices.
     """
     vendor = "Cisco NXOS"
+    parser_platform = "cisco_nxos"
+    netmiko_device_type = "cisco_ios"
 
     def __init__(self, settings: NetworkSettings):
         super().__init__(settings)
@@ -41,7 +46,7 @@ class CiscoNXOSPlatform(NetworkDevicePlatform):
             ),
         },
     )
-    def get_logs(self: CiscoNXOSPlatform, hostnames: list[str], severity: str) -> dict[str, str]:
+    def get_logs(self: CiscoNXOSPlatform, hostnames: list[str], severity: str) -> dict[str, Any]:
         """
         The get_logs function gathers logging information from the device.
         """
@@ -53,22 +58,21 @@ class CiscoNXOSPlatform(NetworkDevicePlatform):
             "error": ".*-(3|2|1|0)-.*",
         }
         severity_exp = mapping[severity]
-        device_outputs = {}
-        for host in hostnames:
-            with ConnectHandler(
-                device_type="cisco_ios",
-                host=host,
-                username=self.settings.username,
-                password=self.settings.password,
-            ) as device:
-                device.enable()
-                output = device.send_command(f"show logging | egrep \"{severity_exp}\"")
-                if not output:
-                    output = "No logs found matching for severity level, " + severity + "."
-                # Slice the output number of lines to only include the last 100 lines.
-                output = "\n".join(output.split("\n")[-100:])
-                device_outputs.update({host: output})
-        return device_outputs
+        return self.fan_out(hostnames, lambda host: self._logs_on_host(host, severity, severity_exp))
+
+    def _logs_on_host(self, host: str, severity: str, severity_exp: str) -> Any:
+        """
+        The _logs_on_host function gathers logging information from a single device.
+        """
+        # Only the last lines are wanted, so the device is asked to tail the log itself.
+        lines = min(LOG_LINES, self.max_output_lines)
+        try:
+            output = self.send_command(host, f"show logging | egrep \"{severity_exp}\" | last {lines}")
+        except NetmikoTimeoutException as e:
+            return {"error connecting": str(e)}
+        if not output:
+            output = "No logs found matching for severity level, " + severity + "."
+        return output
 
     @Capability.make(
         description="Execute a CLI \"show\" command on Cisco NXOS devices.",
@@ -90,19 +94,13 @@ class CiscoNXOSPlatform(NetworkDevicePlatform):
         """
         The execute_command function executes the specified command on the device.
         """
-        device_outputs = {}
-        connect_handlers = [
-            ConnectHandler(
-                device_type="cisco_ios",
-                host=host,
-                username=self.settings.username,
-                password=self.settings.password,
-            )
-            for host in hostnames
-        ]
-        for connect_handler in connect_handlers:
-            with connect_handler as device:
-                device.enable()
-                output = device.send_command(command)
-                device_outputs.update({connect_handler.host: output})
-        return device_outputs
+        return self.fan_out(hostnames, lambda host: self._execute_on_host(host, command))
+
+    def _execute_on_host(self, host: str, command: str) -> Any:
+        """
+        The _execute_on_host function executes the specified command on a single device.
+        """
+        try:
+            return self.structured(host, command, self.send_command(host, command))
+        except NetmikoTimeoutException as e:
+            return {"error connecting": str(e)}
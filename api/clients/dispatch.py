@@ -0,0 +1,210 @@
+"""
+The Dispatch module lets a single chat reach a fleet of mixed platforms. The
+PlatformDispatcher holds one platform instance per DeviceType found in the
+inventory and exposes one capability per capability name. When such a
+capability is called, its hostnames are expanded through the inventory,
+split by DeviceType, and handed to the matching platform's capability.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from capabilities import Capability, CapabilityRunner, Property
+from clients.health import CircuitOpenException
+from clients.inventory import Inventory, InventoryException
+from clients.schema import (DEVICE_SERVER_INFO, HOST_HEALTH, TOPOLOGY, DeviceType, NetworkDevicePlatform,
+                            NetworkSettings)
+from core.engine import EXECUTION_ENGINE
+from core.progress import report_host
+
+# Arguments naming the single device that a capability without a hostnames list is routed by.
+HOST_ARGUMENTS = ("hostname", "source")
+
+# Words in a message that could be a hostname or an IP address.
+HOST_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.:\-]*[A-Za-z0-9]")
+
+TARGETS_DESCRIPTION = (" Inventory groups, sites and patterns such as leaf[01-48] or leaf* may be given"
+                       " in place of hostnames.")
+
+
+class PlatformDispatcher:
+    """
+    The PlatformDispatcher class routes capability calls to the platform of
+    each device. Devices missing from the inventory are treated as the
+    session's own DeviceType. Each platform is given the dispatcher as its
+    router, so that the devices a capability discovers on its own, such as
+    LLDP neighbors, are also reached through their own platform.
+    """
+
+    def __init__(self, settings: NetworkSettings, inventory: Inventory,
+                 platforms: Dict[DeviceType, type[NetworkDevicePlatform]]):
+        self.default = settings.deviceType
+        self.inventory = inventory
+        device_types = [self.default] + [t for t in inventory.device_types() if t != self.default and t in platforms]
+        self.platforms: Dict[DeviceType, NetworkDevicePlatform] = {
+            device_type: platforms[device_type](settings=settings.copy(update={"deviceType": device_type}))
+            for device_type in device_types
+        }
+        for platform in self.platforms.values():
+            platform.router = self.platform_for
+
+    def get_capabilities(self) -> List[Capability]:
+        """
+        The get_capabilities method returns one dispatching Capability for each
+        capability name offered by any of the platforms. The description is
+        taken from the session's own platform where it has the capability.
+        """
+        named: Dict[str, Dict[DeviceType, Capability]] = {}
+        for device_type, platform in self.platforms.items():
+            for capability in platform.get_capabilities():
+                named.setdefault(capability.name, {})[device_type] = capability
+        capabilities = []
+        for name, by_type in named.items():
+            template = by_type.get(self.default) or next(iter(by_type.values()))
+            properties = dict(template.properties or {})
+            if "hostnames" in properties:
+                hostnames = properties["hostnames"]
+                properties["hostnames"] = Property(
+                    type=hostnames.type,
+                    description=(hostnames.description or "") + TARGETS_DESCRIPTION,
+                    enum=hostnames.enum,
+                    items=hostnames.items,
+                    required=hostnames.required,
+                )
+            capabilities.append(Capability(
+                name=name,
+                description=template.description,
+                properties=properties,
+                callable=_dispatcher_for(name),
+                # Capabilities reaching many devices at once may take long enough to run as jobs.
+                background=template.background or "hostnames" in properties,
+            ))
+        return capabilities
+
+    def dispatch(self, name: str, **kwargs) -> Any:
+        """
+        The dispatch method calls the named capability on the platforms of the
+        targeted devices and merges their per-host results.
+        """
+        if "hostnames" not in kwargs:
+            host = next((kwargs[a] for a in HOST_ARGUMENTS if kwargs.get(a)), None)
+            device_type = self.device_type(host) if host else self.default
+            platform = self.platform_for(host) if host else self.platforms[self.default]
+            runner = self._runner(platform, name)
+            if runner is None:
+                return {"error": f"{name} is not supported on {device_type.value} devices."}
+            return runner(**kwargs)
+        try:
+            hostnames = self.inventory.expand(kwargs.pop("hostnames"))
+        except InventoryException as e:
+            return {"error": str(e)}
+        # Each worker process keeps its own breakers, so the API process's breakers are checked and fed here.
+        isolated = EXECUTION_ENGINE.isolated
+        device_outputs: Dict[str, Any] = {}
+        groups: Dict[DeviceType, List[str]] = {}
+        for host in hostnames:
+            if isolated:
+                try:
+                    HOST_HEALTH.check(host)
+                except CircuitOpenException as e:
+                    device_outputs[host] = {"error": f"{type(e).__name__}: {e}"}
+                    report_host(host, device_outputs[host]["error"])
+                    continue
+            groups.setdefault(self.device_type(host), []).append(host)
+        calls = {}
+        for device_type, hosts in groups.items():
+            platform = self.platforms.get(device_type)
+            runner = None if platform is None else self._runner(platform, name)
+            if runner is None:
+                for host in hosts:
+                    device_outputs[host] = {"error": f"{name} is not supported on {device_type.value} devices."}
+            else:
+                calls[device_type] = (runner, hosts)
+        if len(calls) == 1:
+            runner, hosts = next(iter(calls.values()))
+            device_outputs.update(runner(hostnames=hosts, **kwargs))
+        elif len(calls) > 1:
+            with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="dispatch") as executor:
+                # Each platform's call keeps the caller's context, such as the job it reports progress to.
+                futures = [executor.submit(contextvars.copy_context().run, runner, hostnames=hosts, **kwargs)
+                           for runner, hosts in calls.values()]
+                for future in futures:
+                    device_outputs.update(future.result())
+        if isolated:
+            for _, hosts in calls.values():
+                for host in hosts:
+                    if host in device_outputs:
+                        HOST_HEALTH.record(host, device_outputs[host])
+        return {host: device_outputs[host] for host in hostnames if host in device_outputs}
+
+    def mentioned_hosts(self, text: str) -> List[str]:
+        """
+        The mentioned_hosts method returns the known devices named in a piece
+        of text. A word, IP addresses included, counts as a device only if it
+        is in the inventory, the LLDP topology or has been called before, so
+        that no credentials are sent to a host that merely appears in a
+        message.
+        """
+        contacted = set(HOST_HEALTH.known_hosts())
+        hosts = [token for token in HOST_TOKEN.findall(text)
+                 if token in self.inventory or token.lower() in contacted or token in TOPOLOGY]
+        return list(dict.fromkeys(hosts))
+
+    def prewarm(self, text: str) -> List[str]:
+        """
+        The prewarm method starts opening sessions in the background to the
+        devices named in the text, so that a capability called on them soon
+        after finds a session waiting. Devices whose circuit breaker is open
+        are skipped. It returns the hosts being connected to.
+        """
+        if EXECUTION_ENGINE.isolated:
+            # Sessions opened here would not be seen by the worker processes that run the capabilities.
+            return []
+        started = []
+        for host in self.mentioned_hosts(text)[:DEVICE_SERVER_INFO.prewarm_max_hosts]:
+            platform = self.platforms.get(self.device_type(host))
+            if platform is not None and not HOST_HEALTH.is_open(host) and platform.prewarm(host):
+                started.append(host)
+        return started
+
+    def device_type(self, hostname: str) -> DeviceType:
+        """
+        The device_type method returns the DeviceType of the host from the
+        inventory, or the session's own DeviceType if the host is unknown.
+        """
+        return self.inventory.device_type(hostname) or self.default
+
+    def platform_for(self, hostname: str) -> NetworkDevicePlatform:
+        """
+        The platform_for method returns the platform for the DeviceType of the
+        host, or the session's own platform if there is none for it.
+        """
+        return self.platforms.get(self.device_type(hostname), self.platforms[self.default])
+
+    @staticmethod
+    def _runner(platform: NetworkDevicePlatform, name: str) -> CapabilityRunner | None:
+        """
+        The _runner method returns a runner for the platform's capability with
+        the name, or None if the platform does not have it.
+        """
+        capability = getattr(type(platform), name, None)
+        if not isinstance(capability, Capability):
+            return None
+        return CapabilityRunner(capability=capability, argument=platform)
+
+
+def _dispatcher_for(name: str):
+    """
+    The _dispatcher_for function returns the callable of the dispatching
+    Capability with the name.
+    """
+
+    def dispatch(dispatcher: PlatformDispatcher, **kwargs) -> Any:
+        return dispatcher.dispatch(name, **kwargs)
+
+    dispatch.__name__ = name
+    return dispatch
@@ -0,0 +1,325 @@
+"""
+The Health module tracks whether network devices are reachable. Each host
+has a circuit breaker that opens after repeated connection failures, so that
+calls to a device already known to be down fail immediately instead of
+waiting out the TCP and SSH timeouts. After a cooldown a single probe call is
+let through to test whether the device has recovered. The module also limits
+how many calls are in flight to each host and to all hosts together.
+"""
+
+from __future__ import annotations
+
+import errno
+import logging
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from napalm.base.exceptions import ConnectionException
+from netmiko.exceptions import NetmikoAuthenticationException, NetmikoTimeoutException
+from paramiko.ssh_exception import AuthenticationException, SSHException
+from pydantic import BaseModel
+
+from core.progress import error_of
+
+logger = logging.getLogger("uvicorn")
+
+# Errors that show a device cannot be reached, as opposed to errors such as bad credentials or a slow command.
+CONNECTION_ERRORS = (NetmikoTimeoutException, SSHException, ConnectionException, ConnectionError, socket.gaierror)
+NON_CONNECTION_ERRORS = (NetmikoAuthenticationException, AuthenticationException)
+
+# The errno values of the plain OSErrors raised when there is no route to a device.
+UNREACHABLE_ERRNOS = frozenset({errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN, errno.ENETDOWN})
+
+# The key of the error that a platform returns for a device it could not connect to.
+CONNECTING_KEY = "error connecting"
+
+# The errno given in the text of an OSError.
+ERRNO_PATTERN = re.compile(r"\[Errno (\d+)]")
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    The is_connection_error function returns whether the error shows that a
+    device cannot be reached. Plain OSErrors only count when there is no
+    route to the device, so that a command that times out does not.
+    """
+    return isinstance(error, CONNECTION_ERRORS) or (isinstance(error, OSError) and error.errno in UNREACHABLE_ERRNOS)
+
+
+def is_connection_error_text(error: str) -> bool:
+    """
+    The is_connection_error_text function applies is_connection_error to an
+    error reported as "<exception name>: <message>", as fan_out reports the
+    errors of a call made on a worker process.
+    """
+    name, _, message = error.partition(": ")
+    if name == "OSError":
+        number = ERRNO_PATTERN.match(message)
+        return number is not None and int(number.group(1)) in UNREACHABLE_ERRNOS
+    return name in _subclass_names(CONNECTION_ERRORS)
+
+
+def _subclass_names(classes: tuple) -> Set[str]:
+    """
+    The _subclass_names function returns the names of the classes and of all
+    their subclasses.
+    """
+    names = set()
+    pending = list(classes)
+    while pending:
+        cls = pending.pop()
+        if cls.__name__ not in names:
+            names.add(cls.__name__)
+            pending.extend(cls.__subclasses__())
+    return names
+
+
+class CircuitState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitOpenException(Exception):
+    """
+    A CircuitOpenException is raised when a call is made to a host whose
+    circuit breaker is open.
+    """
+
+
+class HostBusyException(Exception):
+    """
+    A HostBusyException is raised when a call cannot start before the
+    in-flight limits allow it.
+    """
+
+
+class HostHealthStatus(BaseModel):
+    """
+    The HostHealthStatus class defines a model for the health of one host.
+    """
+    host: str
+    state: CircuitState
+    consecutive_failures: int
+    in_flight: int
+    successes: int
+    failures: int
+    rejected: int
+    last_error: Optional[str] = None
+    retry_in: Optional[float] = None
+
+
+@dataclass
+class HostHealth:
+    """
+    The HostHealth class holds the circuit breaker state of one host.
+    """
+    state: CircuitState = CircuitState.closed
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    probing: bool = False
+    in_flight: int = 0
+    successes: int = 0
+    failures: int = 0
+    rejected: int = 0
+    last_error: str = None
+
+
+class HostHealthTracker:
+    """
+    The HostHealthTracker class keeps a circuit breaker for every host. A
+    breaker opens after failure_threshold consecutive connection failures
+    and rejects calls for cooldown seconds, after which one probe call is
+    allowed. A successful probe closes the breaker and a failed one opens it
+    again. At most max_in_flight_per_host calls run against a host, and at
+    most max_in_flight calls run in total.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, max_in_flight_per_host: int = 4,
+                 max_in_flight: int = 256, wait_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_in_flight_per_host = max_in_flight_per_host
+        self.max_in_flight = max_in_flight
+        self.wait_timeout = wait_timeout
+        self._condition = threading.Condition()
+        self._hosts: Dict[str, HostHealth] = {}
+        self._in_flight = 0
+
+    @contextmanager
+    def guard(self, host: str) -> Iterator[None]:
+        """
+        The guard method wraps a call to the host. It raises a
+        CircuitOpenException at once if the host's breaker is open, waits for
+        the in-flight limits, and records whether the call could reach the
+        device.
+        """
+        self._admit(host)
+        try:
+            yield
+        except NON_CONNECTION_ERRORS:
+            self._finish(host, reached=True)
+            raise
+        except BaseException as e:
+            if is_connection_error(e):
+                self._finish(host, reached=False, error=e)
+            else:
+                # Errors that say nothing about the device's reachability leave the breaker alone.
+                self._finish(host, reached=None)
+            raise
+        else:
+            self._finish(host, reached=True)
+
+    def known_hosts(self) -> List[str]:
+        """
+        The known_hosts method returns every host that a call has been made to.
+        """
+        with self._condition:
+            return list(self._hosts.keys())
+
+    def is_open(self, host: str) -> bool:
+        """
+        The is_open method returns whether the host's breaker is rejecting calls.
+        """
+        with self._condition:
+            health = self._hosts.get(host.lower())
+            return (health is not None and health.state == CircuitState.open
+                    and time.monotonic() - health.opened_at < self.cooldown)
+
+    def status(self) -> List[HostHealthStatus]:
+        """
+        The status method returns the health of every host that a call has
+        been made to.
+        """
+        now = time.monotonic()
+        with self._condition:
+            return [
+                HostHealthStatus(
+                    host=host,
+                    state=health.state,
+                    consecutive_failures=health.consecutive_failures,
+                    in_flight=health.in_flight,
+                    successes=health.successes,
+                    failures=health.failures,
+                    rejected=health.rejected,
+                    last_error=health.last_error,
+                    retry_in=max(0.0, self.cooldown - (now - health.opened_at))
+                    if health.state == CircuitState.open else None,
+                )
+                for host, health in self._hosts.items()
+            ]
+
+    def check(self, host: str):
+        """
+        The check method raises a CircuitOpenException if the host's breaker
+        is rejecting calls. It is used for calls made on a worker process,
+        whose own breakers do not see the calls made on other workers.
+        """
+        with self._condition:
+            health = self._hosts.get(host.lower())
+            if health is not None and health.state == CircuitState.open:
+                retry_in = self.cooldown - (time.monotonic() - health.opened_at)
+                if retry_in > 0:
+                    health.rejected += 1
+                    raise CircuitOpenException(f"{host} is unreachable ({health.last_error}). "
+                                               f"Retrying in {retry_in:.0f}s.")
+
+    def record(self, host: str, output: Any):
+        """
+        The record method updates the host's breaker with the host's output
+        from a call made on a worker process. Errors that say nothing about
+        the device's reachability leave the breaker alone.
+        """
+        error = error_of(output)
+        if error is None:
+            reached = True
+        elif CONNECTING_KEY in output or is_connection_error_text(error):
+            reached = False
+        else:
+            reached = None
+        with self._condition:
+            self._update(host, self._hosts.setdefault(host.lower(), HostHealth()), reached, error)
+
+    def reset(self, host: str) -> bool:
+        """
+        The reset method closes the host's breaker. It returns False if the
+        host is unknown.
+        """
+        with self._condition:
+            health = self._hosts.get(host.lower())
+            if health is None:
+                return False
+            health.state = CircuitState.closed
+            health.consecutive_failures = 0
+            health.probing = False
+            return True
+
+    def _admit(self, host: str):
+        """
+        The _admit method rejects the call if the host's breaker is open and
+        otherwise waits until the call fits within the in-flight limits.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        with self._condition:
+            health = self._hosts.setdefault(host.lower(), HostHealth())
+            now = time.monotonic()
+            if health.state == CircuitState.open:
+                if now - health.opened_at < self.cooldown:
+                    health.rejected += 1
+                    retry_in = self.cooldown - (now - health.opened_at)
+                    raise CircuitOpenException(
+                        f"{host} is unreachable ({health.last_error}). Retrying in {retry_in:.0f}s."
+                    )
+                health.state = CircuitState.half_open
+            if health.state == CircuitState.half_open:
+                if health.probing:
+                    health.rejected += 1
+                    raise CircuitOpenException(f"{host} is unreachable and is being probed.")
+                health.probing = True
+            while health.in_flight >= self.max_in_flight_per_host or self._in_flight >= self.max_in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    health.probing = False
+                    raise HostBusyException(f"Too many calls are in flight to {host}.")
+                self._condition.wait(remaining)
+            health.in_flight += 1
+            self._in_flight += 1
+
+    def _finish(self, host: str, reached: bool | None, error: BaseException = None):
+        """
+        The _finish method releases the call's in-flight slot and updates the
+        host's breaker with whether the call reached the device.
+        """
+        with self._condition:
+            health = self._hosts[host.lower()]
+            health.in_flight -= 1
+            self._in_flight -= 1
+            health.probing = False
+            self._update(host, health, reached, None if error is None else f"{type(error).__name__}: {error}")
+            self._condition.notify_all()
+
+    def _update(self, host: str, health: HostHealth, reached: bool | None, error: str = None):
+        """
+        The _update method updates the host's breaker with whether a call
+        reached the device. The caller must hold the condition.
+        """
+        if reached is True:
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.state = CircuitState.closed
+        elif reached is False:
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_error = error
+            if (health.state == CircuitState.half_open
+                    or health.consecutive_failures >= self.failure_threshold):
+                if health.state != CircuitState.open:
+                    logger.warning(f"Opening the circuit breaker for {host}: {health.last_error}")
+                health.state = CircuitState.open
+                health.opened_at = time.monotonic()
@@ -0,0 +1,204 @@
+"""
+The Inventory module defines the store of known network devices. The
+inventory is loaded once from a YAML or CSV file and indexed by hostname,
+group and site, so that a capability can be pointed at a group, a site or a
+pattern such as leaf[01-48] and each device can be mapped to its DeviceType.
+"""
+
+from __future__ import annotations
+
+import csv
+import fnmatch
+import itertools
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field
+from yaml import safe_load
+
+from clients.schema import DeviceType
+from environment import InventoryServerInformation
+
+logger = logging.getLogger("uvicorn")
+
+RANGE_PATTERN = re.compile(r"\[([0-9,\-]+)]")
+
+# The most hostnames that a list of targets may expand to.
+MAX_EXPANDED_HOSTS = 4096
+
+
+class InventoryException(Exception):
+    """
+    An InventoryException is raised when targets would expand to more than
+    MAX_EXPANDED_HOSTS hostnames.
+    """
+
+
+class InventoryDevice(BaseModel):
+    """
+    The InventoryDevice class defines the data model for a device in the inventory.
+    """
+    hostname: str
+    device_type: DeviceType
+    site: Optional[str] = None
+    groups: List[str] = Field(default_factory=list)
+
+
+class Inventory:
+    """
+    The Inventory class indexes the devices by hostname, group and site.
+    Groups and sites map directly to the tuple of their hostnames, so they
+    are resolved with a single dictionary lookup however large the fleet is.
+    """
+
+    def __init__(self, devices: Iterable[InventoryDevice]):
+        self._devices: Dict[str, InventoryDevice] = {}
+        groups: Dict[str, List[str]] = {}
+        sites: Dict[str, List[str]] = {}
+        for device in devices:
+            for hostname in expand_ranges(device.hostname):
+                key = hostname.lower()
+                self._devices[key] = device.copy(update={"hostname": hostname})
+                for group in device.groups:
+                    groups.setdefault(group.lower(), []).append(hostname)
+                if device.site is not None:
+                    sites.setdefault(device.site.lower(), []).append(hostname)
+        self._groups: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in groups.items()}
+        self._sites: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in sites.items()}
+
+    @classmethod
+    def load(cls, inventory_file: Path) -> Inventory:
+        """
+        The load method reads the inventory from a YAML file with a list of
+        devices, or from a CSV file with hostname, device_type, site and
+        groups columns. Groups in a CSV file are separated by semicolons.
+        """
+        with open(inventory_file, "r", newline="") as f:
+            if inventory_file.suffix.lower() == ".csv":
+                rows = [
+                    {**row, "groups": [g.strip() for g in (row.get("groups") or "").split(";") if g.strip()],
+                     "site": row.get("site") or None}
+                    for row in csv.DictReader(f)
+                ]
+            else:
+                rows = (safe_load(f) or {}).get("devices") or []
+        return cls(InventoryDevice(**row) for row in rows)
+
+    @classmethod
+    def from_config(cls) -> Inventory:
+        """
+        The from_config method loads the inventory file named in the
+        inventory section of the configuration file. An empty inventory is
+        returned if the file does not exist.
+        """
+        inventory_file = Path(InventoryServerInformation.load().file)
+        if not os.path.exists(inventory_file):
+            logger.info(f"Inventory file {inventory_file} not found. Using an empty inventory.")
+            return cls([])
+        inventory = cls.load(inventory_file)
+        logger.info(f"Loaded {len(inventory)} devices from {inventory_file}")
+        return inventory
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __contains__(self, hostname: str) -> bool:
+        return hostname.lower() in self._devices
+
+    @property
+    def hostnames(self) -> List[str]:
+        """
+        The hostnames prop returns the hostname of every device in the inventory.
+        """
+        return [device.hostname for device in self._devices.values()]
+
+    def device_type(self, hostname: str) -> DeviceType | None:
+        """
+        The device_type method returns the DeviceType of the host, or None if
+        the host is not in the inventory.
+        """
+        device = self._devices.get(hostname.lower())
+        return None if device is None else device.device_type
+
+    def device_types(self) -> Set[DeviceType]:
+        """
+        The device_types method returns every DeviceType in the inventory.
+        """
+        return {device.device_type for device in self._devices.values()}
+
+    def expand(self, targets: Iterable[str]) -> List[str]:
+        """
+        The expand method turns a list of targets into a list of hostnames.
+        A target may be a hostname, a group, a site, "group:<name>" or
+        "site:<name>", a numeric range such as leaf[01-48], or a glob such as
+        leaf* matched against the inventory. Hostnames are returned once each,
+        in the order they were first named. An InventoryException is raised
+        if the targets name more than MAX_EXPANDED_HOSTS hostnames.
+        """
+        hostnames: List[str] = []
+        for target in targets:
+            if len(hostnames) > MAX_EXPANDED_HOSTS:
+                break
+            key = target.lower()
+            kind, _, name = key.partition(":")
+            if key in self._devices:
+                hostnames.append(self._devices[key].hostname)
+            elif kind == "group" and name:
+                hostnames.extend(self._groups.get(name, ()))
+            elif kind == "site" and name:
+                hostnames.extend(self._sites.get(name, ()))
+            elif key in self._groups:
+                hostnames.extend(self._groups[key])
+            elif key in self._sites:
+                hostnames.extend(self._sites[key])
+            elif RANGE_PATTERN.search(target):
+                hostnames.extend(expand_ranges(target))
+            elif any(c in target for c in "*?["):
+                hostnames.extend(d.hostname for k, d in self._devices.items() if fnmatch.fnmatchcase(k, key))
+            else:
+                hostnames.append(target)
+        if len(hostnames) > MAX_EXPANDED_HOSTS:
+            raise InventoryException(f"The targets name more than {MAX_EXPANDED_HOSTS} devices.")
+        return list(dict.fromkeys(hostnames))
+
+
+def expand_ranges(pattern: str, limit: int = MAX_EXPANDED_HOSTS) -> List[str]:
+    """
+    The expand_ranges function expands the numeric ranges in a hostname, so
+    that leaf[01-03] becomes leaf01, leaf02 and leaf03. A range may list
+    several numbers and spans separated by commas, and the width of a
+    zero-padded start is kept. The number of hostnames is counted before any
+    is built, and an InventoryException is raised if it is over the limit.
+    """
+    parts = RANGE_PATTERN.split(pattern)
+    if len(parts) == 1:
+        return [pattern]
+    ranges = []
+    total = 1
+    for part in parts[1::2]:
+        spans = []
+        for span in part.split(","):
+            start, _, end = span.partition("-")
+            if start:
+                spans.append((start, int(start), int(end or start)))
+        total *= sum(max(0, last - first + 1) for _, first, last in spans)
+        if total > limit:
+            raise InventoryException(f"{pattern} names more than {limit} devices.")
+        ranges.append(spans)
+    choices = []
+    for index, part in enumerate(parts):
+        if index % 2 == 0:
+            choices.append([part])
+            continue
+        numbers = []
+        for start, first, last in ranges[index // 2]:
+            width = len(start) if start.startswith("0") else 0
+            numbers += [str(n).zfill(width) for n in range(first, last + 1)]
+        choices.append(numbers)
+    return ["".join(combination) for combination in itertools.product(*choices)]
+
+
+INVENTORY = Inventory.from_config()
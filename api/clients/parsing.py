@@ -0,0 +1,142 @@
+"""
+The Parsing module turns raw CLI output into compact structured records
+using the TextFSM templates from ntc-templates. The template for a command
+is selected by platform and command from the templates index, and each
+template is compiled once and kept for the life of the process. Output with
+no matching template is left as raw text, and output whose start was dropped
+to stay within its budget keeps the note saying so.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from netmiko.utilities import get_template_dir
+from textfsm import TextFSM, clitable
+
+from clients.streaming import split_omitted
+
+logger = logging.getLogger("uvicorn")
+
+# Template lookups remembered for platform and command pairs.
+MAX_TEMPLATE_MATCHES = 1024
+
+
+@dataclass
+class ParsedOutput:
+    """
+    The ParsedOutput class holds the records parsed from a command's output
+    along with the measurements of the parse. Truncated holds the note of
+    the lines dropped from the start of the output, if any.
+    """
+    template: str
+    columns: list[str]
+    rows: list[list[Any]]
+    parse_ms: float
+    raw_bytes: int
+    parsed_bytes: int
+    truncated: Optional[str] = None
+
+    def records(self) -> Dict[str, Any]:
+        """
+        The records method returns the parsed output in its compact form, with
+        the column names given once rather than repeated in every record. The
+        rows of truncated output are marked as incomplete.
+        """
+        records = {"columns": self.columns, "rows": self.rows}
+        if self.truncated is not None:
+            records["truncated"] = self.truncated
+        return records
+
+
+class TemplateCache:
+    """
+    The TemplateCache class selects the TextFSM template for a platform and
+    command and keeps every compiled template in memory. A compiled TextFSM
+    holds parser state, so each template is used by one thread at a time.
+    """
+
+    def __init__(self, template_dir: str):
+        self.template_dir = template_dir
+        self.table = clitable.CliTable("index", template_dir)
+        self._templates: Dict[str, TextFSM] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._matches: OrderedDict[Tuple[str, str], str | None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> TemplateCache | None:
+        """
+        The from_environment method returns a TemplateCache over the template
+        directory used by netmiko, which honours the NET_TEXTFSM environment
+        variable. None is returned if no templates can be found.
+        """
+        try:
+            return cls(get_template_dir())
+        except Exception as e:
+            logger.warning(f"Structured output parsing is disabled: {e}")
+            return None
+
+    def parse(self, platform: str, command: str, output: str) -> ParsedOutput | None:
+        """
+        The parse method parses the output of the command on the platform. It
+        returns None if no template matches or the template fails to parse.
+        The note of lines omitted from the output is not parsed, but kept.
+        """
+        template = self.find_template(platform, command)
+        if template is None:
+            return None
+        truncated, text = split_omitted(output)
+        start = time.perf_counter()
+        try:
+            fsm, lock = self._compiled(template)
+            with lock:
+                fsm.Reset()
+                rows = fsm.ParseText(text)
+                columns = [name.lower() for name in fsm.header]
+        except Exception as e:
+            logger.warning(f"Template {template} failed to parse '{command}': {e}")
+            return None
+        parse_ms = (time.perf_counter() - start) * 1000
+        parsed = ParsedOutput(template=template, columns=columns, rows=rows, parse_ms=parse_ms,
+                              raw_bytes=len(output), parsed_bytes=0, truncated=truncated)
+        parsed.parsed_bytes = len(json.dumps(parsed.records()))
+        return parsed
+
+    def find_template(self, platform: str, command: str) -> str | None:
+        """
+        The find_template method returns the name of the template for the
+        command on the platform, or None if there is none. The most recent
+        lookups are remembered.
+        """
+        key = (platform, command)
+        with self._lock:
+            if key in self._matches:
+                self._matches.move_to_end(key)
+                return self._matches[key]
+            row = self.table.index.GetRowMatch({"Platform": platform, "Command": command})
+            # Commands with several templates are merged by CliTable; only the first is used here.
+            template = None if row == 0 else self.table.index.index[row]["Template"].split(":")[0]
+            self._matches[key] = template
+            if len(self._matches) > MAX_TEMPLATE_MATCHES:
+                self._matches.popitem(last=False)
+            return template
+
+    def _compiled(self, template: str) -> tuple[TextFSM, threading.Lock]:
+        """
+        The _compiled method returns the compiled template and its lock,
+        compiling the template on first use.
+        """
+        with self._lock:
+            if template not in self._templates:
+                with open(os.path.join(self.template_dir, template), "r") as f:
+                    self._templates[template] = TextFSM(f)
+                self._locks[template] = threading.Lock()
+            return self._templates[template], self._locks[template]
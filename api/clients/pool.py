@@ -0,0 +1,327 @@
+"""
+The Pool module defines a process-wide pool of device sessions. Opening a
+session to a network device requires a full SSH handshake, authentication
+and privilege escalation, so sessions are kept open after use and handed to
+the next request for the same host, credentials and device type.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Set
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("uvicorn")
+
+# Fingerprints are keyed by a secret of the process, so that they cannot be checked against guessed passwords.
+FINGERPRINT_KEY = os.urandom(32)
+
+
+class SessionPoolException(Exception):
+    """
+    A SessionPoolException is raised when a session cannot be checked out
+    of the pool before the checkout timeout expires.
+    """
+
+
+class SessionKey(NamedTuple):
+    """
+    The SessionKey identifies the sessions that may be shared with one another.
+    Sessions are only shared by callers with the same credentials, which are
+    identified by their fingerprint rather than kept in the key.
+    """
+    host: str
+    username: str
+    credentials: str
+    device_type: str
+
+
+def credential_fingerprint(*secrets: str | None) -> str:
+    """
+    The credential_fingerprint function returns a keyed hash of the secrets,
+    such as a password and enable secret.
+    """
+    message = "\0".join("" if secret is None else secret for secret in secrets)
+    return hmac.new(FINGERPRINT_KEY, message.encode(), hashlib.sha256).hexdigest()
+
+
+@dataclass
+class PooledSession:
+    """
+    The PooledSession class wraps an open device session with the times it
+    was opened and last returned to the pool.
+    """
+    session: Any
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    prewarmed: bool = False
+    connect_seconds: float = 0.0
+
+
+class PoolStatistics(BaseModel):
+    """
+    The PoolStatistics class defines a model for the counters kept by a
+    SessionPool. A prewarm hit is a checkout that was handed a session opened
+    in advance, and the seconds saved are the connection time those checkouts
+    did not have to wait for.
+    """
+    idle_sessions: int = 0
+    sessions_in_use: int = 0
+    prewarms_started: int = 0
+    prewarms_failed: int = 0
+    prewarm_hits: int = 0
+    prewarms_wasted: int = 0
+    prewarm_hit_rate: float = 0.0
+    seconds_saved: float = 0.0
+
+
+class SessionPool:
+    """
+    The SessionPool class holds idle device sessions keyed by SessionKey.
+    At most max_sessions_per_host sessions, idle or checked out, are open
+    to any one host. Idle sessions are closed once they have been unused
+    for idle_timeout seconds, and every idle session is health checked
+    before it is handed out again.
+
+    Sessions may also be opened in advance with prewarm, on a small pool of
+    background threads. A checkout that arrives while its session is still
+    being prewarmed waits for it instead of opening a second one.
+    """
+
+    def __init__(self, max_sessions_per_host: int = 2, idle_timeout: float = 300.0,
+                 checkout_timeout: float = 60.0, prewarm_workers: int = 8):
+        self.max_sessions_per_host = max_sessions_per_host
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self._condition = threading.Condition()
+        self._idle: Dict[SessionKey, List[PooledSession]] = {}
+        self._in_use: Dict[str, int] = {}
+        self._prewarming: Set[SessionKey] = set()
+        self._prewarm_executor = ThreadPoolExecutor(max_workers=prewarm_workers, thread_name_prefix="prewarm")
+        self._statistics = PoolStatistics()
+        self._reaper = None
+
+    @contextmanager
+    def checkout(self, key: SessionKey, connect: Callable[[], Any]) -> Iterator[Any]:
+        """
+        The checkout method yields a warm session for the key, opening a new
+        one with connect if none is idle. The session is returned to the pool
+        when the block exits normally and is closed if the block raises.
+        """
+        pooled = self._acquire(key)
+        try:
+            if pooled is None:
+                pooled = PooledSession(session=connect())
+        except BaseException:
+            self._release(key, None)
+            raise
+        try:
+            yield pooled.session
+        except BaseException:
+            self._release(key, None)
+            close_session(pooled.session)
+            raise
+        pooled.last_used = time.monotonic()
+        self._release(key, pooled)
+
+    def prewarm(self, key: SessionKey, connect: Callable[[], Any]) -> bool:
+        """
+        The prewarm method opens a session for the key in the background so
+        that a later checkout finds it waiting. Nothing is done if a session
+        for the key is already idle or being prewarmed, or if the host has no
+        free session slot. It returns whether a prewarm was started.
+        """
+        with self._condition:
+            if (key in self._prewarming or self._idle.get(key)
+                    or self._open_sessions(key.host) >= self.max_sessions_per_host):
+                return False
+            self._in_use[key.host] = self._in_use.get(key.host, 0) + 1
+            self._prewarming.add(key)
+            self._statistics.prewarms_started += 1
+            self._start_reaper()
+        self._prewarm_executor.submit(self._prewarm, key, connect)
+        return True
+
+    def statistics(self) -> PoolStatistics:
+        """
+        The statistics method returns a snapshot of the pool's counters.
+        """
+        with self._condition:
+            started = self._statistics.prewarms_started
+            return self._statistics.copy(update={
+                "idle_sessions": sum(len(v) for v in self._idle.values()),
+                "sessions_in_use": sum(self._in_use.values()),
+                "prewarm_hit_rate": self._statistics.prewarm_hits / started if started else 0.0,
+            })
+
+    def _prewarm(self, key: SessionKey, connect: Callable[[], Any]):
+        """
+        The _prewarm method opens the prewarmed session and leaves it idle in
+        the pool for the next checkout.
+        """
+        pooled = None
+        start = time.monotonic()
+        try:
+            pooled = PooledSession(session=connect(), prewarmed=True)
+            pooled.connect_seconds = time.monotonic() - start
+            logger.debug(f"Prewarmed a session to {key.host} in {pooled.connect_seconds:.2f}s")
+        except Exception as e:
+            logger.debug(f"Prewarming a session to {key.host} failed: {e}")
+        with self._condition:
+            self._prewarming.discard(key)
+            if pooled is None:
+                self._statistics.prewarms_failed += 1
+        self._release(key, pooled)
+
+    def close_all(self):
+        """
+        The close_all method closes every idle session in the pool.
+        """
+        with self._condition:
+            idle = [pooled for sessions in self._idle.values() for pooled in sessions]
+            self._idle.clear()
+        for pooled in idle:
+            close_session(pooled.session)
+
+    def _acquire(self, key: SessionKey) -> PooledSession | None:
+        """
+        The _acquire method reserves a session slot for the key's host. It
+        returns a healthy idle session if there is one, or None if the caller
+        should open a new session in the reserved slot.
+        """
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        while True:
+            stale = []
+            with self._condition:
+                self._start_reaper()
+                idle = self._idle.get(key, [])
+                if idle:
+                    pooled = idle.pop()
+                    self._in_use[key.host] = self._in_use.get(key.host, 0) + 1
+                    if pooled.prewarmed:
+                        pooled.prewarmed = False
+                        self._statistics.prewarm_hits += 1
+                        self._statistics.seconds_saved += max(
+                            0.0, pooled.connect_seconds - (time.monotonic() - started))
+                elif key in self._prewarming:
+                    # The session being prewarmed for this key will be ready sooner than a new one.
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise SessionPoolException(f"Timed out waiting for a session to {key.host}.")
+                    self._condition.wait(remaining)
+                    continue
+                elif self._open_sessions(key.host) < self.max_sessions_per_host:
+                    self._in_use[key.host] = self._in_use.get(key.host, 0) + 1
+                    return None
+                else:
+                    # Make room by closing a session held idle for another user or device type.
+                    other = next((k for k, v in self._idle.items() if k.host == key.host and v), None)
+                    if other is not None:
+                        stale.append(self._idle[other].pop(0))
+                        self._in_use[key.host] = self._in_use.get(key.host, 0) + 1
+                        pooled = None
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise SessionPoolException(f"Timed out waiting for a session to {key.host}.")
+                        self._condition.wait(remaining)
+                        continue
+            for pooled_stale in stale:
+                close_session(pooled_stale.session)
+            if pooled is None or is_session_alive(pooled.session):
+                return pooled
+            logger.info(f"Discarding dead session to {key.host}")
+            self._release(key, None)
+            close_session(pooled.session)
+
+    def _release(self, key: SessionKey, pooled: PooledSession | None):
+        """
+        The _release method frees the key's session slot, keeping the session
+        idle in the pool if one is given.
+        """
+        with self._condition:
+            self._in_use[key.host] -= 1
+            if self._in_use[key.host] == 0:
+                del self._in_use[key.host]
+            if pooled is not None:
+                self._idle.setdefault(key, []).append(pooled)
+            self._condition.notify_all()
+
+    def _open_sessions(self, host: str) -> int:
+        """
+        The _open_sessions method counts the idle and checked out sessions to
+        the host. The caller must hold the pool's condition.
+        """
+        idle = sum(len(v) for k, v in self._idle.items() if k.host == host)
+        return idle + self._in_use.get(host, 0)
+
+    def _start_reaper(self):
+        """
+        The _start_reaper method starts the background thread that closes
+        expired idle sessions. The caller must hold the pool's condition.
+        """
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, name="session-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        """
+        The _reap method periodically closes sessions that have been idle for
+        longer than idle_timeout.
+        """
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 2))
+            now = time.monotonic()
+            expired = []
+            with self._condition:
+                for key in list(self._idle.keys()):
+                    keep = [p for p in self._idle[key] if now - p.last_used < self.idle_timeout]
+                    expired += [p for p in self._idle[key] if now - p.last_used >= self.idle_timeout]
+                    if keep:
+                        self._idle[key] = keep
+                    else:
+                        del self._idle[key]
+                # A prewarmed session that expires without being checked out was wasted work.
+                self._statistics.prewarms_wasted += sum(1 for p in expired if p.prewarmed)
+                if expired:
+                    self._condition.notify_all()
+            for pooled in expired:
+                close_session(pooled.session)
+
+
+def is_session_alive(session: Any) -> bool:
+    """
+    The is_session_alive function checks that a netmiko connection or a NAPALM
+    driver is still usable.
+    """
+    try:
+        alive = session.is_alive()
+    except Exception:
+        return False
+    if isinstance(alive, dict):
+        return bool(alive.get("is_alive", False))
+    return bool(alive)
+
+
+def close_session(session: Any):
+    """
+    The close_session function closes a netmiko connection or a NAPALM driver,
+    ignoring any error from a session that is already broken.
+    """
+    try:
+        if hasattr(session, "disconnect"):
+            session.disconnect()
+        else:
+            session.close()
+    except Exception as e:
+        logger.debug(f"Error closing session: {e}")
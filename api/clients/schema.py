@@ -1,12 +1,59 @@
 from __future__ import annotations
 
+import logging
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from enum import Enum
-from typing import List
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List
 
+from netmiko import BaseConnection, ConnectHandler
 from pydantic import BaseModel
 
-from capabilities import Capability
+from capabilities import Capability, Property
+from clients.health import HostHealthTracker
+from clients.parsing import TemplateCache
+from clients.pool import SessionKey, SessionPool, credential_fingerprint
+from clients.streaming import read_bounded
+from core.cache import CacheCore
+from core.jobs import add_work, cancel_requested, complete_work
+from core.progress import error_of, report_host
+from core.topology import TopologyCore
+from environment import DeviceServerInformation
+
+logger = logging.getLogger("uvicorn")
+
+# Seconds between checks of whether a background job running a fan-out has been cancelled.
+CANCEL_POLL_SECONDS = 1.0
+
+DEVICE_SERVER_INFO = DeviceServerInformation.load()
+
+# Sessions are shared by every platform instance in the process.
+SESSION_POOL = SessionPool(
+    max_sessions_per_host=DEVICE_SERVER_INFO.max_sessions_per_host,
+    idle_timeout=DEVICE_SERVER_INFO.session_idle_timeout,
+    checkout_timeout=DEVICE_SERVER_INFO.host_deadline,
+)
+
+# Device health is shared by every platform instance in the process.
+HOST_HEALTH = HostHealthTracker(
+    failure_threshold=DEVICE_SERVER_INFO.failure_threshold,
+    cooldown=DEVICE_SERVER_INFO.breaker_cooldown,
+    max_in_flight_per_host=DEVICE_SERVER_INFO.max_in_flight_per_host,
+    max_in_flight=DEVICE_SERVER_INFO.max_in_flight,
+    wait_timeout=DEVICE_SERVER_INFO.host_deadline,
+)
+
+# Device output is shared by every platform instance in the process.
+DEVICE_OUTPUT_CACHE = CacheCore.from_config()
+
+# Compiled output templates are shared by every platform instance in the process.
+TEMPLATE_CACHE = TemplateCache.from_environment() if DEVICE_SERVER_INFO.structured_output else None
+
+# The LLDP topology learned from every platform instance in the process.
+TOPOLOGY = TopologyCore(ttl=DEVICE_SERVER_INFO.topology_ttl)
 
 
 class DeviceType(str, Enum):
@@ -26,29 +73,373 @@ class NetworkDevicePlatform(ABC):
     Capabilities are used to determine which interactions can be
     performed on a device and are defined by decorating a Capability
     with the register_capability decorator.
+
+    Device sessions are checked out of the shared SESSION_POOL with the
+    session and napalm_session methods. The netmiko_device_type property
+    names the netmiko driver used for the platform's CLI sessions, and the
+    parser_platform property names the platform used to select output
+    parsing templates.
+
+    A platform that is part of a mixed fleet is given a router, which returns
+    the platform that reaches a host, so that the LLDP walk reaches each
+    neighbor with the driver of its own DeviceType.
     """
 
+    netmiko_device_type: str = "cisco_ios"
+    parser_platform: str = "cisco_ios"
+    driver = None
+
     @property
     @abstractmethod
     def vendor(self) -> str: ...
 
     def __init__(self, settings: NetworkSettings):
         self.settings = settings
+        self.max_concurrency = DEVICE_SERVER_INFO.max_concurrency
+        self.host_deadline = DEVICE_SERVER_INFO.host_deadline
+        self.max_output_lines = DEVICE_SERVER_INFO.max_output_lines
+        self.max_output_bytes = DEVICE_SERVER_INFO.max_output_bytes
+        self.topology_max_nodes = DEVICE_SERVER_INFO.topology_max_nodes
+        self.router: Callable[[str], NetworkDevicePlatform] | None = None
+
+    def fan_out(self, hostnames: List[str], task: Callable[[str], Any]) -> Dict[str, Any]:
+        """
+        The fan_out method runs the task against every host concurrently, with
+        at most max_concurrency hosts in flight at once. Each host is given
+        host_deadline seconds from the moment its task starts. The results are
+        returned as a dictionary of host to task output, and any exception or
+        missed deadline is captured as an error entry for that host rather than
+        aborting the whole batch.
+
+        Each finished host is reported to the current host listener, and as
+        progress when run as a background job. The hosts not yet finished are
+        given up on as soon as the job is cancelled.
+        """
+        hostnames = list(dict.fromkeys(hostnames))
+        if len(hostnames) == 0:
+            return {}
+        started: Dict[str, float] = {}
+        add_work(len(hostnames))
+
+        def run(host: str) -> Any:
+            started[host] = time.monotonic()
+            return task(host)
+
+        device_outputs = {}
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_concurrency, len(hostnames))),
+            thread_name_prefix="fan-out",
+        )
+        try:
+            pending: Dict[Future, str] = {executor.submit(run, host): host for host in hostnames}
+            while pending:
+                if cancel_requested():
+                    for host in pending.values():
+                        device_outputs[host] = {"error": "Cancelled."}
+                    break
+                timeout = min(self._next_deadline(started, pending.values()), CANCEL_POLL_SECONDS)
+                done, _ = wait(pending.keys(), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    host = pending.pop(future)
+                    try:
+                        device_outputs[host] = future.result()
+                    except Exception as e:
+                        logger.error(f"{self.vendor} {host}: {e}")
+                        device_outputs[host] = {"error": f"{type(e).__name__}: {e}"}
+                    complete_work(message=f"{host} finished")
+                    report_host(host, error_of(device_outputs[host]))
+                now = time.monotonic()
+                for future, host in list(pending.items()):
+                    if host in started and now - started[host] >= self.host_deadline:
+                        # The worker thread cannot be interrupted, so its result is discarded.
+                        pending.pop(future)
+                        logger.error(f"{self.vendor} {host}: deadline of {self.host_deadline}s exceeded")
+                        device_outputs[host] = {"error": f"Deadline of {self.host_deadline}s exceeded."}
+                        complete_work(message=f"{host} timed out")
+                        report_host(host, device_outputs[host]["error"])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return {host: device_outputs[host] for host in hostnames}
+
+    def cached(self, host: str, command: str, compute: Callable[[], Any]) -> Any:
+        """
+        The cached method returns the output of the command on the host from
+        the shared DEVICE_OUTPUT_CACHE, calling compute to fetch it from the
+        device on a miss. Identical concurrent requests share one fetch.
+        Output is only reused by callers with the same credentials.
+        """
+        key = (self.vendor, host, self.settings.username, self.credentials, normalize_command(command))
+        return DEVICE_OUTPUT_CACHE.get_or_compute(key, compute)
+
+    def send_command(self, host: str, command: str) -> str:
+        """
+        The send_command method runs the command on the host over a pooled
+        session, reusing cached output for the same host and command. The
+        output is streamed from the device and only its last
+        max_output_lines lines, within max_output_bytes, are kept.
+        """
+        command = normalize_command(command)
+
+        def fetch() -> str:
+            with self.session(host) as device:
+                return read_bounded(device, command, max_lines=self.max_output_lines,
+                                    max_bytes=self.max_output_bytes, timeout=self.host_deadline)
+
+        return self.cached(host, command, fetch)
+
+    def structured(self, host: str, command: str, output: str) -> Any:
+        """
+        The structured method parses the command's output into compact
+        records when a template matches, and otherwise returns the raw text.
+        """
+        if TEMPLATE_CACHE is None or not output:
+            return output
+        parsed = TEMPLATE_CACHE.parse(self.parser_platform, normalize_command(command), output)
+        if parsed is None:
+            return output
+        logger.info(f"{self.vendor} {host}: parsed '{command}' with {parsed.template} in "
+                    f"{parsed.parse_ms:.1f}ms, {parsed.raw_bytes} to {parsed.parsed_bytes} bytes")
+        return parsed.records()
+
+    def lldp_neighbors(self, host: str) -> dict:
+        """
+        The lldp_neighbors method returns the NAPALM LLDP neighbors of the host
+        and records them in the shared TOPOLOGY.
+        """
+        def fetch() -> dict:
+            with self.napalm_session(host) as device:
+                return device.get_lldp_neighbors()
+
+        neighbors = self.cached(host, "napalm get_lldp_neighbors", fetch)
+        TOPOLOGY.update(host, neighbors, scope=self.topology_scope)
+        return neighbors
+
+    def discover_topology(self, hostnames: List[str], until: Callable[[], bool] = None):
+        """
+        The discover_topology method walks the LLDP topology outward from the
+        hosts, one ring of neighbors at a time, until the until callable is
+        satisfied or topology_max_nodes devices have been visited. Only the
+        devices whose neighbors are stale are asked again; the rest of the
+        walk is answered from the TOPOLOGY index, which only shows links learned
+        with the same credentials. Each ring is split by the platform that
+        reaches each host.
+        """
+        scope = self.topology_scope
+        visited = set()
+        frontier = list(hostnames)
+        while frontier and len(visited) < self.topology_max_nodes:
+            frontier = list(dict.fromkeys(h.lower() for h in frontier if h.lower() not in visited))
+            frontier = frontier[:self.topology_max_nodes - len(visited)]
+            visited.update(frontier)
+            for platform, hosts in self.route(TOPOLOGY.stale(frontier, scope)).items():
+                for host, result in platform.fan_out(hosts, platform.lldp_neighbors).items():
+                    if "error" in result:
+                        TOPOLOGY.touch(host, scope)
+            if until is not None and until():
+                return
+            frontier = [neighbor for host in frontier for neighbor in TOPOLOGY.neighbor_names(host, scope)]
+
+    def route(self, hostnames: List[str]) -> Dict[NetworkDevicePlatform, List[str]]:
+        """
+        The route method groups the hosts by the platform that reaches them,
+        which is this platform unless a router has been given.
+        """
+        groups: Dict[NetworkDevicePlatform, List[str]] = {}
+        for host in hostnames:
+            groups.setdefault(self if self.router is None else self.router(host), []).append(host)
+        return groups
+
+    @Capability.make(
+        description="Find the path of LLDP links between two network devices.",
+        properties={
+            "source": Property(
+                type="string",
+                description="The hostname of the device the path starts at.",
+            ),
+            "destination": Property(
+                type="string",
+                description="The hostname of the device the path ends at.",
+            ),
+        },
+        isolatable=False,
+    )
+    def find_path(self, source: str, destination: str) -> dict[str, Any]:
+        """
+        The find_path function returns the hops between the source and the
+        destination, discovering the topology between them if necessary.
+        """
+        scope = self.topology_scope
+        self.discover_topology([source, destination],
+                               until=lambda: TOPOLOGY.path(source, destination, scope) is not None)
+        path = TOPOLOGY.path(source, destination, scope)
+        if path is None:
+            return {"error": f"No LLDP path was found between {source} and {destination}."}
+        return {"path": path}
+
+    @Capability.make(
+        description="List the devices directly connected to a network device by LLDP.",
+        properties={
+            "hostname": Property(
+                type="string",
+                description="The hostname of the device to list the neighbors of.",
+            ),
+        },
+        isolatable=False,
+    )
+    def get_neighbors_of(self, hostname: str) -> dict[str, Any]:
+        """
+        The get_neighbors_of function returns the devices adjacent to the host.
+        """
+        self.fan_out(TOPOLOGY.stale([hostname], self.topology_scope), self.lldp_neighbors)
+        return {hostname: TOPOLOGY.neighbors(hostname, self.topology_scope)}
+
+    @Capability.make(
+        description="List the devices that would be cut off from the network if a device failed.",
+        properties={
+            "hostname": Property(
+                type="string",
+                description="The hostname of the device that fails.",
+            ),
+            "root": Property(
+                type="string",
+                description="The hostname of a core device. Devices that lose every path to it are cut off.",
+                required=False,
+            ),
+        },
+        isolatable=False,
+    )
+    def get_blast_radius(self, hostname: str, root: str = None) -> dict[str, Any]:
+        """
+        The get_blast_radius function returns the devices that depend on the
+        host, discovering the surrounding topology if necessary.
+        """
+        self.discover_topology([hostname] + ([root] if root else []))
+        affected = TOPOLOGY.blast_radius(hostname, self.topology_scope, root)
+        if affected is None:
+            return {"error": f"{hostname} is not in the known LLDP topology."}
+        return {"hostname": hostname, "affected": affected}
+
+    @property
+    def credentials(self) -> str:
+        """
+        The credentials prop returns the fingerprint of the password and enable
+        secret, so that a session is never handed to a caller who could not
+        have opened it.
+        """
+        return credential_fingerprint(self.settings.password, self.settings.enablePassword)
+
+    @property
+    def topology_scope(self) -> str:
+        """
+        The topology_scope prop returns the fingerprint of the username and
+        credentials, which limits the TOPOLOGY to the links learned by callers
+        who could log in to the same devices.
+        """
+        return credential_fingerprint(self.settings.username, self.settings.password, self.settings.enablePassword)
+
+    @contextmanager
+    def session(self, host: str) -> Iterator[BaseConnection]:
+        """
+        The session method checks out a warm, already enabled netmiko session
+        to the host from the shared pool, opening one if none is idle. Calls
+        to a host whose circuit breaker is open fail immediately.
+        """
+        key = SessionKey(host=host, username=self.settings.username, credentials=self.credentials,
+                         device_type=self.netmiko_device_type)
+        with HOST_HEALTH.guard(host), SESSION_POOL.checkout(key, lambda: self._connect(host)) as device:
+            yield device
+
+    @contextmanager
+    def napalm_session(self, host: str) -> Iterator[Any]:
+        """
+        The napalm_session method checks out an open NAPALM driver for the
+        host from the shared pool, opening one if none is idle. Calls to a
+        host whose circuit breaker is open fail immediately.
+        """
+        key = SessionKey(host=host, username=self.settings.username, credentials=self.credentials,
+                         device_type=f"napalm:{self.driver.__name__}")
+        with HOST_HEALTH.guard(host), SESSION_POOL.checkout(key, lambda: self._open_driver(host)) as device:
+            yield device
+
+    def prewarm(self, host: str) -> bool:
+        """
+        The prewarm method starts opening a netmiko session to the host in the
+        background, so that the next call to session finds it already open.
+        The connection counts toward the host's circuit breaker like any other.
+        It returns whether a session is being opened.
+        """
+        key = SessionKey(host=host, username=self.settings.username, credentials=self.credentials,
+                         device_type=self.netmiko_device_type)
+
+        def connect() -> BaseConnection:
+            with HOST_HEALTH.guard(host):
+                return self._connect(host)
+
+        return SESSION_POOL.prewarm(key, connect)
+
+    def _connect(self, host: str) -> BaseConnection:
+        """
+        The _connect method opens a netmiko session to the host and enters
+        privileged mode.
+        """
+        device = ConnectHandler(
+            device_type=self.netmiko_device_type,
+            host=host,
+            username=self.settings.username,
+            password=self.settings.password,
+        )
+        device.enable()
+        return device
+
+    def _open_driver(self, host: str) -> Any:
+        """
+        The _open_driver method opens a NAPALM driver connection to the host.
+        """
+        device = self.driver(
+            hostname=host,
+            username=self.settings.username,
+            password=self.settings.password,
+        )
+        device.open()
+        return device
+
+    def _next_deadline(self, started: Dict[str, float], hosts: Iterable[str]) -> float:
+        """
+        The _next_deadline method returns the number of seconds until the
+        earliest running host reaches its deadline. Hosts still queued behind
+        the concurrency limit have no deadline yet, so a short poll interval
+        is returned when nothing has started.
+        """
+        now = time.monotonic()
+        remaining = [self.host_deadline - (now - started[host]) for host in hosts if host in started]
+        if len(remaining) == 0:
+            return min(self.host_deadline, 1.0)
+        return max(0.0, min(remaining))
 
     @classmethod
+    @lru_cache(maxsize=None)
     def get_capabilities(cls) -> list[Capability]:
         """
         The get_capabilities function returns a list of all capabilities
         that are supported by the device. To do this we iterate over all
         the methods of the class and check if they are of type Capability.
+        The list is built once per class and must not be modified.
         """
         return [
-            getattr(cls, method)
-            for method in dir(cls)
-            if isinstance(getattr(cls, method), Capability)
+            attribute
+            for attribute in (getattr(cls, method) for method in dir(cls))
+            if isinstance(attribute, Capability)
         ]
 
 
+def normalize_command(command: str) -> str:
+    """
+    The normalize_command function collapses the whitespace in a CLI command so
+    that trivially different spellings of a command share a cache entry.
+    """
+    return " ".join(command.split())
+
+
 class NetworkSettings(BaseModel):
     username: str
     password: str
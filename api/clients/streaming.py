@@ -0,0 +1,110 @@
+"""
+The Streaming module reads command output from a device session
+incrementally. Only the last lines of the output, within a line and byte
+budget, are ever held in memory, so the memory used for each host stays
+constant however much output the device produces.
+"""
+
+from __future__ import annotations
+
+import re
+import time
+from collections import deque
+
+from netmiko import BaseConnection
+
+# The line that replaces the lines dropped from the start of the output.
+OMITTED_MARKER = "[{} earlier lines omitted]"
+OMITTED_PATTERN = re.compile(r"\A\[(\d+) earlier lines omitted\]\n?")
+
+
+class BoundedOutput:
+    """
+    The BoundedOutput class is a ring buffer of text lines. Data is fed in
+    as it arrives and the oldest complete lines are dropped whenever the
+    buffer holds more than max_lines lines or max_bytes characters.
+    """
+
+    def __init__(self, max_lines: int, max_bytes: int):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines: deque[str] = deque()
+        self.partial = ""
+        self.size = 0
+        self.dropped = 0
+
+    def feed(self, data: str):
+        """
+        The feed method appends newly received data to the buffer.
+        """
+        *complete, self.partial = (self.partial + data).split("\n")
+        for line in complete:
+            self._append(line.rstrip("\r"))
+        if len(self.partial) > self.max_bytes:
+            self.partial = self.partial[-self.max_bytes:]
+
+    def text(self) -> str:
+        """
+        The text method returns the buffered lines, noting how many earlier
+        lines were dropped to stay within the budget.
+        """
+        lines = list(self.lines)
+        if self.dropped > 0:
+            lines.insert(0, OMITTED_MARKER.format(self.dropped))
+        return "\n".join(lines)
+
+    def _append(self, line: str):
+        self.lines.append(line)
+        self.size += len(line) + 1
+        while len(self.lines) > self.max_lines or (self.size > self.max_bytes and len(self.lines) > 1):
+            self.size -= len(self.lines.popleft()) + 1
+            self.dropped += 1
+
+
+def read_bounded(device: BaseConnection, command: str, max_lines: int, max_bytes: int,
+                 timeout: float) -> str:
+    """
+    The read_bounded function sends the command over the netmiko session and
+    reads the reply until the device prompt returns, keeping only the last
+    max_lines lines within max_bytes characters. The echoed command and the
+    trailing prompt are removed. A TimeoutError is raised if the prompt does
+    not return within timeout seconds.
+    """
+    prompt = device.find_prompt()
+    device.clear_buffer()
+    device.write_channel(device.normalize_cmd(command))
+    output = BoundedOutput(max_lines=max_lines, max_bytes=max_bytes)
+    echo = ""
+    echo_pending = True
+    deadline = time.monotonic() + timeout
+    while True:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out after {timeout}s waiting for the output of '{command}'.")
+        data = device.read_channel()
+        if not data:
+            time.sleep(0.05)
+            continue
+        if echo_pending:
+            # Strip the echoed command before it takes up room in the buffer.
+            head, newline, data = data.partition("\n")
+            echo += head
+            if not newline:
+                continue
+            echo_pending = False
+            if command.strip() not in echo:
+                data = echo + newline + data
+        output.feed(data)
+        if output.partial.rstrip().endswith(prompt):
+            break
+    return output.text()
+
+
+def split_omitted(text: str) -> tuple[str | None, str]:
+    """
+    The split_omitted function separates the note of omitted lines, if any,
+    from the start of bounded output. It returns the note and the rest.
+    """
+    match = OMITTED_PATTERN.match(text)
+    if match is None:
+        return None, text
+    return match.group(0).rstrip("\n"), text[match.end():]
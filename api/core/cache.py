@@ -8,4 +8,212 @@ This is also done to track the state of the NetGPT Service separately from the
 state of the user's chat session. This allows the AI to perform actions "in
 the background" without the user having to wait for the action to complete
 before the AI can respond to the user's message.
-"""
\ No newline at end of file
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, is_dataclass
+from typing import Any, Callable, Dict, Hashable
+
+from pydantic import BaseModel
+
+from environment import CacheServerInformation
+
+
+@dataclass
+class CacheEntry:
+    """
+    The CacheEntry class holds a cached value with its approximate size and
+    the monotonic time at which it expires.
+    """
+    value: Any
+    size: int
+    expires: float
+
+
+class CacheStatistics(BaseModel):
+    """
+    The CacheStatistics class defines a model for the counters kept by a
+    CacheCore.
+    """
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CacheCore:
+    """
+    The CacheCore class is a thread-safe, in-memory cache. Every entry has a
+    time to live, and the least recently used entries are evicted whenever
+    the cache holds more than max_entries entries or max_bytes of data.
+    Concurrent get_or_compute calls for the same key are coalesced so that
+    only one of them performs the expensive operation.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._size = 0
+        self._statistics = CacheStatistics()
+
+    @classmethod
+    def from_config(cls) -> CacheCore:
+        """
+        The from_config method returns a CacheCore sized by the cache section
+        of the configuration file.
+        """
+        info = CacheServerInformation.load()
+        return cls(ttl=info.ttl, max_entries=info.max_entries, max_bytes=info.max_bytes)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        The get method returns the cached value for the key, or the default
+        if the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self._statistics.misses += 1
+                return default
+            self._statistics.hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """
+        The set method caches the value for the key for ttl seconds, or for
+        the cache's default ttl.
+        """
+        with self._lock:
+            self._store(key, value, self.ttl if ttl is None else ttl)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: float = None,
+                       cacheable: Callable[[Any], bool] = None) -> Any:
+        """
+        The get_or_compute method returns the cached value for the key. On a
+        miss, compute is called to produce the value, which is cached if
+        cacheable accepts it. Callers that miss while another caller is
+        already computing the same key wait for and share that result.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self._statistics.hits += 1
+                return entry.value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self._statistics.misses += 1
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self._statistics.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            if cacheable is None or cacheable(value):
+                self._store(key, value, self.ttl if ttl is None else ttl)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key: Hashable):
+        """
+        The invalidate method removes the key from the cache.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def clear(self):
+        """
+        The clear method removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def statistics(self) -> CacheStatistics:
+        """
+        The statistics method returns a snapshot of the cache's counters.
+        """
+        with self._lock:
+            return self._statistics.copy(update={"entries": len(self._entries), "size_bytes": self._size})
+
+    def _lookup(self, key: Hashable) -> CacheEntry | None:
+        """
+        The _lookup method returns the live entry for the key and marks it as
+        recently used. The caller must hold the cache's lock.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self._entries[key]
+            self._size -= entry.size
+            self._statistics.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, value: Any, ttl: float):
+        """
+        The _store method inserts the entry and evicts the least recently
+        used entries until the cache is within budget. The caller must hold
+        the cache's lock.
+        """
+        if ttl <= 0:
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= previous.size
+        self._entries[key] = CacheEntry(value=value, size=size, expires=time.monotonic() + ttl)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+            self._statistics.evictions += 1
+
+
+def estimate_size(value: Any) -> int:
+    """
+    The estimate_size function approximates the memory used by a value made of
+    strings, bytes, numbers, lists, dictionaries and dataclasses.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_size(v) for v in value)
+    if is_dataclass(value):
+        return estimate_size(vars(value))
+    return sys.getsizeof(value)
@@ -1,21 +1,38 @@
 """
 The Core Linguistic module defines an operational model for the NetGPT Service.
 The ChatCore class.
+
+Assembling a ChatCore resolves the language and platforms, instantiates every
+platform and plugin and indexes their capabilities. None of this depends on
+the message being answered, so the ChatRegistry keeps assembled ChatCores and
+hands the same one to every request with the same settings.
 """
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
+from typing import AsyncIterator, Tuple
+
+from pydantic import BaseModel
 
 from capabilities import CapabilityRunner
-from clients import get_network_device_platform
+from clients import get_network_device_platform, get_network_device_platforms
+from clients.dispatch import PlatformDispatcher
+from clients.inventory import INVENTORY
 from clients.schema import NetworkSettings
+from core.jobs import CURRENT_OWNER
+from environment import ChatRegistryServerInformation
 from flow import get_language
 from flow.exceptions import (
     LanguageException
 )
-from flow.schema import LanguageSettings, ChatConfiguration, UserMessage, BotMessage, MessageType
+from flow.schema import (LanguageSettings, ChatConfiguration, UserMessage, BotMessage, MessageType, SenderType,
+                         ChatEvent, ChatEventType)
 from plugins import get_plugins, get_all_plugins
 from plugins.schema import PluginList
 
@@ -44,12 +61,19 @@ class ChatCore:
             raise LanguageException(f"Language {languageSettings.name} not found.")
         if device_type is None:
             raise LanguageException(f"Device type {networkSettings.deviceType} not found.")
+        # The device capabilities are routed through the inventory, so that hosts
+        # of every platform in the fleet can be reached from the one chat.
+        self.dispatcher = PlatformDispatcher(
+            settings=networkSettings,
+            inventory=INVENTORY,
+            platforms=get_network_device_platforms(),
+        )
         self.device_functions = [
             CapabilityRunner(
                 capability=capability,
-                argument=device_type(settings=networkSettings)
+                argument=self.dispatcher
             )
-            for capability in device_type.get_capabilities()
+            for capability in self.dispatcher.get_capabilities()
         ]
         # The plugin_functions are all the plugins that are enabled.
         # This can either be because the plugin is enabled by default or
@@ -81,16 +105,147 @@ class ChatCore:
             runners=self.device_functions + self.plugin_functions
         )
 
-    def process_message(self, message: UserMessage) -> BotMessage:
+    async def process_message(self, message: UserMessage, owner: str = None) -> BotMessage:
         """
         The process_message method processes a message from the user and returns a
         BotMessage response. If the language raises an exception, the exception is
         caught and returned as a BotMessage indicating an error.
+
+        Sessions to the devices named in the latest message are opened while
+        the language is still deciding which capabilities to call. Background
+        jobs started for the message belong to the owner.
         """
+        self.prewarm(message)
+        token = CURRENT_OWNER.set(owner)
         try:
-            return self.language.request_response(message)
+            return await self.language.request_response(message)
         except LanguageException as e:
             return BotMessage.quick(
                 message_type=MessageType.error,
                 content=str(e),
             )
+        finally:
+            CURRENT_OWNER.reset(token)
+
+    async def stream_message(self, message: UserMessage, owner: str = None) -> AsyncIterator[ChatEvent]:
+        """
+        The stream_message method processes a message from the user and yields
+        the ChatEvents of the response as they are produced. If the language
+        raises an exception, the stream ends with a BotMessage indicating an
+        error. Background jobs started for the message belong to the owner.
+        """
+        self.prewarm(message)
+        # The stream is consumed by a single task, whose context ends with the response.
+        CURRENT_OWNER.set(owner)
+        try:
+            async for event in self.language.stream_response(message):
+                yield event
+        except LanguageException as e:
+            yield ChatEvent(event=ChatEventType.message, message=BotMessage.quick(
+                message_type=MessageType.error,
+                content=str(e),
+            ))
+
+    def prewarm(self, message: UserMessage):
+        """
+        The prewarm method starts connecting to the devices named in the
+        user's latest message.
+        """
+        latest = next((m for m in reversed(message.message_history) if m.sender == SenderType.You), None)
+        if latest is None:
+            return
+        hosts = self.dispatcher.prewarm(" ".join(section.content for section in latest.sections))
+        if hosts:
+            logger.info(f"Prewarming sessions to {', '.join(hosts)}")
+
+
+class ChatRegistryStatistics(BaseModel):
+    """
+    The ChatRegistryStatistics class defines a model for the counters kept by
+    a ChatRegistry.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    hit_rate: float = 0.0
+
+
+class ChatRegistry:
+    """
+    The ChatRegistry class keeps the ChatCores assembled for recent settings,
+    keyed by the language, the device type, the enabled plugins and a
+    fingerprint of every setting, credentials included. The least recently
+    used ChatCores are evicted beyond max_entries, and a ChatCore is built
+    again after ttl seconds so that changes such as a new inventory are seen.
+    """
+
+    def __init__(self, max_entries: int = 128, ttl: float = 900.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cores: OrderedDict[Tuple, Tuple[float, ChatCore]] = OrderedDict()
+        self._statistics = ChatRegistryStatistics()
+
+    @classmethod
+    def from_config(cls) -> ChatRegistry:
+        """
+        The from_config method creates a ChatRegistry from the chat_registry
+        section of the configuration file.
+        """
+        info = ChatRegistryServerInformation.load()
+        return cls(max_entries=info.max_entries, ttl=info.ttl)
+
+    def get(self, languageSettings: LanguageSettings, networkSettings: NetworkSettings,
+            pluginList: PluginList = None) -> ChatCore:
+        """
+        The get method returns the ChatCore for the settings, assembling it if
+        there is none to reuse.
+        """
+        key = self.key(languageSettings, networkSettings, pluginList)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cores.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._cores.move_to_end(key)
+                self._statistics.hits += 1
+                return entry[1]
+            self._statistics.misses += 1
+        chat_core = ChatCore(languageSettings=languageSettings, networkSettings=networkSettings,
+                             pluginList=pluginList)
+        with self._lock:
+            self._cores[key] = (now, chat_core)
+            self._cores.move_to_end(key)
+            while len(self._cores) > self.max_entries:
+                self._cores.popitem(last=False)
+                self._statistics.evictions += 1
+        return chat_core
+
+    @staticmethod
+    def key(languageSettings: LanguageSettings, networkSettings: NetworkSettings,
+            pluginList: PluginList = None) -> Tuple:
+        """
+        The key method returns the registry key for the settings. The settings
+        are hashed rather than kept, so that no credentials are held in the key.
+        """
+        plugins = () if pluginList is None else tuple(sorted(p.name for p in pluginList.plugins if p.enabled))
+        fingerprint = hashlib.sha256("\n".join((
+            languageSettings.json(),
+            networkSettings.json(),
+            "" if pluginList is None else pluginList.json(),
+        )).encode()).hexdigest()
+        return languageSettings.name, networkSettings.deviceType, plugins, fingerprint
+
+    def statistics(self) -> ChatRegistryStatistics:
+        """
+        The statistics method returns a snapshot of the registry's counters.
+        """
+        with self._lock:
+            lookups = self._statistics.hits + self._statistics.misses
+            return self._statistics.copy(update={
+                "entries": len(self._cores),
+                "hit_rate": self._statistics.hits / lookups if lookups else 0.0,
+            })
+
+
+CHAT_REGISTRY = ChatRegistry.from_config()
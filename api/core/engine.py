@@ -0,0 +1,254 @@
+"""
+The engine module provides the ExecutionEngine, which runs blocking work such
+as netmiko and NAPALM sessions outside the event loop. The chat routes are
+asynchronous, so any capability that blocks is handed to a bounded pool of
+worker threads and awaited, leaving the event loop free to serve other users.
+
+In the process mode, the capabilities of device platforms and plugins are
+further isolated on a pool of worker processes, so that SSH crypto and output
+parsing spread across cores and a pathological device cannot wedge the API
+worker. Each call has a wall-clock limit, each worker has a memory cap, and
+the pool is replaced after a number of calls so that leaked sessions, threads
+and memory do not build up. The worker threads still run the calls, waiting
+on the worker processes instead of doing the work themselves.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from environment import ExecutionServerInformation
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logger = logging.getLogger("uvicorn")
+
+THREAD_MODE = "thread"
+PROCESS_MODE = "process"
+
+# How long past the call timeout a worker process is given to give up by itself before it is killed.
+PROCESS_GRACE_SECONDS = 10.0
+
+# The modules imported by the fork server, so that new worker processes start with them already loaded.
+PROCESS_PRELOAD = ["clients", "plugins"]
+
+
+@dataclass
+class IsolatedCall:
+    """
+    The IsolatedCall class describes a capability call to be run on a worker
+    process. Only the owner's class and settings are sent, and the owner is
+    rebuilt from them in the worker, since the instance itself may hold
+    sessions, locks and executors that cannot be pickled.
+    """
+    owner: type
+    name: str
+    settings: Any
+    args: Tuple[Any, ...] = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+class ExecutionEngine:
+    """
+    The ExecutionEngine class wraps a bounded thread pool that blocking
+    callables are dispatched to from coroutines, and, in the process mode, a
+    pool of worker processes that capabilities are isolated on.
+    """
+
+    def __init__(self, max_workers: int, mode: str = THREAD_MODE, process_workers: int = 4,
+                 call_timeout: float = 300.0, max_memory_mb: int = 2048, max_tasks_per_worker: int = 100):
+        if mode not in (THREAD_MODE, PROCESS_MODE):
+            raise ValueError(f"Unknown execution mode {mode}, expected {THREAD_MODE} or {PROCESS_MODE}.")
+        self.max_workers = max_workers
+        self.mode = mode
+        self.process_workers = max(1, process_workers)
+        self.call_timeout = call_timeout
+        self.max_memory_mb = max_memory_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="engine")
+        self._process_lock = threading.Lock()
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._process_calls = 0
+
+    @classmethod
+    def from_config(cls) -> ExecutionEngine:
+        """
+        The from_config method returns an ExecutionEngine sized by the
+        execution section of the configuration file.
+        """
+        info = ExecutionServerInformation.load()
+        return cls(
+            max_workers=info.max_workers,
+            mode=info.mode,
+            process_workers=info.process_workers,
+            call_timeout=info.call_timeout,
+            max_memory_mb=info.max_memory_mb,
+            max_tasks_per_worker=info.max_tasks_per_worker,
+        )
+
+    @property
+    def isolated(self) -> bool:
+        """
+        The isolated prop returns whether capabilities are run on worker
+        processes.
+        """
+        return self.mode == PROCESS_MODE
+
+    async def run_blocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        The run_blocking method runs the callable on the engine's worker
+        threads and returns its result. The caller's context variables are
+        carried over to the worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    def start(self):
+        """
+        The start method starts the worker processes ahead of the first call,
+        so that no request waits for them to be forked. It does nothing in the
+        thread mode.
+        """
+        if not self.isolated:
+            return
+        with self._process_lock:
+            pool = self._pool()
+        for future in [pool.submit(_ready) for _ in range(self.process_workers)]:
+            future.result()
+        logger.info(f"Started {self.process_workers} execution worker processes")
+
+    def run_isolated(self, call: IsolatedCall) -> Any:
+        """
+        The run_isolated method runs the capability call on a worker process
+        and returns its result, blocking the calling thread until it does. A
+        call that outlives the call timeout raises a TimeoutError, and if its
+        worker does not give up by itself the pool is killed and replaced.
+        """
+        with self._process_lock:
+            pool = self._pool()
+            future: Future = pool.submit(_run_isolated, call, self.call_timeout)
+        try:
+            return future.result(timeout=self.call_timeout + PROCESS_GRACE_SECONDS if self.call_timeout > 0 else None)
+        except FutureTimeoutError:
+            if future.done():
+                # The worker gave up by itself, and is free for the next call.
+                raise
+            logger.error(f"{call.owner.__name__}.{call.name} did not return within {self.call_timeout}s, "
+                         f"killing the execution worker processes")
+            self._kill(pool)
+            raise TimeoutError(f"{call.name} did not return within {self.call_timeout}s.")
+        except BrokenProcessPool:
+            # A worker died, such as from exceeding its memory cap, and took the pool with it.
+            logger.error(f"An execution worker process died running {call.owner.__name__}.{call.name}")
+            self._kill(pool)
+            raise
+
+    def shutdown(self):
+        """
+        The shutdown method stops the worker threads and processes once their
+        current work is complete.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self._process_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """
+        The _pool method returns the pool of worker processes, creating it if
+        there is none, and replacing it once its workers have run their share
+        of calls. The replaced pool finishes its current calls and exits. The
+        caller must hold the process lock.
+        """
+        limit = self.max_tasks_per_worker * self.process_workers
+        if self._process_pool is not None and 0 < limit <= self._process_calls:
+            logger.info(f"Recycling the execution worker processes after {self._process_calls} calls")
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
+        if self._process_pool is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                # Forking the service itself would copy its threads and locks, so workers come from a fork server.
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(PROCESS_PRELOAD)
+            else:
+                context = multiprocessing.get_context("spawn")
+            self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers, mp_context=context,
+                                                     initializer=_initialize_worker,
+                                                     initargs=(self.max_memory_mb,))
+            self._process_calls = 0
+        self._process_calls += 1
+        return self._process_pool
+
+    def _kill(self, pool: ProcessPoolExecutor):
+        """
+        The _kill method kills the worker processes of the pool and forgets
+        it, so that the next call starts a new one. Other calls running on the
+        pool fail.
+        """
+        with self._process_lock:
+            if self._process_pool is pool:
+                self._process_pool = None
+        # The executor does not expose its processes, and has no way to stop one that is stuck.
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _initialize_worker(max_memory_mb: int):
+    """
+    The _initialize_worker function caps the address space of a new worker
+    process, and leaves interrupts to the service, which shuts the pool down.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None and max_memory_mb > 0:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _ready() -> bool:
+    """
+    The _ready function is run once on each new worker process to start it.
+    """
+    return True
+
+
+def _expire(signum, frame):
+    raise TimeoutError("The call timeout was exceeded.")
+
+
+def _run_isolated(call: IsolatedCall, timeout: float) -> Any:
+    """
+    The _run_isolated function runs a capability call on a worker process.
+    Work runs on the worker's main thread, so an alarm interrupts it once the
+    timeout has passed, even inside a blocking read from a device.
+    """
+    owner = call.owner(settings=call.settings)
+    capability = getattr(call.owner, call.name)
+    if timeout > 0:
+        signal.signal(signal.SIGALRM, _expire)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return capability.callable(owner, *call.args, **call.kwargs)
+    finally:
+        if timeout > 0:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+EXECUTION_ENGINE = ExecutionEngine.from_config()
@@ -0,0 +1,313 @@
+"""
+The jobs module runs long capabilities, such as ping sweeps and commands sent
+to a whole fleet, in the background. A job is submitted to the JobCore and
+its id is returned at once, so that neither the chat request nor the language
+waits for the work to finish. Jobs run on the event loop, at most max_running
+at a time, and report their progress through context variables that the
+ExecutionEngine carries over to its worker threads. Finished jobs and their
+results are kept for the retention period so that they can be fetched later,
+either through the /jobs routes or by the language through the Jobs plugin.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from core.progress import HOST_LISTENER
+from environment import JobServerInformation
+
+logger = logging.getLogger("uvicorn")
+
+# The user on whose behalf the current message is being answered.
+CURRENT_OWNER: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("job_owner", default=None)
+
+# The job whose work is currently running, if any.
+CURRENT_JOB: contextvars.ContextVar[Optional[Job]] = contextvars.ContextVar("current_job", default=None)
+
+
+class JobException(Exception):
+    """
+    A JobException is raised when a job cannot be submitted.
+    """
+
+
+class JobNotFoundException(Exception):
+    """
+    A JobNotFoundException is raised when a job does not exist, is no longer
+    retained, or belongs to another user.
+    """
+
+
+class JobState(str, Enum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+FINISHED_STATES = (JobState.succeeded, JobState.failed, JobState.cancelled)
+
+
+class JobStatus(BaseModel):
+    """
+    The JobStatus class defines a model for the state and progress of a job.
+    Progress is the fraction of the job's units of work completed, and is
+    None until the job has said how much work it has.
+    """
+    id: str
+    name: str
+    arguments: Dict[str, Any]
+    state: JobState
+    progress: Optional[float] = None
+    completed: int = 0
+    total: int = 0
+    message: Optional[str] = None
+    error: Optional[str] = None
+    submitted: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+
+class JobResult(JobStatus):
+    """
+    The JobResult class defines a model for a job along with its result.
+    """
+    result: Any = None
+
+
+@dataclass
+class Job:
+    """
+    The Job class holds a job kept by the JobCore.
+    """
+    id: str
+    owner: Optional[str]
+    name: str
+    arguments: Dict[str, Any]
+    state: JobState = JobState.pending
+    completed: int = 0
+    total: int = 0
+    message: str = None
+    error: str = None
+    result: Any = None
+    submitted: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    task: Optional[asyncio.Task] = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def status(self) -> JobStatus:
+        """
+        The status method returns a snapshot of the job's state.
+        """
+        with self.lock:
+            return JobStatus(
+                id=self.id,
+                name=self.name,
+                arguments=self.arguments,
+                state=self.state,
+                progress=min(1.0, self.completed / self.total) if self.total else None,
+                completed=self.completed,
+                total=self.total,
+                message=self.message,
+                error=self.error,
+                submitted=self.submitted,
+                started=self.started,
+                finished=self.finished,
+            )
+
+
+class JobCore:
+    """
+    The JobCore class defines the operational model for background jobs.
+    At most max_running jobs run at once, and the others wait their turn.
+    Finished jobs are forgotten after retention seconds, or sooner if more
+    than max_jobs are kept, and no more than max_jobs may be unfinished.
+    """
+
+    def __init__(self, max_running: int = 8, retention: float = 3600.0, max_jobs: int = 256):
+        self.max_running = max_running
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_config(cls) -> JobCore:
+        """
+        The from_config method creates a JobCore from the jobs section of the
+        configuration file.
+        """
+        info = JobServerInformation.load()
+        return cls(max_running=info.max_running, retention=info.retention, max_jobs=info.max_jobs)
+
+    def submit(self, owner: Optional[str], name: str, arguments: Dict[str, Any],
+               work: Callable[[], Awaitable[Any]]) -> JobStatus:
+        """
+        The submit method starts the work as a job of the owner and returns
+        the job's status at once. It must be called from the event loop. Jobs
+        are only started for a known owner, so that no two users share them.
+        """
+        if owner is None:
+            raise JobException("Background jobs can only be run for a signed-in user.")
+        with self._lock:
+            self._prune()
+            if sum(job.state not in FINISHED_STATES for job in self._jobs.values()) >= self.max_jobs:
+                raise JobException(f"There are already {self.max_jobs} unfinished jobs.")
+            job = Job(id=uuid.uuid4().hex, owner=owner, name=name, arguments=arguments)
+            self._jobs[job.id] = job
+        # The job must not inherit the submitter's job or host listener, which belong to its request.
+        context = contextvars.copy_context()
+        context.run(CURRENT_JOB.set, job)
+        context.run(HOST_LISTENER.set, None)
+        job.task = context.run(asyncio.get_running_loop().create_task, self._run(job, work))
+        logger.info(f"Submitted job {job.id}: {name}({arguments})")
+        return job.status()
+
+    def status(self, job_id: str, owner: Optional[str]) -> JobStatus:
+        """
+        The status method returns the status of the owner's job.
+        """
+        return self._get(job_id, owner).status()
+
+    def result(self, job_id: str, owner: Optional[str]) -> JobResult:
+        """
+        The result method returns the owner's job along with its result, which
+        is None until the job has succeeded.
+        """
+        job = self._get(job_id, owner)
+        return JobResult(**job.status().dict(), result=job.result)
+
+    def list(self, owner: Optional[str]) -> List[JobStatus]:
+        """
+        The list method returns the status of every job of the owner, the most
+        recently submitted first. An unknown owner has no jobs.
+        """
+        if owner is None:
+            return []
+        with self._lock:
+            self._prune()
+            jobs = [job for job in self._jobs.values() if job.owner == owner]
+        return [job.status() for job in sorted(jobs, key=lambda job: job.submitted, reverse=True)]
+
+    def cancel(self, job_id: str, owner: Optional[str]) -> JobStatus:
+        """
+        The cancel method cancels the owner's job if it has not finished.
+        Work running on a worker thread cannot be interrupted, so it is told
+        to stop through cancel_requested and its result is discarded.
+        """
+        job = self._get(job_id, owner)
+        with job.lock:
+            finished = job.state in FINISHED_STATES
+            if not finished:
+                job.cancelled.set()
+        if not finished:
+            job.task.cancel()
+            logger.info(f"Cancelled job {job.id}")
+        return job.status()
+
+    async def _run(self, job: Job, work: Callable[[], Awaitable[Any]]):
+        """
+        The _run method runs the work of the job once a slot is free and
+        records how it ended.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.max_running))
+        try:
+            async with self._semaphore:
+                with job.lock:
+                    job.state = JobState.running
+                    job.started = time.time()
+                result = await work()
+            with job.lock:
+                job.state = JobState.succeeded
+                job.result = result
+        except asyncio.CancelledError:
+            with job.lock:
+                job.state = JobState.cancelled
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            with job.lock:
+                job.state = JobState.failed
+                job.error = f"{type(e).__name__}: {e}"
+        finally:
+            with job.lock:
+                job.finished = time.time()
+            logger.info(f"Job {job.id} {job.state.value} in {job.finished - job.submitted:.2f}s")
+
+    def _get(self, job_id: str, owner: Optional[str]) -> Job:
+        """
+        The _get method returns the owner's job. Jobs of other users are
+        reported as missing so that their ids cannot be probed, as are all
+        jobs when the owner is unknown.
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+        if job is None or owner is None or job.owner != owner:
+            raise JobNotFoundException(f"Job {job_id} was not found.")
+        return job
+
+    def _prune(self):
+        """
+        The _prune method forgets finished jobs past their retention, and the
+        oldest finished jobs beyond max_jobs. The caller must hold the lock.
+        """
+        now = time.time()
+        finished = sorted((job for job in self._jobs.values() if job.finished is not None),
+                          key=lambda job: job.finished)
+        excess = len(self._jobs) - self.max_jobs
+        for job in finished:
+            if now - job.finished < self.retention and excess <= 0:
+                break
+            del self._jobs[job.id]
+            excess -= 1
+
+
+def add_work(total: int):
+    """
+    The add_work function adds units of work to the total of the current job.
+    It does nothing outside a job.
+    """
+    job = CURRENT_JOB.get()
+    if job is not None:
+        with job.lock:
+            job.total += total
+
+
+def complete_work(count: int = 1, message: str = None):
+    """
+    The complete_work function records that units of work of the current job
+    have been completed. It does nothing outside a job.
+    """
+    job = CURRENT_JOB.get()
+    if job is not None:
+        with job.lock:
+            job.completed += count
+            if message is not None:
+                job.message = message
+
+
+def cancel_requested() -> bool:
+    """
+    The cancel_requested function returns whether the current job has been
+    cancelled, so that work on a worker thread can stop early.
+    """
+    job = CURRENT_JOB.get()
+    return job is not None and job.cancelled.is_set()
+
+
+JOBS = JobCore.from_config()
@@ -0,0 +1,40 @@
+"""
+The progress module lets the code running a capability tell whoever is
+waiting on it that one of its devices has finished, before the capability as
+a whole returns. The listener is held in a context variable, which the
+ExecutionEngine carries over to its worker threads, so a listener set by the
+language for one tool call hears only the devices of that call.
+"""
+
+from __future__ import annotations
+
+import contextvars
+from typing import Any, Callable, Optional
+
+# Called with the host and, if the host failed, its error.
+HostListener = Callable[[str, Optional[str]], None]
+
+HOST_LISTENER: contextvars.ContextVar[Optional[HostListener]] = contextvars.ContextVar("host_listener", default=None)
+
+
+def report_host(host: str, error: str = None):
+    """
+    The report_host function tells the current listener, if any, that the
+    host has finished. It may be called from any thread.
+    """
+    listener = HOST_LISTENER.get()
+    if listener is not None:
+        listener(host, error)
+
+
+def error_of(output: Any) -> str | None:
+    """
+    The error_of function returns the error of a host's output, if it is one.
+    Errors are outputs with a single key starting with "error", such as the
+    "error connecting" of a device that could not be reached.
+    """
+    if isinstance(output, dict) and len(output) == 1:
+        key, value = next(iter(output.items()))
+        if key.startswith("error"):
+            return str(value)
+    return None
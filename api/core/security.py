@@ -5,14 +5,21 @@ ability to authenticate users.
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
 
 import httpx
 from fastapi import Depends
 from fastapi.security import OpenIdConnect
-from jose import jwt
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+from pydantic import BaseModel
 
-from environment import AuthenticationServerInformation
+from environment import AuthenticationServerInformation, TokenCacheServerInformation
 
 logger = logging.getLogger("uvicorn")
 
@@ -21,6 +28,27 @@ AUTH_SERVER_INFO = AuthenticationServerInformation.load()
 OIDC_URL = f'{AUTH_SERVER_INFO.server}/auth/realms/{AUTH_SERVER_INFO.realm}/.well-known/openid-configuration'
 OIDC = OpenIdConnect(openIdConnectUrl=OIDC_URL, scheme_name="Bearer")
 
+# The algorithms that tokens may be signed with.
+ALGORITHMS = ["RS256"]
+
+
+class SecurityStatistics(BaseModel):
+    """
+    The SecurityStatistics class defines a model for how tokens have been
+    verified. A hit is a token whose claims were found in the cache, so that
+    its signature did not need to be checked again.
+    """
+    verifications: int = 0
+    hits: int = 0
+    misses: int = 0
+    failures: int = 0
+    hit_rate: float = 0.0
+    entries: int = 0
+    keys: int = 0
+    key_refreshes: int = 0
+    verify_seconds: float = 0.0
+    average_verify_ms: float = 0.0
+
 
 class SecurityCore:
     """
@@ -40,10 +68,20 @@ class SecurityCore:
         response = httpx.get(f"{domain_url}/.well-known/openid-configuration", verify=False)
         response.raise_for_status()
         oidc_config = response.json()
-        self.jwks = httpx.get(oidc_config["jwks_uri"], verify=False).json()
+        self.jwks_uri = oidc_config["jwks_uri"]
         self.client_id = auth_server.clientId
         self.oidc = OpenIdConnect(openIdConnectUrl=f"{domain_url}/.well-known/openid-configuration",
                                   scheme_name="Bearer")
+        cache_info = TokenCacheServerInformation.load()
+        self.max_entries = cache_info.max_entries
+        self.ttl = cache_info.ttl
+        self.key_refresh_interval = cache_info.key_refresh_interval
+        self._lock = threading.Lock()
+        self._claims: OrderedDict[str, Tuple[dict, float]] = OrderedDict()
+        self._statistics = SecurityStatistics()
+        self._refreshed = 0.0
+        self.keys: Dict[str, Key] = {}
+        self.refresh_keys()
 
     @classmethod
     def from_config(cls):
@@ -53,6 +91,27 @@ class SecurityCore:
         """
         return cls(auth_server=AuthenticationServerInformation.load())
 
+    def refresh_keys(self):
+        """
+        The refresh_keys method fetches the authentication server's key set and
+        parses each signing key once, indexed by its key id, so that tokens
+        are not verified against the raw key set.
+        """
+        jwks = httpx.get(self.jwks_uri, verify=False).json()
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("use", "sig") != "sig" or key.get("alg", ALGORITHMS[0]) not in ALGORITHMS:
+                continue
+            try:
+                keys[key.get("kid")] = jwk.construct(key, key.get("alg", ALGORITHMS[0]))
+            except Exception as e:
+                logger.error(f"Could not parse signing key {key.get('kid')}: {e}")
+        with self._lock:
+            self.keys = keys
+            self._refreshed = time.monotonic()
+            self._statistics.key_refreshes += 1
+        logger.info(f"Loaded {len(keys)} signing keys from {self.jwks_uri}")
+
     def get_token_verifier(self):
         """
         The get_token_verifier method returns the token verifier dependency.
@@ -62,21 +121,84 @@ class SecurityCore:
             """
             The verify_token method verifies the user's token.
             """
-            # If the token is a bearer token, remove the bearer prefix.
-            token = token.replace("Bearer ", "")
-            try:
-                logger.info(f"Encoded Token: {token}")
-                options = {}
-                payload = jwt.decode(
-                    token,
-                    self.jwks,
-                    algorithms=["RS256"],
-                    audience=self.client_id,
-                    options=options,
-                )
-                logger.info(f"Decoded Token: {payload}")
-                return payload
-            except Exception as e:
-                logger.error(e)
+            return self.verify(token)
 
         return verify_token
+
+    def verify(self, token: str) -> dict | None:
+        """
+        The verify method returns the payload of the user's token, or None if
+        the token is not valid. The claims of a valid token are cached until
+        it expires, or for ttl seconds if that is sooner, so that a user's
+        later requests are not verified again.
+        """
+        # If the token is a bearer token, remove the bearer prefix.
+        token = token.replace("Bearer ", "")
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._statistics.verifications += 1
+            cached = self._claims.get(digest)
+            if cached is not None and cached[1] > now:
+                self._claims.move_to_end(digest)
+                self._statistics.hits += 1
+                return cached[0]
+            self._claims.pop(digest, None)
+            self._statistics.misses += 1
+        started = time.perf_counter()
+        try:
+            payload = jwt.decode(
+                token,
+                self._key_for(token),
+                algorithms=ALGORITHMS,
+                audience=self.client_id,
+                options={},
+            )
+        except Exception as e:
+            logger.error(f"Token verification failed: {e}")
+            with self._lock:
+                self._statistics.failures += 1
+            return None
+        finally:
+            with self._lock:
+                self._statistics.verify_seconds += time.perf_counter() - started
+        expires = min(float(payload.get("exp", now)), now + self.ttl)
+        if expires > now and self.max_entries > 0:
+            with self._lock:
+                self._claims[digest] = (payload, expires)
+                while len(self._claims) > self.max_entries:
+                    self._claims.popitem(last=False)
+        return payload
+
+    def statistics(self) -> SecurityStatistics:
+        """
+        The statistics method returns a snapshot of how tokens have been
+        verified.
+        """
+        with self._lock:
+            statistics = self._statistics.copy()
+            statistics.entries = len(self._claims)
+            statistics.keys = len(self.keys)
+        if statistics.verifications:
+            statistics.hit_rate = statistics.hits / statistics.verifications
+        if statistics.misses:
+            statistics.average_verify_ms = statistics.verify_seconds / statistics.misses * 1000
+        return statistics
+
+    def _key_for(self, token: str) -> Key | List[Key]:
+        """
+        The _key_for method returns the parsed key that signed the token. A key
+        id that is not known may belong to a rotated key set, so the keys are
+        fetched again, at most once per key refresh interval.
+        """
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self._refreshed >= self.key_refresh_interval:
+            self.refresh_keys()
+            key = self.keys.get(kid)
+        if key is None:
+            if kid is None and self.keys:
+                # A token without a key id is checked against every key.
+                return list(self.keys.values())
+            raise JWTError(f"Unknown signing key {kid}.")
+        return key
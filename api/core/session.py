@@ -0,0 +1,530 @@
+"""
+The session core module keeps chat sessions on the server, so that a client
+sends only its newest message instead of the whole conversation. A session
+is issued when the client is greeted and is owned by the user it was issued
+to. Messages are stored as compact JSON in either an in-memory or a SQLite
+backend, both of which evict sessions that have expired or that exceed the
+configured number of sessions.
+
+Long conversations are compacted in the background. Once a session holds
+more than summarize_after messages beyond its summary, the older ones are
+folded into a rolling summary by the language, and from then on only the
+summary and the recent messages are sent with each new message.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Set, Tuple
+
+from pydantic import BaseModel
+
+from environment import SessionServerInformation
+from flow.schema import Message, MessageType, NaturalLanguageProcessor
+
+logger = logging.getLogger("uvicorn")
+
+
+class SessionNotFoundException(Exception):
+    """
+    A SessionNotFoundException is raised when a session does not exist, has
+    expired, or belongs to another user.
+    """
+
+
+class MessagePage(BaseModel):
+    """
+    The MessagePage class defines a model for one page of a session's history.
+    """
+    session_id: str
+    offset: int
+    limit: int
+    total: int
+    messages: List[Message]
+
+
+class SessionBackend(ABC):
+    """
+    The SessionBackend class defines the interface for storing chat sessions.
+    Sessions idle for longer than ttl seconds expire, the least recently used
+    sessions are evicted beyond max_sessions, and only the newest max_messages
+    messages of a session are kept.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, max_messages: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+
+    @abstractmethod
+    def create(self, owner: str) -> str:
+        """
+        The create method starts a session for the owner and returns its id.
+        """
+        ...
+
+    @abstractmethod
+    def owner(self, session_id: str) -> str | None:
+        """
+        The owner method returns the owner of the session, or None if the
+        session does not exist or has expired.
+        """
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List[str]):
+        """
+        The append method adds serialized messages to the end of the session.
+        """
+        ...
+
+    @abstractmethod
+    def count(self, session_id: str) -> int:
+        """
+        The count method returns the number of messages kept in the session.
+        """
+        ...
+
+    @abstractmethod
+    def read(self, session_id: str, offset: int = 0, limit: int = None) -> List[str]:
+        """
+        The read method returns the serialized messages of the session, oldest
+        first, starting at offset.
+        """
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """
+        The delete method removes the session.
+        """
+        ...
+
+    @abstractmethod
+    def dropped(self, session_id: str) -> int:
+        """
+        The dropped method returns the number of messages removed from the
+        start of the session to keep it within max_messages.
+        """
+        ...
+
+    @abstractmethod
+    def summary(self, session_id: str) -> Tuple[str | None, int]:
+        """
+        The summary method returns the summary of the session and the number
+        of messages, counted from the start of the session, that it covers.
+        """
+        ...
+
+    @abstractmethod
+    def set_summary(self, session_id: str, summary: str, covered: int):
+        """
+        The set_summary method stores the summary of the first covered
+        messages of the session.
+        """
+        ...
+
+
+@dataclass
+class StoredSession:
+    """
+    The StoredSession class holds a session kept by the MemorySessionBackend.
+    """
+    owner: str
+    updated: float = field(default_factory=time.time)
+    messages: Deque[str] = field(default_factory=deque)
+    dropped: int = 0
+    summary: str = None
+    covered: int = 0
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    The MemorySessionBackend class keeps sessions in memory, ordered from the
+    least to the most recently used.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, max_messages: int):
+        super().__init__(ttl, max_sessions, max_messages)
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[str, StoredSession] = OrderedDict()
+
+    def create(self, owner: str) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = StoredSession(owner=owner, messages=deque(maxlen=self.max_messages))
+            self._evict()
+        return session_id
+
+    def owner(self, session_id: str) -> str | None:
+        with self._lock:
+            session = self._touch(session_id)
+            return None if session is None else session.owner
+
+    def append(self, session_id: str, messages: List[str]):
+        with self._lock:
+            session = self._touch(session_id)
+            if session is not None:
+                session.dropped += max(0, len(session.messages) + len(messages) - self.max_messages)
+                session.messages.extend(messages)
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            session = self._touch(session_id)
+            return 0 if session is None else len(session.messages)
+
+    def read(self, session_id: str, offset: int = 0, limit: int = None) -> List[str]:
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                return []
+            messages = list(session.messages)
+        return messages[offset:] if limit is None else messages[offset:offset + limit]
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def dropped(self, session_id: str) -> int:
+        with self._lock:
+            session = self._touch(session_id)
+            return 0 if session is None else session.dropped
+
+    def summary(self, session_id: str) -> Tuple[str | None, int]:
+        with self._lock:
+            session = self._touch(session_id)
+            return (None, 0) if session is None else (session.summary, session.covered)
+
+    def set_summary(self, session_id: str, summary: str, covered: int):
+        with self._lock:
+            session = self._touch(session_id)
+            if session is not None:
+                session.summary, session.covered = summary, covered
+
+    def _touch(self, session_id: str) -> StoredSession | None:
+        """
+        The _touch method returns the live session and marks it as the most
+        recently used. The caller must hold the lock.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.time() - session.updated >= self.ttl:
+            del self._sessions[session_id]
+            return None
+        session.updated = time.time()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _evict(self):
+        """
+        The _evict method removes expired sessions and the least recently used
+        sessions beyond max_sessions. The caller must hold the lock.
+        """
+        now = time.time()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session.updated < self.ttl:
+                break
+            del self._sessions[session_id]
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    The SQLiteSessionBackend class keeps sessions in a SQLite database, so
+    that they survive a restart of the service.
+    """
+
+    def __init__(self, path: str, ttl: float, max_sessions: int, max_messages: int):
+        super().__init__(ttl, max_sessions, max_messages)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                updated REAL NOT NULL,
+                summary TEXT,
+                covered INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+                seq INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            );
+        """)
+
+    def create(self, owner: str) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._connection.execute("INSERT INTO sessions (id, owner, updated) VALUES (?, ?, ?)",
+                                     (session_id, owner, time.time()))
+            self._evict()
+        return session_id
+
+    def owner(self, session_id: str) -> str | None:
+        with self._lock:
+            return self._touch(session_id)
+
+    def append(self, session_id: str, messages: List[str]):
+        with self._lock:
+            if self._touch(session_id) is None:
+                return
+            with self._transaction():
+                start = self._connection.execute(
+                    "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                self._connection.executemany(
+                    "INSERT INTO messages (session_id, seq, body) VALUES (?, ?, ?)",
+                    [(session_id, start + i, body) for i, body in enumerate(messages)],
+                )
+                self._connection.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND seq < ?",
+                    (session_id, start + len(messages) - self.max_messages),
+                )
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            if self._touch(session_id) is None:
+                return 0
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def read(self, session_id: str, offset: int = 0, limit: int = None) -> List[str]:
+        with self._lock:
+            if self._touch(session_id) is None:
+                return []
+            rows = self._connection.execute(
+                "SELECT body FROM messages WHERE session_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+                (session_id, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return [body for body, in rows]
+
+    def delete(self, session_id: str):
+        with self._lock, self._transaction():
+            self._connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def dropped(self, session_id: str) -> int:
+        with self._lock:
+            if self._touch(session_id) is None:
+                return 0
+            # Messages are numbered from zero, so the first kept number is the count dropped.
+            return self._connection.execute(
+                "SELECT COALESCE(MIN(seq), 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def summary(self, session_id: str) -> Tuple[str | None, int]:
+        with self._lock:
+            if self._touch(session_id) is None:
+                return None, 0
+            return tuple(self._connection.execute(
+                "SELECT summary, covered FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone())
+
+    def set_summary(self, session_id: str, summary: str, covered: int):
+        with self._lock:
+            self._connection.execute("UPDATE sessions SET summary = ?, covered = ? WHERE id = ?",
+                                     (summary, covered, session_id))
+
+    def _transaction(self):
+        """
+        The _transaction method returns a context manager that commits the
+        statements run inside it together. The caller must hold the lock.
+        """
+        self._connection.execute("BEGIN")
+        return _Transaction(self._connection)
+
+    def _touch(self, session_id: str) -> str | None:
+        """
+        The _touch method returns the owner of the live session and marks it
+        as the most recently used. The caller must hold the lock.
+        """
+        row = self._connection.execute("SELECT owner, updated FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] >= self.ttl:
+            with self._transaction():
+                self._connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return None
+        self._connection.execute("UPDATE sessions SET updated = ? WHERE id = ?", (time.time(), session_id))
+        return row[0]
+
+    def _evict(self):
+        """
+        The _evict method removes expired sessions and the least recently used
+        sessions beyond max_sessions. The caller must hold the lock.
+        """
+        with self._transaction():
+            self._connection.execute("""
+                DELETE FROM sessions WHERE updated < ? OR id IN (
+                    SELECT id FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?
+                )
+            """, (time.time() - self.ttl, self.max_sessions))
+            self._connection.execute("DELETE FROM messages WHERE session_id NOT IN (SELECT id FROM sessions)")
+
+
+class _Transaction:
+    """
+    The _Transaction class commits a SQLite transaction when its block exits
+    normally and rolls it back otherwise.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class SessionCore:
+    """
+    The SessionCore class defines the operational model for chat sessions. It
+    checks that a session belongs to the user asking for it, and converts
+    between Message objects and the compact form they are stored in.
+    """
+
+    def __init__(self, backend: SessionBackend, page_size: int = 50):
+        self.backend = backend
+        self.page_size = page_size
+        self._compacting: Set[str] = set()
+
+    @classmethod
+    def from_config(cls) -> SessionCore:
+        """
+        The from_config method returns a SessionCore using the backend named
+        in the sessions section of the configuration file.
+        """
+        info = SessionServerInformation.load()
+        if info.backend == "sqlite":
+            backend = SQLiteSessionBackend(info.file, info.ttl, info.max_sessions, info.max_messages)
+        elif info.backend == "memory":
+            backend = MemorySessionBackend(info.ttl, info.max_sessions, info.max_messages)
+        else:
+            raise ValueError(f"Unknown session backend {info.backend}.")
+        logger.info(f"Keeping chat sessions in the {info.backend} backend.")
+        return cls(backend, page_size=info.page_size)
+
+    def create(self, owner: str) -> str:
+        """
+        The create method starts a session for the owner and returns its id.
+        """
+        return self.backend.create(owner)
+
+    def append(self, session_id: str, owner: str, messages: List[Message]):
+        """
+        The append method adds messages to the owner's session.
+        """
+        self._check(session_id, owner)
+        self.backend.append(session_id, [message.json(exclude_none=True) for message in messages])
+
+    def conversation(self, session_id: str, owner: str) -> Tuple[str | None, List[Message]]:
+        """
+        The conversation method returns the summary of the owner's session and
+        the messages that come after it, as history for the language. Code
+        sections hold device output that the language has already summarized,
+        so they are left out.
+        """
+        self._check(session_id, owner)
+        summary, covered = self.backend.summary(session_id)
+        start = max(0, covered - self.backend.dropped(session_id))
+        messages = [Message.parse_raw(body) for body in self.backend.read(session_id, offset=start)]
+        for message in messages:
+            message.sections = [s for s in message.sections if s.messageType != MessageType.code]
+        return summary, messages
+
+    async def compact(self, session_id: str, owner: str, language: NaturalLanguageProcessor):
+        """
+        The compact method folds the older messages of the owner's session
+        into its summary once more than summarize_after messages follow the
+        summary. The last recent_turns messages are left as they are. It is
+        meant to run in the background after a message has been answered, and
+        a session is only compacted by one task at a time.
+        """
+        configuration = language.configuration
+        if configuration.summarize_after <= 0 or session_id in self._compacting:
+            return
+        self._compacting.add(session_id)
+        try:
+            self._check(session_id, owner)
+            summary, covered = self.backend.summary(session_id)
+            dropped = self.backend.dropped(session_id)
+            total = dropped + self.backend.count(session_id)
+            start = max(covered, dropped)
+            if total - start <= configuration.summarize_after:
+                return
+            end = total - configuration.recent_turns
+            if end <= start:
+                # Every message since the summary is one of the recent turns, which are kept as they are.
+                return
+            messages = [Message.parse_raw(body)
+                        for body in self.backend.read(session_id, offset=start - dropped, limit=end - start)]
+            started = time.monotonic()
+            summary = await language.summarize(summary, messages)
+            if summary:
+                self.backend.set_summary(session_id, summary, end)
+                logger.info(f"Summarized {len(messages)} messages of session {session_id} "
+                            f"in {time.monotonic() - started:.2f}s.")
+        except Exception as e:
+            logger.error(f"Session {session_id} could not be compacted: {e}")
+        finally:
+            self._compacting.discard(session_id)
+
+    def latest(self, session_id: str, owner: str) -> Message:
+        """
+        The latest method returns the newest message of the owner's session.
+        """
+        self._check(session_id, owner)
+        bodies = self.backend.read(session_id, offset=max(0, self.backend.count(session_id) - 1))
+        if not bodies:
+            raise SessionNotFoundException(f"Session {session_id} has no messages.")
+        return Message.parse_raw(bodies[-1])
+
+    def history(self, session_id: str, owner: str, offset: int = 0, limit: int = None) -> MessagePage:
+        """
+        The history method returns one page of the owner's session, with
+        every section of every message.
+        """
+        self._check(session_id, owner)
+        limit = self.page_size if limit is None else min(limit, self.page_size)
+        return MessagePage(
+            session_id=session_id,
+            offset=offset,
+            limit=limit,
+            total=self.backend.count(session_id),
+            messages=[Message.parse_raw(body) for body in self.backend.read(session_id, offset, limit)],
+        )
+
+    def delete(self, session_id: str, owner: str):
+        """
+        The delete method removes the owner's session.
+        """
+        self._check(session_id, owner)
+        self.backend.delete(session_id)
+
+    def _check(self, session_id: str, owner: str):
+        """
+        The _check method raises a SessionNotFoundException unless the session
+        exists and belongs to the owner. Sessions of other users are reported
+        as missing so that their ids cannot be probed.
+        """
+        if self.backend.owner(session_id) != owner:
+            raise SessionNotFoundException(f"Session {session_id} was not found.")
+
+
+SESSIONS = SessionCore.from_config()
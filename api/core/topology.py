@@ -0,0 +1,270 @@
+"""
+The topology module provides the TopologyCore, an in-memory index of the
+network's LLDP adjacencies. Every LLDP result gathered from a device is
+folded into the index, so questions about paths, neighbors and the impact
+of a failure can be answered without crawling the network again. Each node
+remembers when its neighbors were last learned with each set of credentials,
+which lets callers refresh only the nodes that have gone stale for them.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+
+class TopologyCore:
+    """
+    The TopologyCore class stores the LLDP adjacency graph. Hostnames are
+    interned to integer node ids, and each node keeps only the neighbors it
+    reported itself along with a reverse index of the nodes that reported it,
+    so refreshing one node replaces exactly the edges it was the source of.
+
+    Every method takes a scope, the fingerprint of the credentials the caller
+    uses on the devices. A node's neighbors are only visible within the scopes
+    that have learned them from the device, so a caller never sees adjacencies
+    read from a device it could not log in to.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._ids: Dict[str, int] = {}
+        self._short: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._observed: List[Dict[int, Tuple[Tuple[str, str], ...]]] = []
+        self._reverse: List[Set[int]] = []
+        self._refreshed: List[Dict[str, float]] = []
+        self._learned: List[Set[str]] = []
+
+    def __contains__(self, host: str) -> bool:
+        with self._lock:
+            return self._resolve(host) is not None
+
+    def update(self, host: str, neighbors: Dict[str, List[Dict[str, Any]]], scope: str):
+        """
+        The update method replaces the neighbors learned from the host with a
+        NAPALM get_lldp_neighbors result, which maps each local port to the
+        hostname and port of the devices seen on it, and makes them visible
+        within the scope.
+        """
+        with self._lock:
+            node = self._node(host)
+            links: Dict[int, List[Tuple[str, str]]] = {}
+            for local_port, entries in neighbors.items():
+                for entry in entries:
+                    neighbor = self._node(entry["hostname"])
+                    if neighbor == node:
+                        continue
+                    ports = (sys.intern(local_port), sys.intern(entry.get("port", "")))
+                    links.setdefault(neighbor, []).append(ports)
+            for neighbor in self._observed[node]:
+                self._reverse[neighbor].discard(node)
+            self._observed[node] = {neighbor: tuple(ports) for neighbor, ports in links.items()}
+            for neighbor in links:
+                self._reverse[neighbor].add(node)
+            scope = sys.intern(scope)
+            self._refreshed[node][scope] = time.monotonic()
+            self._learned[node].add(scope)
+
+    def touch(self, host: str, scope: str):
+        """
+        The touch method marks the host as refreshed without changing its
+        neighbors. It is used for hosts that could not be reached, so that
+        they are not retried until they go stale again. Neighbors learned
+        within other scopes stay hidden from the scope.
+        """
+        with self._lock:
+            self._refreshed[self._node(host)][sys.intern(scope)] = time.monotonic()
+
+    def stale(self, hosts: Iterable[str], scope: str) -> List[str]:
+        """
+        The stale method returns the hosts whose neighbors have never been
+        learned within the scope or were learned more than ttl seconds ago.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                host for host in hosts
+                if (node := self._resolve(host)) is None
+                or now - self._refreshed[node].get(scope, -self.ttl) >= self.ttl
+            ]
+
+    def neighbors(self, host: str, scope: str) -> List[Dict[str, str]]:
+        """
+        The neighbors method returns the devices adjacent to the host along
+        with the ports that connect them.
+        """
+        with self._lock:
+            node = self._resolve(host)
+            if node is None:
+                return []
+            return [
+                {"neighbor": self._names[neighbor], "local_port": local_port, "remote_port": remote_port}
+                for neighbor in self._adjacent(node, scope)
+                for local_port, remote_port in self._ports(node, neighbor, scope)
+            ]
+
+    def neighbor_names(self, host: str, scope: str) -> List[str]:
+        """
+        The neighbor_names method returns the hostnames adjacent to the host.
+        """
+        with self._lock:
+            node = self._resolve(host)
+            return [] if node is None else [self._names[neighbor] for neighbor in self._adjacent(node, scope)]
+
+    def path(self, source: str, destination: str, scope: str) -> List[Dict[str, str]] | None:
+        """
+        The path method returns the shortest path from the source to the
+        destination as a list of hops, or None if no path is known.
+        """
+        with self._lock:
+            start, goal = self._resolve(source), self._resolve(destination)
+            if start is None or goal is None:
+                return None
+            previous = {start: start}
+            queue = deque([start])
+            while queue and goal not in previous:
+                node = queue.popleft()
+                for neighbor in self._adjacent(node, scope):
+                    if neighbor not in previous:
+                        previous[neighbor] = node
+                        queue.append(neighbor)
+            if goal not in previous:
+                return None
+            nodes = [goal]
+            while nodes[-1] != start:
+                nodes.append(previous[nodes[-1]])
+            nodes.reverse()
+            hops = []
+            for node, neighbor in zip(nodes, nodes[1:]):
+                local_port, remote_port = self._ports(node, neighbor, scope)[0]
+                hops.append({"from": self._names[node], "from_port": local_port,
+                             "to": self._names[neighbor], "to_port": remote_port})
+            return hops
+
+    def blast_radius(self, host: str, scope: str, root: str = None) -> List[str] | None:
+        """
+        The blast_radius method returns the devices that would be cut off if
+        the host failed. With a root, these are the devices that would lose
+        every path to the root. Without one, they are the devices left outside
+        the largest remaining part of the network. None is returned if the
+        host is unknown within the scope.
+        """
+        with self._lock:
+            failed = self._resolve(host)
+            if failed is None or not self._visible(failed, scope):
+                return None
+            known = [node for node in range(len(self._names)) if node != failed and self._visible(node, scope)]
+            if root is not None:
+                start = self._resolve(root)
+                if start is None or start == failed or not self._visible(start, scope):
+                    return None
+                reachable = self._reachable(start, failed, scope)
+            else:
+                reachable: Set[int] = set()
+                seen: Set[int] = set()
+                for node in known:
+                    if node not in seen:
+                        component = self._reachable(node, failed, scope)
+                        seen |= component
+                        if len(component) > len(reachable):
+                            reachable = component
+            return sorted(self._names[node] for node in known if node not in reachable)
+
+    def _reachable(self, start: int, removed: int, scope: str) -> Set[int]:
+        """
+        The _reachable method returns the nodes reachable from start without
+        passing through the removed node. The caller must hold the lock.
+        """
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            for neighbor in self._adjacent(queue.popleft(), scope):
+                if neighbor != removed and neighbor not in seen:
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+        return seen
+
+    def _adjacent(self, node: int, scope: str) -> Set[int]:
+        """
+        The _adjacent method returns the nodes linked to the node in either
+        direction by links learned within the scope. The caller must hold the
+        lock.
+        """
+        adjacent = set(self._observed[node]) if scope in self._learned[node] else set()
+        adjacent.update(reporter for reporter in self._reverse[node] if scope in self._learned[reporter])
+        return adjacent
+
+    def _visible(self, node: int, scope: str) -> bool:
+        """
+        The _visible method returns whether the node has been learned within
+        the scope, either directly or as the neighbor of a node that was. The
+        caller must hold the lock.
+        """
+        return scope in self._learned[node] or any(scope in self._learned[reporter] for reporter in self._reverse[node])
+
+    def _ports(self, node: int, neighbor: int, scope: str) -> Tuple[Tuple[str, str], ...]:
+        """
+        The _ports method returns the (local, remote) port pairs that link the
+        node to the neighbor, as seen from the node. The caller must hold the
+        lock.
+        """
+        if neighbor in self._observed[node] and scope in self._learned[node]:
+            return self._observed[node][neighbor]
+        return tuple((remote, local) for local, remote in self._observed[neighbor][node])
+
+    def _node(self, host: str) -> int:
+        """
+        The _node method returns the node id for the host, adding the host to
+        the index if it is not already known. The caller must hold the lock.
+        """
+        node = self._resolve(host)
+        name = host.lower()
+        if node is None and "." in name and not is_address(name):
+            # A device first known by its short hostname takes on its fully qualified name.
+            node = self._short.get(name.split(".", 1)[0])
+            if node is not None and "." not in self._names[node]:
+                self._ids[name] = node
+                self._names[node] = sys.intern(name)
+            else:
+                node = None
+        if node is None:
+            node = len(self._names)
+            self._ids[name] = node
+            if not is_address(name):
+                self._short.setdefault(name.split(".", 1)[0], node)
+            self._names.append(sys.intern(name))
+            self._observed.append({})
+            self._reverse.append(set())
+            self._refreshed.append({})
+            self._learned.append(set())
+        return node
+
+    def _resolve(self, host: str) -> int | None:
+        """
+        The _resolve method returns the node id for the host, matching a short
+        hostname against fully qualified names if there is no exact match. The
+        caller must hold the lock.
+        """
+        name = host.lower()
+        node = self._ids.get(name)
+        if node is None and "." not in name:
+            node = self._short.get(name)
+        return node
+
+
+def is_address(name: str) -> bool:
+    """
+    The is_address function returns whether the name is an IP address rather
+    than a hostname, so that it is never shortened to its first octet.
+    """
+    try:
+        ipaddress.ip_address(name)
+        return True
+    except ValueError:
+        return False
@@ -41,6 +41,31 @@ class AuthenticationServerInformation(BaseModel):
         return cls(**configuration)
 
 
+class TokenCacheServerInformation(BaseModel):
+    """
+    The TokenCacheServerInformation class defines a model for the information
+    needed to cache the claims of verified tokens and the authentication
+    server's signing keys.
+    """
+
+    max_entries: int = 4096
+    ttl: float = 300.0
+    key_refresh_interval: float = 60.0
+
+    @classmethod
+    def load(cls) -> TokenCacheServerInformation:
+        """
+        The load method returns an instance of the TokenCacheServerInformation
+        """
+        configuration = load_config_file("token_cache", default={})
+        # Override the configuration with environment variables
+        configuration["max_entries"] = os.getenv("TOKEN_CACHE_MAX_ENTRIES", configuration.get("max_entries", 4096))
+        configuration["ttl"] = os.getenv("TOKEN_CACHE_TTL", configuration.get("ttl", 300.0))
+        configuration["key_refresh_interval"] = os.getenv("TOKEN_CACHE_KEY_REFRESH_INTERVAL",
+                                                          configuration.get("key_refresh_interval", 60.0))
+        return cls(**configuration)
+
+
 class NetGPTServerInformation(BaseModel):
     """
     The NetGPTServerInformation class defines a model for the information
@@ -62,6 +87,143 @@ class NetGPTServerInformation(BaseModel):
         return cls(**configuration)
 
 
+class DeviceServerInformation(BaseModel):
+    """
+    The DeviceServerInformation class defines a model for the information
+    needed to control how the NetGPT service connects to network devices.
+    """
+
+    max_concurrency: int = 16
+    host_deadline: float = 60.0
+    max_sessions_per_host: int = 2
+    session_idle_timeout: float = 300.0
+    max_output_lines: int = 2000
+    max_output_bytes: int = 131072
+    structured_output: bool = True
+    topology_ttl: float = 300.0
+    topology_max_nodes: int = 256
+    failure_threshold: int = 3
+    breaker_cooldown: float = 30.0
+    max_in_flight_per_host: int = 4
+    max_in_flight: int = 256
+    prewarm_max_hosts: int = 8
+
+    @classmethod
+    def load(cls) -> DeviceServerInformation:
+        """
+        The load method returns an instance of the DeviceServerInformation
+        """
+        configuration = load_config_file("devices", default={})
+        # Override the configuration with environment variables
+        configuration["max_concurrency"] = os.getenv("DEVICE_MAX_CONCURRENCY",
+                                                     configuration.get("max_concurrency", 16))
+        configuration["host_deadline"] = os.getenv("DEVICE_HOST_DEADLINE",
+                                                   configuration.get("host_deadline", 60.0))
+        configuration["max_sessions_per_host"] = os.getenv("DEVICE_MAX_SESSIONS_PER_HOST",
+                                                           configuration.get("max_sessions_per_host", 2))
+        configuration["session_idle_timeout"] = os.getenv("DEVICE_SESSION_IDLE_TIMEOUT",
+                                                          configuration.get("session_idle_timeout", 300.0))
+        configuration["max_output_lines"] = os.getenv("DEVICE_MAX_OUTPUT_LINES",
+                                                      configuration.get("max_output_lines", 2000))
+        configuration["max_output_bytes"] = os.getenv("DEVICE_MAX_OUTPUT_BYTES",
+                                                      configuration.get("max_output_bytes", 131072))
+        configuration["structured_output"] = os.getenv("DEVICE_STRUCTURED_OUTPUT",
+                                                       configuration.get("structured_output", True))
+        configuration["topology_ttl"] = os.getenv("DEVICE_TOPOLOGY_TTL",
+                                                  configuration.get("topology_ttl", 300.0))
+        configuration["topology_max_nodes"] = os.getenv("DEVICE_TOPOLOGY_MAX_NODES",
+                                                        configuration.get("topology_max_nodes", 256))
+        configuration["failure_threshold"] = os.getenv("DEVICE_FAILURE_THRESHOLD",
+                                                       configuration.get("failure_threshold", 3))
+        configuration["breaker_cooldown"] = os.getenv("DEVICE_BREAKER_COOLDOWN",
+                                                      configuration.get("breaker_cooldown", 30.0))
+        configuration["max_in_flight_per_host"] = os.getenv("DEVICE_MAX_IN_FLIGHT_PER_HOST",
+                                                            configuration.get("max_in_flight_per_host", 4))
+        configuration["max_in_flight"] = os.getenv("DEVICE_MAX_IN_FLIGHT",
+                                                   configuration.get("max_in_flight", 256))
+        configuration["prewarm_max_hosts"] = os.getenv("DEVICE_PREWARM_MAX_HOSTS",
+                                                       configuration.get("prewarm_max_hosts", 8))
+        return cls(**configuration)
+
+
+class InventoryServerInformation(BaseModel):
+    """
+    The InventoryServerInformation class defines a model for the information
+    needed to load the inventory of network devices.
+    """
+
+    file: str = "config/inventory.yml"
+
+    @classmethod
+    def load(cls) -> InventoryServerInformation:
+        """
+        The load method returns an instance of the InventoryServerInformation
+        """
+        configuration = load_config_file("inventory", default={})
+        # Override the configuration with environment variables
+        configuration["file"] = os.getenv("INVENTORY_FILE", configuration.get("file", "config/inventory.yml"))
+        return cls(**configuration)
+
+
+class CacheServerInformation(BaseModel):
+    """
+    The CacheServerInformation class defines a model for the information
+    needed to size the in-memory caches of the NetGPT service.
+    """
+
+    ttl: float = 60.0
+    max_entries: int = 1024
+    max_bytes: int = 16 * 1024 * 1024
+
+    @classmethod
+    def load(cls) -> CacheServerInformation:
+        """
+        The load method returns an instance of the CacheServerInformation
+        """
+        configuration = load_config_file("cache", default={})
+        # Override the configuration with environment variables
+        configuration["ttl"] = os.getenv("CACHE_TTL", configuration.get("ttl", 60.0))
+        configuration["max_entries"] = os.getenv("CACHE_MAX_ENTRIES", configuration.get("max_entries", 1024))
+        configuration["max_bytes"] = os.getenv("CACHE_MAX_BYTES", configuration.get("max_bytes", 16 * 1024 * 1024))
+        return cls(**configuration)
+
+
+class ExecutionServerInformation(BaseModel):
+    """
+    The ExecutionServerInformation class defines a model for the information
+    needed to control how the NetGPT service runs blocking work, such as
+    device sessions, outside the event loop. In the process mode, device
+    and plugin capabilities are isolated on a pool of worker processes.
+    """
+
+    max_workers: int = 32
+    mode: str = "thread"
+    process_workers: int = 4
+    call_timeout: float = 300.0
+    max_memory_mb: int = 2048
+    max_tasks_per_worker: int = 100
+
+    @classmethod
+    def load(cls) -> ExecutionServerInformation:
+        """
+        The load method returns an instance of the ExecutionServerInformation
+        """
+        configuration = load_config_file("execution", default={})
+        # Override the configuration with environment variables
+        configuration["max_workers"] = os.getenv("EXECUTION_MAX_WORKERS",
+                                                 configuration.get("max_workers", 32))
+        configuration["mode"] = os.getenv("EXECUTION_MODE", configuration.get("mode", "thread"))
+        configuration["process_workers"] = os.getenv("EXECUTION_PROCESS_WORKERS",
+                                                     configuration.get("process_workers", 4))
+        configuration["call_timeout"] = os.getenv("EXECUTION_CALL_TIMEOUT",
+                                                  configuration.get("call_timeout", 300.0))
+        configuration["max_memory_mb"] = os.getenv("EXECUTION_MAX_MEMORY_MB",
+                                                   configuration.get("max_memory_mb", 2048))
+        configuration["max_tasks_per_worker"] = os.getenv("EXECUTION_MAX_TASKS_PER_WORKER",
+                                                          configuration.get("max_tasks_per_worker", 100))
+        return cls(**configuration)
+
+
 def get_configuration_file() -> Path:
     """
     The get_configuration_file method returns the configuration file path.
@@ -72,20 +234,194 @@ def get_configuration_file() -> Path:
     return configuration_file
 
 
-def load_config_file(section: str) -> dict:
+def load_config_file(section: str, default: dict = None) -> dict:
     """
     The load_config_file method attempts to load the configuration file and
-    returns the configuration for the specified section.
+    returns the configuration for the specified section. If a default is
+    provided, it is returned when the section is missing from the file.
     """
 
     configuration_file = get_configuration_file()
     try:
         with open(configuration_file, "r") as f:
-            configuration = safe_load(f)[section]
-            return configuration
+            configuration = safe_load(f)
+            if default is not None and section not in configuration:
+                return dict(default)
+            return configuration[section] or {}
     except FileNotFoundError:
         logger.critical(f"Configuration file {configuration_file} not found. Exiting.")
         sys.exit(1)
     except KeyError as e:
         logger.critical(f"Configuration invalid, {configuration_file}, {e}. Exiting.")
         sys.exit(1)
+
+
+class TransportServerInformation(BaseModel):
+    """
+    The TransportServerInformation class defines a model for the information
+    needed to control how the NetGPT service calls the language model's API.
+    """
+
+    api_url: str = "https://api.openai.com/v1/chat/completions"
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    max_connections: int = 64
+    max_keepalive_connections: int = 16
+    http2: bool = True
+    max_retries: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    hedge_after: float = 0.0
+
+    @classmethod
+    def load(cls) -> TransportServerInformation:
+        """
+        The load method returns an instance of the TransportServerInformation
+        """
+        configuration = load_config_file("transport", default={})
+        # Override the configuration with environment variables
+        configuration["api_url"] = os.getenv("TRANSPORT_API_URL",
+                                             configuration.get("api_url", "https://api.openai.com/v1/chat/completions"))
+        configuration["connect_timeout"] = os.getenv("TRANSPORT_CONNECT_TIMEOUT",
+                                                     configuration.get("connect_timeout", 10.0))
+        configuration["read_timeout"] = os.getenv("TRANSPORT_READ_TIMEOUT",
+                                                  configuration.get("read_timeout", 120.0))
+        configuration["max_connections"] = os.getenv("TRANSPORT_MAX_CONNECTIONS",
+                                                      configuration.get("max_connections", 64))
+        configuration["max_keepalive_connections"] = os.getenv("TRANSPORT_MAX_KEEPALIVE_CONNECTIONS",
+                                                                configuration.get("max_keepalive_connections", 16))
+        configuration["http2"] = os.getenv("TRANSPORT_HTTP2", configuration.get("http2", True))
+        configuration["max_retries"] = os.getenv("TRANSPORT_MAX_RETRIES",
+                                                 configuration.get("max_retries", 3))
+        configuration["backoff"] = os.getenv("TRANSPORT_BACKOFF", configuration.get("backoff", 0.5))
+        configuration["max_backoff"] = os.getenv("TRANSPORT_MAX_BACKOFF", configuration.get("max_backoff", 8.0))
+        configuration["hedge_after"] = os.getenv("TRANSPORT_HEDGE_AFTER", configuration.get("hedge_after", 0.0))
+        return cls(**configuration)
+
+
+class ResponseCacheServerInformation(BaseModel):
+    """
+    The ResponseCacheServerInformation class defines a model for the
+    information needed to cache the language model's responses, and the
+    prices used to report what the cache has saved.
+    """
+
+    enabled: bool = True
+    ttl: float = 3600.0
+    max_entries: int = 512
+    max_bytes: int = 8 * 1024 * 1024
+    prompt_price: float = 0.001
+    completion_price: float = 0.002
+
+    @classmethod
+    def load(cls) -> ResponseCacheServerInformation:
+        """
+        The load method returns an instance of the ResponseCacheServerInformation
+        """
+        configuration = load_config_file("response_cache", default={})
+        # Override the configuration with environment variables
+        configuration["enabled"] = os.getenv("RESPONSE_CACHE_ENABLED", configuration.get("enabled", True))
+        configuration["ttl"] = os.getenv("RESPONSE_CACHE_TTL", configuration.get("ttl", 3600.0))
+        configuration["max_entries"] = os.getenv("RESPONSE_CACHE_MAX_ENTRIES",
+                                                 configuration.get("max_entries", 512))
+        configuration["max_bytes"] = os.getenv("RESPONSE_CACHE_MAX_BYTES",
+                                               configuration.get("max_bytes", 8 * 1024 * 1024))
+        configuration["prompt_price"] = os.getenv("RESPONSE_CACHE_PROMPT_PRICE",
+                                                  configuration.get("prompt_price", 0.001))
+        configuration["completion_price"] = os.getenv("RESPONSE_CACHE_COMPLETION_PRICE",
+                                                      configuration.get("completion_price", 0.002))
+        return cls(**configuration)
+
+
+class SessionServerInformation(BaseModel):
+    """
+    The SessionServerInformation class defines a model for the information
+    needed to keep chat sessions on the server.
+    """
+
+    backend: str = "memory"
+    file: str = "config/sessions.db"
+    ttl: float = 86400.0
+    max_sessions: int = 1000
+    max_messages: int = 1000
+    page_size: int = 50
+
+    @classmethod
+    def load(cls) -> SessionServerInformation:
+        """
+        The load method returns an instance of the SessionServerInformation
+        """
+        configuration = load_config_file("sessions", default={})
+        # Override the configuration with environment variables
+        configuration["backend"] = os.getenv("SESSION_BACKEND", configuration.get("backend", "memory"))
+        configuration["file"] = os.getenv("SESSION_FILE", configuration.get("file", "config/sessions.db"))
+        configuration["ttl"] = os.getenv("SESSION_TTL", configuration.get("ttl", 86400.0))
+        configuration["max_sessions"] = os.getenv("SESSION_MAX_SESSIONS", configuration.get("max_sessions", 1000))
+        configuration["max_messages"] = os.getenv("SESSION_MAX_MESSAGES", configuration.get("max_messages", 1000))
+        configuration["page_size"] = os.getenv("SESSION_PAGE_SIZE", configuration.get("page_size", 50))
+        return cls(**configuration)
+
+
+class ChatRegistryServerInformation(BaseModel):
+    """
+    The ChatRegistryServerInformation class defines a model for the
+    information needed to reuse chat components between requests.
+    """
+
+    max_entries: int = 128
+    ttl: float = 900.0
+
+    @classmethod
+    def load(cls) -> ChatRegistryServerInformation:
+        """
+        The load method returns an instance of the ChatRegistryServerInformation
+        """
+        configuration = load_config_file("chat_registry", default={})
+        # Override the configuration with environment variables
+        configuration["max_entries"] = os.getenv("CHAT_REGISTRY_MAX_ENTRIES", configuration.get("max_entries", 128))
+        configuration["ttl"] = os.getenv("CHAT_REGISTRY_TTL", configuration.get("ttl", 900.0))
+        return cls(**configuration)
+
+
+class JobServerInformation(BaseModel):
+    """
+    The JobServerInformation class defines a model for the information
+    needed to run long capabilities as background jobs.
+    """
+
+    max_running: int = 8
+    retention: float = 3600.0
+    max_jobs: int = 256
+
+    @classmethod
+    def load(cls) -> JobServerInformation:
+        """
+        The load method returns an instance of the JobServerInformation
+        """
+        configuration = load_config_file("jobs", default={})
+        # Override the configuration with environment variables
+        configuration["max_running"] = os.getenv("JOBS_MAX_RUNNING", configuration.get("max_running", 8))
+        configuration["retention"] = os.getenv("JOBS_RETENTION", configuration.get("retention", 3600.0))
+        configuration["max_jobs"] = os.getenv("JOBS_MAX_JOBS", configuration.get("max_jobs", 256))
+        return cls(**configuration)
+
+
+class WebSocketServerInformation(BaseModel):
+    """
+    The WebSocketServerInformation class defines a model for the information
+    needed to serve chats over WebSockets.
+    """
+
+    queue_size: int = 64
+    send_timeout: float = 30.0
+
+    @classmethod
+    def load(cls) -> WebSocketServerInformation:
+        """
+        The load method returns an instance of the WebSocketServerInformation
+        """
+        configuration = load_config_file("websocket", default={})
+        # Override the configuration with environment variables
+        configuration["queue_size"] = os.getenv("WEBSOCKET_QUEUE_SIZE", configuration.get("queue_size", 64))
+        configuration["send_timeout"] = os.getenv("WEBSOCKET_SEND_TIMEOUT", configuration.get("send_timeout", 30.0))
+        return cls(**configuration)
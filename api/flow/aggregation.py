@@ -0,0 +1,167 @@
+"""
+The Aggregation module shrinks the per-host results of a capability before
+they are sent to the language. Hosts with identical output are grouped behind
+a hash of that output, and hosts whose output differs only slightly from the
+most common output are given as a unified diff against it. The expand
+function reverses the aggregation, so the full per-host results can still be
+shown to the user.
+"""
+
+from __future__ import annotations
+
+import difflib
+import hashlib
+import json
+import re
+from typing import Any, Dict, List
+
+# The key marking a result as aggregated.
+GROUPS_KEY = "host_groups"
+
+# The field that holds a host's plain text output while it is aggregated.
+TEXT_KEY = "output"
+
+AGGREGATION_NOTE = ("Hosts with identical output share a group. Groups with a baseline give only their "
+                    "changes from the baseline group, as unified diffs of each field.")
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+
+
+def aggregate(output: Any) -> Any:
+    """
+    The aggregate function groups the per-host results of a capability. The
+    output is returned unchanged unless it maps two or more hosts to dict or
+    text results and the aggregated form is smaller than the original. Text
+    results are grouped as a dict with a single output field, and their
+    groups are marked so that expand gives back the text.
+    """
+    if not isinstance(output, dict) or len(output) < 2:
+        return output
+    if not all(isinstance(v, (dict, str)) for v in output.values()):
+        return output
+    groups: Dict[str, Dict[str, Any]] = {}
+    for host, result in output.items():
+        digest = content_hash(result)
+        if digest not in groups:
+            groups[digest] = {"id": digest, "hosts": []}
+            if isinstance(result, str):
+                groups[digest].update(text=True, output={TEXT_KEY: result})
+            else:
+                groups[digest]["output"] = result
+        groups[digest]["hosts"].append(host)
+    ordered = sorted(groups.values(), key=lambda g: len(g["hosts"]), reverse=True)
+    baseline = ordered[0]
+    for group in ordered[1:]:
+        changes = _changes(baseline["output"], group["output"])
+        if changes is not None:
+            group["baseline"] = baseline["id"]
+            group["changes"] = changes
+            del group["output"]
+    aggregated = {GROUPS_KEY: ordered, "note": AGGREGATION_NOTE}
+    if len(json.dumps(aggregated)) >= len(json.dumps(output)):
+        return output
+    return aggregated
+
+
+def expand(output: Any) -> Any:
+    """
+    The expand function rebuilds the per-host results from an aggregated
+    output. Any other output is returned unchanged.
+    """
+    if not isinstance(output, dict) or GROUPS_KEY not in output:
+        return output
+    baselines = {group["id"]: group["output"] for group in output[GROUPS_KEY] if "output" in group}
+    results = {}
+    for group in output[GROUPS_KEY]:
+        if "output" in group:
+            result = group["output"]
+        else:
+            result = _apply(baselines[group["baseline"]], group["changes"])
+        if group.get("text"):
+            result = result[TEXT_KEY]
+        for host in group["hosts"]:
+            results[host] = result
+    return results
+
+
+def content_hash(value: Any) -> str:
+    """
+    The content_hash function returns a short hash of a JSON value.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def _changes(baseline: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    The _changes function describes a result as changes to the baseline,
+    field by field. A changed field is given as a diff if the diff is less
+    than half the size of the field, and in full otherwise. None is returned
+    if no field could be given as a diff, since the changes would then be no
+    smaller than the result itself.
+    """
+    changes: Dict[str, Any] = {}
+    diffed = False
+    for field in baseline.keys() | result.keys():
+        if field not in result:
+            changes[field] = {"removed": True}
+            continue
+        old, new = baseline.get(field), result[field]
+        if old == new:
+            continue
+        if field in baseline and isinstance(old, str) == isinstance(new, str):
+            old_text, new_text = _text(old), _text(new)
+            diff = "\n".join(difflib.unified_diff(old_text.split("\n"), new_text.split("\n"),
+                                                  n=0, lineterm=""))
+            # The first two lines of a unified diff name the files being compared.
+            diff = "\n".join(diff.split("\n")[2:])
+            if len(diff) < len(new_text) / 2:
+                changes[field] = {"diff": diff}
+                diffed = True
+                continue
+        changes[field] = {"value": new}
+    return changes if diffed else None
+
+
+def _apply(baseline: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The _apply function applies changes made by _changes to the baseline.
+    """
+    result = dict(baseline)
+    for field, change in changes.items():
+        if change.get("removed"):
+            result.pop(field, None)
+        elif "diff" in change:
+            text = _patch(_text(baseline[field]).split("\n"), change["diff"])
+            result[field] = text if isinstance(baseline[field], str) else json.loads(text)
+        else:
+            result[field] = change["value"]
+    return result
+
+
+def _patch(lines: List[str], diff: str) -> str:
+    """
+    The _patch function applies a unified diff without context lines to the
+    lines it was made from.
+    """
+    patched: List[str] = []
+    position = 0
+    for line in diff.split("\n"):
+        header = HUNK_HEADER.match(line)
+        if header:
+            start, count = int(header.group(1)), int(header.group(2) or 1)
+            # A hunk that removes nothing is numbered by the line it follows.
+            start = start if count == 0 else start - 1
+            patched += lines[position:start]
+            position = start + count
+        elif line.startswith("+"):
+            patched.append(line[1:])
+    patched += lines[position:]
+    return "\n".join(patched)
+
+
+def _text(value: Any) -> str:
+    """
+    The _text function returns a string field as it is, and any other value
+    as indented JSON so that it can be diffed line by line.
+    """
+    return value if isinstance(value, str) else json.dumps(value, indent=1, sort_keys=True)
@@ -0,0 +1,101 @@
+"""
+The Digest module condenses tool output that is too large to send to a
+language. The output is split into chunks on record boundaries, each chunk
+is summarized concurrently (the map), and the chunk summaries are combined,
+in rounds if need be, into one digest that fits the tool output budget (the
+reduce). The language supplies the summarize coroutine, so the pipeline
+itself knows nothing of any particular API.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, List
+
+from flow.tokens import count_tokens, truncate
+
+# Rounds of combining after which the summaries are truncated to fit instead.
+MAX_REDUCE_ROUNDS = 3
+
+# Summarizes a piece of text to at most the given number of tokens.
+Summarizer = Callable[[str, int], Awaitable[str]]
+
+
+def records(output: Any) -> List[str]:
+    """
+    The records function splits the output of a tool into the records it
+    should be chunked on. Per-host results are split by host, lists by item,
+    and text by line, so that no chunk starts halfway through a record.
+    """
+    if isinstance(output, dict):
+        return [f"{key}:\n{_text(value)}" for key, value in output.items()]
+    if isinstance(output, list):
+        return [_text(item) for item in output]
+    return _text(output).split("\n")
+
+
+def chunk(output: Any, chunk_tokens: int, model: str) -> List[str]:
+    """
+    The chunk function packs the records of the output into chunks of at
+    most chunk_tokens tokens. A record that is too large for a chunk on its
+    own is split by line, each part keeping the record's first line, cut to
+    at most half a chunk, as a heading. A line that is still too large is
+    truncated.
+    """
+    chunks, current, size = [], [], 0
+    for record in records(output):
+        tokens = count_tokens(record, model) + 1
+        if size + tokens > chunk_tokens and current:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        if tokens <= chunk_tokens:
+            current.append(record)
+            size += tokens
+        elif "\n" in record and not isinstance(output, str):
+            heading, body = record.split("\n", 1)
+            # The heading is repeated in every part, so it may take no more than half of each.
+            heading = truncate(heading, chunk_tokens // 2, model)
+            budget = chunk_tokens - count_tokens(heading, model) - 1
+            if budget > 0:
+                chunks.extend(f"{heading}\n{part}" for part in chunk(body, budget, model))
+            else:
+                chunks.append(truncate(record, chunk_tokens, model))
+        else:
+            chunks.append(truncate(record, chunk_tokens, model))
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+async def map_reduce(chunks: List[str], summarize: Summarizer, max_tokens: int, model: str,
+                     parallelism: int = 4) -> str:
+    """
+    The map_reduce function summarizes every chunk, at most parallelism at
+    a time, and then combines the summaries until they fit in max_tokens.
+    Each chunk's summary is given an equal share of max_tokens, so that one
+    round of combining is usually enough.
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+
+    async def bounded(text: str, tokens: int) -> str:
+        async with semaphore:
+            return await summarize(text, tokens)
+
+    summaries = chunks
+    for _ in range(MAX_REDUCE_ROUNDS):
+        share = max(64, max_tokens // len(summaries))
+        summaries = await asyncio.gather(*(bounded(text, share) for text in summaries))
+        combined = "\n\n".join(summaries)
+        if count_tokens(combined, model) <= max_tokens or len(summaries) == 1:
+            break
+        # Summarize the summaries again, in groups that each fit in one request.
+        summaries = chunk(summaries, max_tokens * 2, model)
+    return truncate(combined, max_tokens, model)
+
+
+def _text(value: Any) -> str:
+    """
+    The _text function renders a value as plain text or JSON.
+    """
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
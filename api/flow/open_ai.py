@@ -5,24 +5,50 @@ It implements the "LanguageFlow" interface defined in `interfaces/flow.py.`
 
 from __future__ import annotations
 
-from datetime import datetime
+import asyncio
+import functools
 import json
 import logging
-from typing import Any, Dict, List
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List
 
-import openai
+import httpx
 
-from capabilities import CapabilityRunner
+from capabilities import BACKGROUND_ARGUMENT, CapabilityRunner
+from core.jobs import CURRENT_OWNER, JOBS, JobException
+from core.progress import HOST_LISTENER
+from flow.aggregation import aggregate, expand
+from flow.digest import chunk, map_reduce
 from flow.exceptions import (
     LanguageException
 )
 from flow import NaturalLanguageProcessor
-from flow.schema import LanguageSettings, SenderType, UserMessage, BotMessage, Message, MessageSection, MessageType
+from flow.responses import RESPONSE_CACHE, CachedResponse
+from flow.selection import CapabilityIndex
+from flow.schema import (LanguageSettings, SenderType, UserMessage, BotMessage, Message, MessageSection, MessageType,
+                         ChatEvent, ChatEventType)
+from flow.tokens import TokenBudget, count_tokens, truncate
+from flow.transport import TRANSPORT, TransportException
 
 logger = logging.getLogger("uvicorn")
 
-API_URL = "https://api.openai.com/v1/chat/completions"
-AI_CHAT_MODEL_NAME = "gpt-3.5-turbo-16k-0613"
+AI_CHAT_MODEL_NAME = "gpt-3.5-turbo-1106"
+
+SUMMARY_PROMPT = """\
+Summarize the conversation below between a network engineer and NetGPT, an AI \
+assistant that runs commands on network devices. Carry on from the previous \
+summary, if there is one, so that the new summary replaces it. Keep the devices, \
+addresses, commands, findings and open questions that later turns may need, \
+including the facts found in device output. Leave out pleasantries. Write plain \
+text, as briefly as the content allows."""
+
+DIGEST_PROMPT = """\
+You are condensing part of the output of the {name} tool, called with {arguments}, \
+so that NetGPT can answer the network engineer's message: "{question}". Keep every \
+detail that bears on the message, along with hostnames, interfaces, addresses and \
+counts, and note anything abnormal. Leave out the rest. Write at most {tokens} \
+tokens of plain text."""
 
 
 class OpenAISettings(LanguageSettings):
@@ -43,10 +69,31 @@ RoleMappings = {
 }
 
 
+@dataclass
+class ChatTurn:
+    """
+    The ChatTurn class holds the state of one message being answered. It is
+    kept apart from the OpenAIFlow, so that one flow can answer many
+    messages at once.
+    """
+    message_history: List[Message] = field(default_factory=list)
+    summary: str = None
+    function_log: List[Any] = field(default_factory=list)
+
+    @property
+    def question(self) -> str:
+        """
+        The question prop returns the text of the user's latest message.
+        """
+        latest = next((m for m in reversed(self.message_history) if m.sender == SenderType.You), None)
+        return " ".join(s.content for s in latest.sections) if latest else ""
+
+
 class OpenAIFlow(NaturalLanguageProcessor):
     """
-    This OpenAIFlow uses the OpenAI Chat API and so it caches all the messages that
-    are sent to it.
+    This OpenAIFlow uses the OpenAI Chat API. It holds no state for any one
+    message, so a single instance may be shared by every request with the
+    same settings.
     """
 
     @classmethod
@@ -59,50 +106,78 @@ class OpenAIFlow(NaturalLanguageProcessor):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        openai.api_key = self.settings.fields["API Key"]
-        self.message_history = []
-        self.function_log = []
+        self.api_key = self.settings.fields["API Key"]
+        self.budget = TokenBudget(
+            model=AI_CHAT_MODEL_NAME,
+            context_tokens=self.configuration.context_tokens,
+            max_tokens=self.configuration.max_tokens,
+            recent_turns=self.configuration.recent_turns,
+            max_tool_output_tokens=self.configuration.max_tool_output_tokens,
+        )
+        self.index = CapabilityIndex(
+            self.runners,
+            max_runners=self.configuration.max_tools,
+            always_include=self.configuration.always_include_tools,
+        )
 
     def get_openai_parameters(self,
-                              message_history: List[Message] = None,
-                              runners: List[CapabilityRunner] = None) -> dict[str, Any]:
+                              turn: ChatTurn = None,
+                              runners: List[CapabilityRunner] = None,
+                              exchange: List[Dict[str, Any]] = None,
+                              tool_choice: str = None) -> dict[str, Any]:
         """
         The get_openai_parameters function creates the parameters that will be
-        sent to the OpenAI Chat API. Both the message_history and the runners
-        are optional parameters. If the message_history is not provided, then
-        the message_history is set to the message_history of the language. If
-        the runners are not provided, then the runners are set to the runners
-        of the language.
+        sent to the OpenAI Chat API. Both the turn and the runners are optional
+        parameters. If the turn is not provided, then no message history is
+        sent. If the runners are not provided, then the runners are set to the
+        runners of the language. The exchange holds the tool calls made so far
+        for the current message, and is sent after the history. Older messages,
+        and then the results of earlier tool calls, are compacted or dropped as
+        needed to keep the request within the token budget. A summary of the
+        conversation before the history is sent with the system prompt.
         """
         if runners is None:
             runners = self.runners
-        if message_history is None:
-            message_history = self.message_history
+        if turn is None:
+            turn = ChatTurn()
         message_history = [
             {
                 "content": "\n".join([section.content for section in message.sections]),
                 "role": RoleMappings[message.sender],
             }
-            for message in message_history
+            for message in turn.message_history
         ]
+        tools = [{"type": "function", "function": runner.__dict__()} for runner in runners]
+        system = self.configuration.prompt
+        if turn.summary:
+            system = f"{system}\n\nSummary of the conversation so far:\n{turn.summary}"
         params = {
             "model": AI_CHAT_MODEL_NAME,
-            "messages": [{"role": "system", "content": self.configuration.prompt}] + message_history,
-            "max_tokens": self.configuration.max_tokens,
+            "messages": self.budget.fit(
+                system={"role": "system", "content": system},
+                messages=message_history,
+                functions=tools,
+                tail=exchange,
+            ),
+            "max_tokens": self.budget.max_tokens,
             "stop": [],
             "temperature": self.configuration.temperature,
             "top_p": self.configuration.top_p,
             "n": 1,
         }
-        if len(runners) > 0:
-            params["functions"] = [runner.__dict__() for runner in runners]
+        if len(tools) > 0:
+            params["tools"] = tools
+            if tool_choice is not None:
+                params["tool_choice"] = tool_choice
         return params
 
-    def run(self, runner_name: str, arguments: str) -> str:
+    async def run(self, runner_name: str, arguments: str) -> Any:
         """
-        The run function executes a function from the list of available runners.
-        It will return a string of either plain text or JSON depending on the
-        function.
+        The run function executes a function from the list of available
+        runners. It will return either plain text or the per-host results of
+        the function, with hosts of matching output grouped together by
+        aggregate. A function asked to run in the background is submitted as a
+        job, and the job's id is returned instead.
         """
         func = next(
             (runner for runner in self.runners if runner.name == runner_name),
@@ -120,86 +195,336 @@ class OpenAIFlow(NaturalLanguageProcessor):
             raise LanguageException(
                 f"Sorry. I didn't understand the information needed."
             )
+        if function_params.pop(BACKGROUND_ARGUMENT, False) and func.capability.background:
+            try:
+                job = JOBS.submit(CURRENT_OWNER.get(), runner_name, function_params,
+                                  functools.partial(func.run_async, **function_params))
+            except JobException as e:
+                raise LanguageException(f"Sorry. I can't run that in the background. {e}")
+            return {"job_id": job.id, "state": job.state.value,
+                    "note": "The job is running in the background. Use get_job to check on it."}
         try:
-            output = func(**function_params)
+            output = await func.run_async(**function_params)
         except Exception as e:
             logger.error(str(e))
             raise LanguageException(
                 f"Sorry. I've experienced an error trying to perform the task."
             )
-        if isinstance(output, str):
-            return output
-        elif isinstance(output, dict):
-            return json.dumps(output, sort_keys=True)
+        return aggregate(output)
 
-    def chat(self, message_history: List[Message] = None, runners: List[CapabilityRunner] = None) -> Dict[str, Any]:
+    async def chat(self, turn: ChatTurn) -> AsyncIterator[ChatEvent]:
         """
-        The chat function sends a request to the OpenAI Chat API and returns
-        the OpenAI response.
+        The chat function runs the agent loop for the current message. Each
+        step streams a request to the OpenAI Chat API and yields the text of
+        the response as delta events. When the response asks for tool calls,
+        every call is run concurrently between tool_start and tool_finish
+        events, each result is yielded as a section, and the results are sent
+        back together in the next step. Once max_steps or max_seconds is
+        spent, the model is asked to answer without calling any more tools.
+
+        Only the tools most relevant to the user's message are offered. If
+        the model calls a tool that was not offered, every tool is offered
+        from the next step on. A step whose request was answered before is
+        replayed from the response cache.
         """
-        params = self.get_openai_parameters(
-            message_history=message_history,
-            runners=runners,
-        )
-        logger.info(f"Sending - {json.dumps(params, indent=4, sort_keys=True)}")
+        exchange: List[Dict[str, Any]] = []
+        started = time.monotonic()
+        offered = self.index.select(turn.question)
+        logger.info(f"Offering {len(offered)} of {len(self.runners)} tools: {[r.name for r in offered]}")
+        for step in range(self.configuration.max_steps + 1):
+            exhausted = (step == self.configuration.max_steps
+                         or time.monotonic() - started >= self.configuration.max_seconds)
+            params = self.get_openai_parameters(
+                turn=turn,
+                runners=offered,
+                exchange=exchange,
+                tool_choice="none" if exhausted else None,
+            )
+            logger.info(f"Sending step {step + 1} - {json.dumps(params, indent=4, sort_keys=True)}")
+            cacheable = RESPONSE_CACHE.cacheable(params)
+            response = RESPONSE_CACHE.get(params, self.api_key) if cacheable else None
+            if response is not None:
+                logger.info(f"Step {step + 1} was answered from the response cache.")
+                if response.content:
+                    yield ChatEvent(event=ChatEventType.delta, content=response.content)
+            else:
+                response = CachedResponse(content="")
+                async for event in self.complete(params, response):
+                    yield event
+                logger.info(f"Step {step + 1} used {response.completion_tokens} completion tokens.")
+                if response.finish_reason in ("length", "max_tokens"):
+                    logger.error("OpenAI has run out of tokens.")
+                    raise LanguageException(
+                        "Sorry. I've run out of tokens. Please try decreasing the scale of your request."
+                    )
+                if cacheable:
+                    RESPONSE_CACHE.set(params, self.api_key, response)
+            content, calls = response.content, response.calls
+            if not calls:
+                return
+            if any(call["name"] not in {runner.name for runner in offered} for call in calls):
+                logger.info("A tool that was not offered was called. Offering every tool.")
+                offered = self.runners
+            # Run every tool call of the step at once, reporting each device and each
+            # call as it finishes, then send the results back together.
+            for call in calls:
+                logger.info(f"Executing tool call - {call['name']}({call['arguments']})")
+                yield ChatEvent(event=ChatEventType.tool_start, call_id=call["id"], name=call["name"],
+                                content=call["arguments"])
+            outputs: Dict[int, Any] = {}
+            results: Dict[int, str] = {}
+            async for index, output, result, event in self.run_calls(turn, calls):
+                if event is not None:
+                    yield event
+                    continue
+                outputs[index] = output
+                results[index] = result
+                call = calls[index]
+                yield ChatEvent(event=ChatEventType.tool_finish, call_id=call["id"], name=call["name"])
+                yield ChatEvent(event=ChatEventType.section, call_id=call["id"], name=call["name"],
+                                section=MessageSection(
+                                    messageType=MessageType.code,
+                                    content=serialize(expand(output)),
+                                ))
+            exchange.append({
+                "role": "assistant",
+                "content": content or None,
+                "tool_calls": [
+                    {"id": call["id"], "type": "function",
+                     "function": {"name": call["name"], "arguments": call["arguments"]}}
+                    for call in calls
+                ],
+            })
+            for index, call in enumerate(calls):
+                turn.function_log.append(outputs[index])
+                exchange.append({
+                    "role": "tool",
+                    "tool_call_id": call["id"],
+                    "content": results[index],
+                })
+
+    async def run_calls(self, turn: ChatTurn,
+                        calls: List[Dict[str, Any]]) -> AsyncIterator[tuple[int, Any, str, ChatEvent]]:
+        """
+        The run_calls function runs the tool calls concurrently. As each device
+        a call reaches finishes, it yields a host event, and as each call
+        finishes, it yields the call's index, output and digested result. The
+        calls still running are cancelled if the caller stops listening.
+        """
+        loop = asyncio.get_running_loop()
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def run_call(index: int):
+            call = calls[index]
+
+            def on_host(host: str, error: str | None):
+                event = ChatEvent(event=ChatEventType.host, call_id=call["id"], name=call["name"], host=host,
+                                  content=error)
+                loop.call_soon_threadsafe(finished.put_nowait, (index, None, None, event))
+
+            HOST_LISTENER.set(on_host)
+            try:
+                output = await self.call(call["name"], call["arguments"])
+                result = await self.digest(turn, call["name"], call["arguments"], output)
+            except Exception as e:
+                finished.put_nowait((index, e, None, None))
+            else:
+                finished.put_nowait((index, output, result, None))
+
+        tasks = [asyncio.ensure_future(run_call(index)) for index in range(len(calls))]
         try:
-            r = openai.ChatCompletion.create(**params)
-        except openai.InvalidRequestError as e:
+            remaining = len(calls)
+            while remaining:
+                index, output, result, event = await finished.get()
+                if event is None:
+                    remaining -= 1
+                    if isinstance(output, Exception):
+                        raise output
+                yield index, output, result, event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def complete(self, params: Dict[str, Any], response: CachedResponse) -> AsyncIterator[ChatEvent]:
+        """
+        The complete function streams one request to the OpenAI Chat API,
+        yielding the text of the response as delta events and gathering the
+        whole response, including any tool calls, into the response.
+        """
+        content, calls = [], {}
+        try:
+            async for chunk in TRANSPORT.stream(params, api_key=self.api_key):
+                choice = chunk["choices"][0]
+                delta = choice.get("delta") or {}
+                if delta.get("content"):
+                    content.append(delta["content"])
+                    yield ChatEvent(event=ChatEventType.delta, content=delta["content"])
+                for tool_call in delta.get("tool_calls") or []:
+                    # Each tool call arrives in pieces, identified by its index.
+                    call = calls.setdefault(tool_call.get("index", 0), {"id": None, "name": None, "arguments": []})
+                    function = tool_call.get("function") or {}
+                    call["id"] = call["id"] or tool_call.get("id")
+                    call["name"] = call["name"] or function.get("name")
+                    call["arguments"].append(function.get("arguments") or "")
+                response.finish_reason = choice.get("finish_reason") or response.finish_reason
+        except TransportException as e:
             logger.error(str(e))
+            if e.status_code is not None and e.status_code < 500 and e.status_code != 429:
+                raise LanguageException(
+                    "Sorry. I've experienced an error trying to understand your message."
+                )
             raise LanguageException(
-                "Sorry. I've experienced an error trying to understand your message."
+                "Sorry. I'm having trouble reaching my language model. Please try again shortly."
             )
-        if r["choices"][0]["finish_reason"] == "max_tokens":
-            logger.error("OpenAI has run out of tokens.")
+        except httpx.HTTPError as e:
+            logger.error(f"The completion stream was interrupted: {e}")
             raise LanguageException(
-                "Sorry. I've run out of tokens. Please try decreasing the scale of your request."
+                "Sorry. I'm having trouble reaching my language model. Please try again shortly."
             )
-        response_message = r["choices"][0]["message"]
-        if "function_call" not in response_message:
-            return r
-        # If the message is a function call, then we need to execute the function.
-        # Then make a new request to the AI with the output of the function to
-        # get the response.
-        logger.info("Executing function call - " + str(response_message))
-        function_output = self.run(
-            runner_name=response_message["function_call"]["name"],
-            arguments=response_message["function_call"]["arguments"],
-        )
-        self.function_log.append(function_output)
-        # Recursively call the chat function with the output of the function.
-        # We remove the available functions so that we don't get stuck in a loop.
-        r = self.chat(
-            message_history=self.message_history + [Message(
-                sender=SenderType.NetGPT,
-                sections=[
-                    MessageSection(
-                        messageType=MessageType.code,
-                        content=function_output,
-                    )
+        response.content = "".join(content)
+        response.calls = [dict(calls[index], arguments="".join(calls[index]["arguments"])) for index in sorted(calls)]
+        response.prompt_tokens = count_tokens(json.dumps(params["messages"]) + json.dumps(params.get("tools", [])),
+                                              AI_CHAT_MODEL_NAME)
+        response.completion_tokens = count_tokens(
+            response.content + "".join(call["arguments"] for call in response.calls), AI_CHAT_MODEL_NAME)
+
+    async def digest(self, turn: ChatTurn, runner_name: str, arguments: str, output: Any) -> str:
+        """
+        The digest function returns the output of a tool call as it is sent
+        back to the OpenAI Chat API. Output over the tool output budget is
+        split into chunks that are summarized concurrently, with the user's
+        message in mind, and then combined into one digest. The full output
+        is still shown to the user in the code sections of the BotMessage.
+        Output that would take more than digest_max_chunks chunks, or that
+        cannot be summarized, is truncated instead.
+        """
+        text = serialize(output)
+        tokens = count_tokens(text, AI_CHAT_MODEL_NAME)
+        if tokens <= self.configuration.max_tool_output_tokens or self.configuration.digest_chunk_tokens <= 0:
+            return self.budget.tool_output(text)
+        chunks = chunk(output, self.configuration.digest_chunk_tokens, AI_CHAT_MODEL_NAME)
+        if len(chunks) > self.configuration.digest_max_chunks:
+            logger.info(f"Output of {runner_name} is {len(chunks)} chunks, too many to digest. Truncating it.")
+            return self.budget.tool_output(text)
+
+        async def summarize(part: str, max_tokens: int) -> str:
+            params = {
+                "model": AI_CHAT_MODEL_NAME,
+                "messages": [
+                    {"role": "system", "content": DIGEST_PROMPT.format(
+                        name=runner_name, arguments=arguments, question=turn.question, tokens=max_tokens)},
+                    {"role": "user", "content": part},
                 ],
-                timestamp=int(datetime.now().timestamp()),
-            )],
-            runners=[],
-        )
-        return r
+                "max_tokens": max_tokens,
+                "temperature": 0,
+                "n": 1,
+            }
+            response = await TRANSPORT.create(params, api_key=self.api_key)
+            return response["choices"][0]["message"].get("content") or ""
+
+        started = time.monotonic()
+        try:
+            digest = await map_reduce(chunks, summarize, self.configuration.max_tool_output_tokens,
+                                      AI_CHAT_MODEL_NAME, parallelism=self.configuration.digest_parallelism)
+        except (TransportException, httpx.HTTPError, KeyError) as e:
+            logger.error(f"Output of {runner_name} could not be digested: {e}")
+            return self.budget.tool_output(text)
+        logger.info(f"Digested {tokens} tokens of output from {runner_name} in {len(chunks)} chunks "
+                    f"in {time.monotonic() - started:.2f}s.")
+        return f"[Digest of {tokens} tokens of output in {len(chunks)} parts. The user sees the full output.]\n{digest}"
 
-    def request_response(self, message: UserMessage) -> BotMessage:
+    async def call(self, runner_name: str, arguments: str) -> Any:
         """
-        The request_response function processes a message from the user and returns
-        a BotMessage response. If the language raises an exception, the exception is
-        caught and returned as a BotMessage indicating an error.
+        The call function runs a tool call for the agent loop. A call that
+        fails returns its error, so that the other calls of the step still
+        complete and the model can decide what to do about the failure.
         """
-        self.message_history = message.message_history
-        r = self.chat()
-        return BotMessage.filled(
+        try:
+            return await self.run(runner_name=runner_name, arguments=arguments)
+        except LanguageException as e:
+            return {"error": e.message}
+
+    async def stream_response(self, message: UserMessage) -> AsyncIterator[ChatEvent]:
+        """
+        The stream_response function processes a message from the user and
+        yields the ChatEvents of the response as they happen. The last event
+        carries the BotMessage, with a code section for each function that was
+        run followed by the text of the final answer.
+        """
+        turn = ChatTurn(message_history=message.message_history, summary=message.summary)
+        answer = []
+        async for event in self.chat(turn):
+            if event.event == ChatEventType.tool_start:
+                # Only the text written after the last function call is the answer.
+                answer = []
+            elif event.event == ChatEventType.delta:
+                answer.append(event.content)
+            yield event
+        yield ChatEvent(event=ChatEventType.message, message=BotMessage.filled(
             sections=[
                          MessageSection(
                              messageType=MessageType.code,
-                             content=codeSection,
-                         ) for codeSection in self.function_log] + [
+                             content=serialize(expand(codeSection)),
+                         ) for codeSection in turn.function_log] + [
                          MessageSection(
                              messageType=MessageType.text,
-                             content=str(r["choices"][0]["message"]["content"]),
+                             content="".join(answer),
                          ),
                      ]
-        )
+        ))
+
+    async def request_response(self, message: UserMessage) -> BotMessage:
+        """
+        The request_response function processes a message from the user and
+        returns a BotMessage response once the response has been completely
+        produced.
+        """
+        bot_message = None
+        async for event in self.stream_response(message):
+            if event.event == ChatEventType.message:
+                bot_message = event.message
+        return bot_message
+
+    async def summarize(self, summary: str | None, messages: List[Message]) -> str | None:
+        """
+        The summarize function asks the OpenAI Chat API for a summary of the
+        messages that carries on from the previous summary. Device output is
+        shortened to the summary's length first, since only its findings need
+        to be kept.
+        """
+        transcript = []
+        for message in messages:
+            content = "\n".join(
+                truncate(section.content, self.configuration.summary_tokens, AI_CHAT_MODEL_NAME)
+                if section.messageType == MessageType.code else section.content
+                for section in message.sections
+            )
+            transcript.append(f"{RoleMappings[message.sender]}: {content}")
+        if summary:
+            transcript.insert(0, f"Previous summary:\n{summary}")
+        params = {
+            "model": AI_CHAT_MODEL_NAME,
+            "messages": [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": "\n\n".join(transcript)},
+            ],
+            "max_tokens": self.configuration.summary_tokens,
+            "temperature": 0,
+            "n": 1,
+        }
+        try:
+            response = await TRANSPORT.create(params, api_key=self.api_key)
+        except (TransportException, httpx.HTTPError) as e:
+            logger.error(f"The conversation could not be summarized: {e}")
+            return None
+        return response["choices"][0]["message"].get("content") or None
+
+
+def serialize(output: Any) -> str:
+    """
+    The serialize function renders the output of a function as a string of
+    either plain text or JSON.
+    """
+    if isinstance(output, str):
+        return output
+    return json.dumps(output, sort_keys=True)
@@ -0,0 +1,150 @@
+"""
+The Responses module caches the language model's responses. A request is
+identified by a hash of everything that shapes its response: the model, the
+messages with their whitespace normalized, the tool schemas and the sampling
+parameters, along with a fingerprint of the API key, so that a response is
+only replayed to callers with the same key. Sampled responses are not meant
+to repeat, so requests with a temperature above zero are never cached.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from pydantic import BaseModel
+
+from clients.pool import credential_fingerprint
+from core.cache import CacheCore
+from environment import ResponseCacheServerInformation
+
+# The request parameters that change the response.
+KEY_PARAMETERS = ("model", "max_tokens", "stop", "temperature", "top_p", "n", "tool_choice")
+
+
+@dataclass
+class CachedResponse:
+    """
+    The CachedResponse class holds a complete response from the language
+    model along with the tokens it took to produce.
+    """
+    content: str
+    calls: List[Dict[str, Any]] = field(default_factory=list)
+    finish_reason: str = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class ResponseCacheStatistics(BaseModel):
+    """
+    The ResponseCacheStatistics class defines a model for the counters kept by
+    a ResponseCache.
+    """
+    hits: int = 0
+    misses: int = 0
+    skipped: int = 0
+    hit_rate: float = 0.0
+    entries: int = 0
+    size_bytes: int = 0
+    tokens_saved: int = 0
+    dollars_saved: float = 0.0
+
+
+class ResponseCache:
+    """
+    The ResponseCache class stores responses in a CacheCore and counts the
+    tokens, and the dollars at the configured prices, that its hits saved.
+    """
+
+    def __init__(self, information: ResponseCacheServerInformation):
+        self.information = information
+        self._cache = CacheCore(ttl=information.ttl, max_entries=information.max_entries,
+                                max_bytes=information.max_bytes)
+        self._lock = threading.Lock()
+        self._skipped = 0
+        self._tokens_saved = 0
+        self._dollars_saved = 0.0
+
+    @classmethod
+    def from_config(cls) -> ResponseCache:
+        """
+        The from_config method creates a ResponseCache from the response_cache
+        section of the configuration file.
+        """
+        return cls(ResponseCacheServerInformation.load())
+
+    def cacheable(self, params: Dict[str, Any]) -> bool:
+        """
+        The cacheable method returns whether responses to the request may be
+        cached, counting the requests that may not.
+        """
+        if self.information.enabled and (params.get("temperature") or 0) <= 0:
+            return True
+        with self._lock:
+            self._skipped += 1
+        return False
+
+    def get(self, params: Dict[str, Any], api_key: str) -> CachedResponse | None:
+        """
+        The get method returns the cached response to the request made with
+        the API key, if any.
+        """
+        response = self._cache.get(request_key(params, api_key))
+        if response is not None:
+            with self._lock:
+                self._tokens_saved += response.prompt_tokens + response.completion_tokens
+                self._dollars_saved += (response.prompt_tokens * self.information.prompt_price
+                                        + response.completion_tokens * self.information.completion_price) / 1000
+        return response
+
+    def set(self, params: Dict[str, Any], api_key: str, response: CachedResponse):
+        """
+        The set method caches the response to the request made with the API
+        key.
+        """
+        self._cache.set(request_key(params, api_key), response)
+
+    def statistics(self) -> ResponseCacheStatistics:
+        """
+        The statistics method returns a snapshot of the cache's counters.
+        """
+        cache = self._cache.statistics()
+        with self._lock:
+            return ResponseCacheStatistics(
+                hits=cache.hits,
+                misses=cache.misses,
+                skipped=self._skipped,
+                hit_rate=cache.hit_rate,
+                entries=cache.entries,
+                size_bytes=cache.size_bytes,
+                tokens_saved=self._tokens_saved,
+                dollars_saved=round(self._dollars_saved, 6),
+            )
+
+
+def request_key(params: Dict[str, Any], api_key: str) -> str:
+    """
+    The request_key function returns the hash identifying a request made with
+    the API key. Runs of whitespace in the messages are collapsed, and the
+    tools are sorted by name, so that requests differing only in layout share
+    a key.
+    """
+    messages = [
+        dict(message, content=" ".join(message["content"].split()))
+        if isinstance(message.get("content"), str) else message
+        for message in params.get("messages", [])
+    ]
+    tools = sorted(params.get("tools", []), key=lambda tool: tool.get("function", {}).get("name", ""))
+    canonical = {
+        "credentials": credential_fingerprint(api_key),
+        "messages": messages,
+        "tools": tools,
+        **{name: params.get(name) for name in KEY_PARAMETERS},
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+RESPONSE_CACHE = ResponseCache.from_config()
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import datetime
+import os
 from abc import ABC, abstractmethod
 from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from pydantic import BaseModel, Field
 from yaml import safe_load
@@ -47,16 +48,39 @@ class ChatConfiguration(BaseModel):
     max_tokens: int
     temperature: float
     top_p: float
+    context_tokens: int = 16384
+    recent_turns: int = 6
+    max_tool_output_tokens: int = 2000
+    max_steps: int = 5
+    max_seconds: float = 120.0
+    max_tools: int = 8
+    always_include_tools: List[str] = Field(default_factory=list)
+    summarize_after: int = 16
+    summary_tokens: int = 512
+    digest_chunk_tokens: int = 4000
+    digest_parallelism: int = 4
+    digest_max_chunks: int = 32
 
     @classmethod
     def load_configuration(cls, config_file: Path):
         """
         The load_configuration method loads the configuration from the
-        specified file.
+        specified file. The parsed configuration is reused until the file is
+        modified.
         """
+        modified = os.stat(config_file).st_mtime_ns
+        cached = _configurations.get(config_file)
+        if cached is not None and cached[0] == modified:
+            return cached[1]
         with open(config_file, "r") as f:
             config = safe_load(f.read())
-            return cls(**config)
+            configuration = cls(**config)
+        _configurations[config_file] = (modified, configuration)
+        return configuration
+
+
+# The ChatConfigurations loaded so far, by file, with the file's modification time.
+_configurations: Dict[Path, Tuple[int, ChatConfiguration]] = {}
 
 
 class LanguageSettings(BaseModel):
@@ -81,16 +105,31 @@ class UserMessage(BaseModel):
     """
     The UserMessage class defines a model for a message that is received from
     a user. The message contains the message message_history, the connection parameters,
-    and the language settings.
+    and the language settings. The summary, if any, condenses the messages that
+    came before the message_history.
     """
     message_history: List[Message]
     network_settings: NetworkSettings
     language_settings: LanguageSettings
-    plugin_list: PluginList = None
+    plugin_list: Optional[PluginList] = None
+    summary: Optional[str] = None
+
+
+class SessionMessage(BaseModel):
+    """
+    The SessionMessage class defines a model for a message that is received
+    from a user in a session kept on the server. Only the new message is
+    sent, since the session already holds the message history.
+    """
+    message: Message
+    network_settings: NetworkSettings
+    language_settings: LanguageSettings
+    plugin_list: Optional[PluginList] = None
 
 
 class BotMessage(Message):
     caption: str = None
+    session_id: Optional[str] = None
 
     @classmethod
     def quick(cls, message_type: MessageType, content: str, **kwargs):
@@ -122,6 +161,56 @@ class BotMessage(Message):
         )
 
 
+class ChatEventType(str, Enum):
+    delta = "delta"
+    tool_start = "tool_start"
+    tool_finish = "tool_finish"
+    section = "section"
+    message = "message"
+    host = "host"
+
+
+class ChatEvent(BaseModel):
+    """
+    The ChatEvent class defines a model for one step of a streamed response.
+    A delta carries the next piece of the answer's text, the tool events
+    name the capability being run, a host event names a device the tool
+    has finished with, carrying its error if it failed, a section carries a
+    finished device result, and the last event carries the complete
+    BotMessage. Tool calls run concurrently, so their events are matched up
+    by call_id.
+    """
+    event: ChatEventType
+    content: Optional[str] = None
+    call_id: Optional[str] = None
+    name: Optional[str] = None
+    host: Optional[str] = None
+    section: Optional[MessageSection] = None
+    message: Optional[BotMessage] = None
+
+
+class ChatFrameType(str, Enum):
+    start = "start"
+    message = "message"
+    cancel = "cancel"
+
+
+class ChatFrame(BaseModel):
+    """
+    The ChatFrame class defines a model for a frame sent by a client over a
+    chat WebSocket. A start frame gives the settings of the chat and either
+    resumes the session with the session_id or starts a new one. A message
+    frame carries the user's new message, and a cancel frame stops the
+    response being produced.
+    """
+    type: ChatFrameType
+    session_id: Optional[str] = None
+    message: Optional[Message] = None
+    network_settings: Optional[NetworkSettings] = None
+    language_settings: Optional[LanguageSettings] = None
+    plugin_list: Optional[PluginList] = None
+
+
 class Alias(BaseModel):
     name: str
     value: str
@@ -189,8 +278,24 @@ class NaturalLanguageProcessor(ABC):
         ...
 
     @abstractmethod
-    def request_response(self, message: UserMessage) -> BotMessage:
+    async def request_response(self, message: UserMessage) -> BotMessage:
         """
         The requestMessage method requests a message from the AI.
         """
         ...
+
+    async def summarize(self, summary: str | None, messages: List[Message]) -> str | None:
+        """
+        The summarize method returns a summary of the messages that carries on
+        from the previous summary. Languages that cannot summarize return None,
+        and their conversations are not compacted.
+        """
+        return None
+
+    async def stream_response(self, message: UserMessage) -> AsyncIterator[ChatEvent]:
+        """
+        The stream_response method requests a message from the AI and yields
+        ChatEvents as the response is produced, ending with the complete
+        BotMessage. Languages that cannot stream yield only the final message.
+        """
+        yield ChatEvent(event=ChatEventType.message, message=await self.request_response(message))
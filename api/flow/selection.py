@@ -0,0 +1,106 @@
+"""
+The Selection module chooses which capabilities are offered to the language
+for a message. Every capability's schema adds to the prompt, so rather than
+offering them all, the capabilities are ranked against the user's message
+with BM25 over their names, descriptions and properties, and only the most
+relevant are sent. The index is built locally and needs no model or network.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+from capabilities import CapabilityRunner
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from", "how", "i", "in", "is", "it",
+    "me", "my", "of", "on", "or", "please", "that", "the", "this", "to", "what", "when", "which", "with", "you",
+))
+
+# BM25 term frequency saturation and document length normalization.
+K1 = 1.5
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    The tokenize function splits text into lowercase terms, dropping stop
+    words and a trailing plural "s" so that "neighbors" matches "neighbor".
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text.lower().replace("_", " ")):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class CapabilityIndex:
+    """
+    The CapabilityIndex class ranks capability runners by their relevance to
+    a piece of text. The always_include runners are offered whatever the
+    text, and every runner is offered when nothing in the text matches.
+    """
+
+    def __init__(self, runners: List[CapabilityRunner], max_runners: int = 8,
+                 always_include: Iterable[str] = ()):
+        self.runners = runners
+        self.max_runners = max_runners
+        self.always_include = set(always_include)
+        self._terms: List[Counter] = [Counter(tokenize(self._document(runner))) for runner in runners]
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        frequencies = Counter(term for terms in self._terms for term in terms)
+        count = len(runners)
+        self._idf: Dict[str, float] = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in frequencies.items()
+        }
+
+    def select(self, text: str) -> List[CapabilityRunner]:
+        """
+        The select method returns the runners to offer for the text, in their
+        original order. A max_runners of zero or less offers every runner.
+        """
+        if self.max_runners <= 0 or len(self.runners) <= self.max_runners:
+            return self.runners
+        scores = self.scores(text)
+        ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+        if not ranked:
+            return self.runners
+        chosen = set(ranked[:self.max_runners])
+        chosen |= {i for i, runner in enumerate(self.runners) if runner.name in self.always_include}
+        return [runner for i, runner in enumerate(self.runners) if i in chosen]
+
+    def scores(self, text: str) -> List[float]:
+        """
+        The scores method returns the BM25 score of every runner for the text.
+        """
+        query = set(tokenize(text))
+        scores = []
+        for terms, length in zip(self._terms, self._lengths):
+            score = 0.0
+            for term in query:
+                frequency = terms.get(term, 0)
+                if frequency:
+                    norm = K1 * (1 - B + B * length / self._average_length)
+                    score += self._idf[term] * frequency * (K1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+    @staticmethod
+    def _document(runner: CapabilityRunner) -> str:
+        """
+        The _document method returns the text a runner is indexed by.
+        """
+        parts = [runner.name, runner.description or ""]
+        for name, prop in (runner.capability.properties or {}).items():
+            parts += [name, prop.description or "", " ".join(prop.enum or [])]
+        return " ".join(parts)
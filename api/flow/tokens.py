@@ -0,0 +1,233 @@
+"""
+The Tokens module keeps the messages sent to a language within its context
+window. Tokens are counted locally with tiktoken where it and its encoding
+files are available, and estimated from the length of the text where not. The
+TokenBudget keeps the most recent turns of a chat verbatim and compacts, and
+then drops, the older turns until the request fits.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger("uvicorn")
+
+# Tokens added by the chat format around every message, and once to prime the reply.
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+# Characters per token assumed when tiktoken or its encoding is not available.
+CHARACTERS_PER_TOKEN = 4
+
+# Tokens an older turn is compacted to before it is dropped altogether.
+COMPACTED_TURN_TOKENS = 128
+
+# Tokens a tool result is never compacted below, even to fit the latest tool calls.
+MIN_TOOL_RESULT_TOKENS = 32
+
+# The most tokens that models generate in one reply, where that is less than their context window.
+COMPLETION_LIMITS = {
+    "gpt-3.5-turbo-1106": 4096,
+    "gpt-3.5-turbo-0125": 4096,
+    "gpt-4-1106-preview": 4096,
+    "gpt-4-turbo": 4096,
+}
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Any:
+    """
+    The get_encoding function returns the tiktoken encoding for the model, or
+    None if tiktoken is not installed. tiktoken downloads an encoding's files
+    on first use, so None is also returned, and tokens are estimated for the
+    life of the process, if they cannot be loaded, such as when offline.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Token counts for {model} are estimated, since its encoding could not be loaded: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    The count_tokens function returns the number of tokens in the text.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate(text: str, max_tokens: int, model: str) -> str:
+    """
+    The truncate function shortens the text to about max_tokens tokens. The
+    start and the end of the text are kept, since both tend to matter in
+    command output, and a marker says how much was left out. The marker is
+    counted within max_tokens.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        tokens = text
+        scale = CHARACTERS_PER_TOKEN
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        scale = 1
+    if len(tokens) <= max_tokens * scale:
+        return text
+    marker = f"\n[... {count_tokens(text, model) - max_tokens} tokens omitted ...]\n"
+    keep = max(0, max_tokens - count_tokens(marker, model)) * scale
+    head, tail = tokens[:keep * 3 // 4], tokens[len(tokens) - keep // 4:]
+    if encoding is not None:
+        head, tail = encoding.decode(head), encoding.decode(tail)
+    return f"{head}{marker}{tail}"
+
+
+class TokenBudget:
+    """
+    The TokenBudget class fits a chat request into the context window of a
+    model. The window is shared by the prompt and the max_tokens of the
+    reply, which is clamped to the most the model will generate. The last
+    recent_turns messages are kept verbatim where possible, and no tool
+    output may take more than max_tool_output_tokens.
+    """
+
+    def __init__(self, model: str, context_tokens: int, max_tokens: int, recent_turns: int,
+                 max_tool_output_tokens: int):
+        limit = COMPLETION_LIMITS.get(model)
+        if limit is not None and max_tokens > limit:
+            logger.warning(f"max_tokens of {max_tokens} is over the {limit} that {model} generates, using {limit}.")
+            max_tokens = limit
+        self.model = model
+        self.context_tokens = context_tokens
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.max_tool_output_tokens = max_tool_output_tokens
+
+    @property
+    def prompt_tokens(self) -> int:
+        """
+        The prompt_tokens prop returns the number of tokens left for the prompt.
+        """
+        return self.context_tokens - self.max_tokens
+
+    def count(self, message: Dict[str, Any]) -> int:
+        """
+        The count method returns the number of tokens a message takes.
+        """
+        tokens = TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "", self.model)
+        if message.get("tool_calls"):
+            tokens += count_tokens(json.dumps(message["tool_calls"]), self.model)
+        return tokens
+
+    def tool_output(self, output: str) -> str:
+        """
+        The tool_output method shortens the output of a tool to the tool output
+        budget.
+        """
+        return truncate(output, self.max_tool_output_tokens, self.model)
+
+    def fit(self, system: Dict[str, Any], messages: List[Dict[str, Any]],
+            functions: List[Dict[str, Any]] = None, tail: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        The fit method returns the system message and as many of the messages
+        as fit in the prompt budget, followed by the tail. Turns older than
+        the recent turns are compacted first and then dropped, oldest first.
+        If the recent turns still do not fit, they are compacted too, though
+        the latest message is always kept as it is.
+
+        The tail holds the steps of tool calls made for the latest message,
+        each an assistant message and the results of its calls, which must be
+        sent together. If the tail does not fit, the results of the earlier
+        steps are compacted, then those steps are dropped, oldest first, and
+        as a last resort the results of the latest step share what is left.
+        """
+        fixed = self.count(system) + TOKENS_PER_REPLY
+        if functions:
+            fixed += count_tokens(json.dumps(functions), self.model)
+        messages = list(messages)
+        counts = [self.count(message) for message in messages]
+        steps = _steps(tail or [])
+        step_counts = [[self.count(message) for message in step] for step in steps]
+        before = fixed + sum(counts) + sum(map(sum, step_counts))
+        compacted = dropped = 0
+        older = max(0, len(messages) - self.recent_turns)
+
+        def used() -> int:
+            return fixed + sum(counts) + sum(map(sum, step_counts))
+
+        def over() -> bool:
+            return used() > self.prompt_tokens
+
+        def compact(index: int):
+            nonlocal compacted
+            content = truncate(messages[index].get("content") or "", COMPACTED_TURN_TOKENS, self.model)
+            messages[index] = dict(messages[index], content=content)
+            counts[index] = self.count(messages[index])
+            compacted += 1
+
+        def compact_results(step: int, tokens: int):
+            nonlocal compacted
+            for index, message in enumerate(steps[step]):
+                if message.get("role") == "tool" and step_counts[step][index] > tokens + TOKENS_PER_MESSAGE:
+                    steps[step][index] = dict(message, content=truncate(message.get("content") or "", tokens,
+                                                                          self.model))
+                    step_counts[step][index] = self.count(steps[step][index])
+                    compacted += 1
+
+        for index in range(older):
+            if not over():
+                break
+            compact(index)
+        while older > 0 and over():
+            messages.pop(0)
+            counts.pop(0)
+            older -= 1
+            dropped += 1
+        for index in range(older, len(messages) - 1):
+            if not over():
+                break
+            compact(index)
+        for step in range(len(steps) - 1):
+            if not over():
+                break
+            compact_results(step, COMPACTED_TURN_TOKENS)
+        while len(steps) > 1 and over():
+            steps.pop(0)
+            step_counts.pop(0)
+            dropped += 1
+        if steps and over():
+            results = [index for index, message in enumerate(steps[-1]) if message.get("role") == "tool"]
+            if results:
+                spare = self.prompt_tokens - used() + sum(step_counts[-1][index] for index in results)
+                share = max(MIN_TOOL_RESULT_TOKENS, spare // len(results) - TOKENS_PER_MESSAGE)
+                compact_results(len(steps) - 1, share)
+        logger.info(f"Prompt uses {used()} of {self.prompt_tokens} tokens ({before} before fitting, "
+                    f"{compacted} messages compacted, {dropped} dropped).")
+        return [system] + messages + [message for step in steps for message in step]
+
+
+def _steps(tail: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    The _steps function groups the tail into steps, each starting with the
+    assistant message that made the tool calls answered by the results after it.
+    """
+    steps: List[List[Dict[str, Any]]] = []
+    for message in tail:
+        if message.get("role") != "tool" or not steps:
+            steps.append([])
+        steps[-1].append(message)
+    return steps
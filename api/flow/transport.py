@@ -0,0 +1,252 @@
+"""
+The Transport module defines the HTTP client that the language flows use to
+reach a chat completion API. A single pooled httpx.AsyncClient is shared by
+every chat in the process, so connections are kept alive between requests,
+and the API key is sent with each request rather than set globally. Requests
+rejected with 429 or a 5xx status are retried with jittered exponential
+backoff, and a second, hedged request can be sent when the first is slow to
+answer.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from environment import TransportServerInformation
+
+try:
+    # httpx needs h2 installed to speak HTTP/2.
+    import h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger("uvicorn")
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TransportException(Exception):
+    """
+    A TransportException is raised when the completion API rejects a request
+    or cannot be reached after every retry.
+    """
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TransportStatistics(BaseModel):
+    """
+    The TransportStatistics class defines a model for the counters kept by a
+    CompletionTransport.
+    """
+    requests: int = 0
+    retries: int = 0
+    hedges: int = 0
+    hedges_won: int = 0
+    failures: int = 0
+
+
+class CompletionTransport:
+    """
+    The CompletionTransport class sends requests to a chat completion API.
+    The HTTP client is created on first use, so that it belongs to the event
+    loop serving the requests.
+    """
+
+    def __init__(self, information: TransportServerInformation):
+        self.information = information
+        self.statistics = TransportStatistics()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_config(cls) -> CompletionTransport:
+        """
+        The from_config method creates a CompletionTransport from the
+        transport section of the configuration file.
+        """
+        return cls(TransportServerInformation.load())
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The client prop returns the shared HTTP client, creating it if needed.
+        """
+        if self._client is None or self._client.is_closed:
+            http2 = self.information.http2 and HTTP2_AVAILABLE
+            if self.information.http2 and not HTTP2_AVAILABLE:
+                logger.warning("The h2 package is not installed. Using HTTP/1.1 for the completion API.")
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                timeout=httpx.Timeout(self.information.read_timeout, connect=self.information.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.information.max_connections,
+                    max_keepalive_connections=self.information.max_keepalive_connections,
+                ),
+            )
+        return self._client
+
+    async def create(self, params: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+        """
+        The create method sends a completion request and returns the decoded
+        response.
+        """
+        response = await self._open(dict(params, stream=False), api_key)
+        try:
+            await response.aread()
+            return response.json()
+        finally:
+            await response.aclose()
+
+    async def stream(self, params: Dict[str, Any], api_key: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        The stream method sends a streamed completion request and yields each
+        chunk of the response as it arrives. Requests are only retried until
+        the response starts.
+        """
+        response = await self._open(dict(params, stream=True), api_key)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        """
+        The aclose method closes the shared HTTP client and its connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _open(self, body: Dict[str, Any], api_key: str) -> httpx.Response:
+        """
+        The _open method sends the request, retrying with backoff, and returns
+        the first successful response with its body not yet read.
+        """
+        self.statistics.requests += 1
+        error = None
+        for attempt in range(self.information.max_retries + 1):
+            if attempt > 0:
+                self.statistics.retries += 1
+            retry_after = None
+            try:
+                response = await self._hedged(body, api_key)
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code < 400:
+                    return response
+                await response.aread()
+                await response.aclose()
+                error = f"{response.status_code}: {_error_message(response)}"
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.statistics.failures += 1
+                    raise TransportException(error, status_code=response.status_code)
+                retry_after = _retry_after(response)
+            if attempt < self.information.max_retries:
+                # Full jitter keeps the retries of many concurrent chats from arriving together.
+                delay = random.uniform(0, min(self.information.max_backoff, self.information.backoff * 2 ** attempt))
+                delay = max(delay, retry_after or 0.0)
+                logger.warning(f"Completion request failed ({error}). Retrying in {delay:.2f}s.")
+                await asyncio.sleep(delay)
+        self.statistics.failures += 1
+        raise TransportException(f"The completion API could not be reached: {error}")
+
+    async def _hedged(self, body: Dict[str, Any], api_key: str) -> httpx.Response:
+        """
+        The _hedged method sends the request and, if no response has started
+        within hedge_after seconds, sends it again. Whichever request answers
+        first is used and the other is cancelled.
+        """
+        if self.information.hedge_after <= 0:
+            return await self._send(body, api_key)
+        first = asyncio.ensure_future(self._send(body, api_key))
+        done, _ = await asyncio.wait({first}, timeout=self.information.hedge_after)
+        if done:
+            return first.result()
+        self.statistics.hedges += 1
+        second = asyncio.ensure_future(self._send(body, api_key))
+        pending = {first, second}
+        result = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRY_STATUS_CODES:
+                        if task is second:
+                            self.statistics.hedges_won += 1
+                        for other in pending | (done - {task}) | ({result} if result else set()):
+                            other.cancel()
+                            other.add_done_callback(_discard)
+                        return task.result()
+                    if result is not None:
+                        _discard(result)
+                    result = task
+        except asyncio.CancelledError:
+            for task in (first, second):
+                task.cancel()
+                task.add_done_callback(_discard)
+            raise
+        return result.result()
+
+    async def _send(self, body: Dict[str, Any], api_key: str) -> httpx.Response:
+        """
+        The _send method sends the request once and returns the response as
+        soon as its headers arrive.
+        """
+        request = self.client.build_request(
+            "POST",
+            self.information.api_url,
+            json=body,
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        return await self.client.send(request, stream=True)
+
+
+def _discard(task: asyncio.Future):
+    """
+    The _discard function closes the response of a request that lost a hedge.
+    """
+    if task.cancelled() or task.exception() is not None:
+        return
+    asyncio.ensure_future(task.result().aclose())
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    """
+    The _retry_after function returns the delay asked for by a Retry-After
+    header given in seconds.
+    """
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_message(response: httpx.Response) -> str:
+    """
+    The _error_message function returns the error message of a failed
+    response from the body the API sent with it.
+    """
+    try:
+        return response.json()["error"]["message"]
+    except Exception:
+        return response.text[:200]
+
+
+TRANSPORT = CompletionTransport.from_config()
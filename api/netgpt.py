@@ -8,10 +8,15 @@ import sys
 import fastapi
 from fastapi.middleware.cors import CORSMiddleware
 
+from clients.schema import SESSION_POOL
+from core.engine import EXECUTION_ENGINE
 from environment import NetGPTServerInformation
+from flow.transport import TRANSPORT
 from routes.chat import ChatRouter
+from routes.jobs import JobsRouter
 from routes.security import AuthRouter
 from routes.setting import SettingsRouter
+from routes.status import StatusRouter
 
 logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
 
@@ -22,6 +27,8 @@ application = fastapi.FastAPI()
 application.include_router(ChatRouter)
 application.include_router(SettingsRouter)
 application.include_router(AuthRouter)
+application.include_router(StatusRouter)
+application.include_router(JobsRouter)
 
 application.add_middleware(
     CORSMiddleware,
@@ -30,3 +37,30 @@ application.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+
+@application.on_event("startup")
+def start_execution_engine():
+    """
+    Start the execution engine's worker processes, if it has any, before the
+    first request.
+    """
+    EXECUTION_ENGINE.start()
+
+
+@application.on_event("shutdown")
+def close_device_sessions():
+    """
+    Close the pooled device sessions and stop the execution engine when the
+    service shuts down.
+    """
+    SESSION_POOL.close_all()
+    EXECUTION_ENGINE.shutdown()
+
+
+@application.on_event("shutdown")
+async def close_language_transport():
+    """
+    Close the connections to the language model's API when the service shuts down.
+    """
+    await TRANSPORT.aclose()
@@ -9,11 +9,13 @@ from __future__ import annotations
 from typing import List, Type
 
 from plugins.schema import Plugin
+from plugins.jobs import JobsPlugin
 from plugins.pings import PingsPlugin
 
 # Official list of supported plugins.
 _plugins: List[Type[Plugin]] = [
     PingsPlugin,
+    JobsPlugin,
 ]
 
 
@@ -0,0 +1,91 @@
+"""
+The Jobs module defines the capabilities for following the background jobs
+started by the AI. A capability that may take long is offered with a
+run_in_background argument, and when the AI uses it the capability returns a
+job id at once. These capabilities let the AI check on the job, fetch its
+result once it has finished, or cancel it.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from capabilities import Property, Capability
+from core.jobs import CURRENT_OWNER, JOBS, JobNotFoundException, JobState
+from plugins import Plugin
+from plugins.schema import PluginSettings
+
+
+class JobsSettings(PluginSettings):
+    """
+    The JobsSettings class defines the data model for settings used by the Jobs plugin.
+    """
+
+    name: str = "Jobs"
+    description: str = "Follows the background jobs started by the AI."
+    fields: dict[str, str] = {}
+    enabled: bool = True
+
+
+class JobsPlugin(Plugin):
+    """
+    The JobsPlugin class defines the Jobs plugin. Jobs belong to the user
+    whose message started them, and only that user's jobs can be seen.
+    """
+
+    @classmethod
+    def get_settings(cls) -> JobsSettings:
+        """
+        The getSettings method returns the settings model for the Jobs plugin.
+        """
+        return JobsSettings()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    @Capability.make(
+        description="Get the state and progress of a background job, and its result once it has finished",
+        properties={
+            "job_id": Property(
+                description="The id of the job, as returned when it was started",
+                type="string"),
+        }
+    )
+    async def get_job(self, job_id: str) -> dict[str, Any]:
+        """
+        The get_job function returns the status of the job, with its result or
+        error once it has finished.
+        """
+        try:
+            job = JOBS.result(job_id, CURRENT_OWNER.get())
+        except JobNotFoundException as e:
+            return {"error": str(e)}
+        status = job.dict(exclude_none=True, exclude={"result"})
+        if job.state == JobState.succeeded:
+            status["result"] = job.result
+        return status
+
+    @Capability.make(
+        description="List the background jobs that have been started, the most recent first",
+    )
+    async def list_jobs(self) -> list[dict[str, Any]]:
+        """
+        The list_jobs function returns the status of every job of the user.
+        """
+        return [job.dict(exclude_none=True) for job in JOBS.list(CURRENT_OWNER.get())]
+
+    @Capability.make(
+        description="Cancel a background job that has not finished",
+        properties={
+            "job_id": Property(
+                description="The id of the job, as returned when it was started",
+                type="string"),
+        }
+    )
+    async def cancel_job(self, job_id: str) -> dict[str, Any]:
+        """
+        The cancel_job function cancels the job and returns its status.
+        """
+        try:
+            return JOBS.cancel(job_id, CURRENT_OWNER.get()).dict(exclude_none=True)
+        except JobNotFoundException as e:
+            return {"error": str(e)}
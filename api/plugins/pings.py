@@ -48,6 +48,7 @@ class PingsPlugin(Plugin):
 
     @Capability.make(
         description="Ping a network of IP addresses for active IPs",
+        background=True,
         properties={
             "ip_address": Property(
                 description="An IP address in the network to ping",
@@ -58,7 +59,7 @@ class PingsPlugin(Plugin):
                 required=False),
         }
     )
-    def ping(self, ip_address: str, cidr: str = None) -> dict[str, Any]:
+    async def ping(self, ip_address: str, cidr: str = None) -> dict[str, Any]:
         """
         The ping function sends ICMP echo requests to all hosts in the specified network.
         The network is indicated by any IP address in the network and the CIDR notation of
@@ -73,7 +74,7 @@ class PingsPlugin(Plugin):
         count = int(self.settings.fields['Count'])
         timeout = int(self.settings.fields['Timeout'])
         # Send ICMP echo requests to all hosts in the network
-        hosts = ping_network(net, count=count, timeout=timeout)
+        hosts = await ping_network(net, count=count, timeout=timeout)
         active_hosts = {
             host.address: {
                 "rtt_avg": host.avg_rtt if host.is_alive else None,
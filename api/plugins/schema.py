@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from typing import List
 
 from pydantic import BaseModel, Field
@@ -47,14 +48,16 @@ class Plugin(ABC):
         ...
 
     @classmethod
+    @lru_cache(maxsize=None)
     def get_capabilities(cls) -> list[Capability]:
         """
         The get_capabilities function returns a list of all capabilities
         that are supported by the plugin. To do this we iterate over all
         the methods of the class and check if they are of type Capability.
+        The list is built once per class and must not be modified.
         """
         return [
-            getattr(cls, method)
-            for method in dir(cls)
-            if isinstance(getattr(cls, method), Capability)
+            attribute
+            for attribute in (getattr(cls, method) for method in dir(cls))
+            if isinstance(attribute, Capability)
         ]
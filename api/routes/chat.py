@@ -7,17 +7,33 @@ the language settings. The message message_history is a list of Message objects
 contain the message sections, the sender, and the timestamp. The connection
 parameters contain the device type and the device settings. The language
 settings contain the name of the language and the language settings.
+
+Clients may instead keep their conversation on the server. The greeting
+issues a session, and each SessionMessage then carries only the new message,
+which is answered with the history the session holds. Long sessions are
+summarized in the background once the response has been sent.
+
+The same sessions can be used over a WebSocket at /chat/ws, which keeps one
+connection open for the whole chat and pushes the response as it is
+produced, including each device a capability has finished with.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
+from typing import AsyncIterator, Optional, Set
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from jose import JWTError
+from starlette.background import BackgroundTask
 
-from core.chat import ChatCore
+from core.chat import CHAT_REGISTRY, ChatCore
 from core.security import SecurityCore as SC
-from flow.schema import BotMessage, UserMessage, MessageType
+from core.session import SESSIONS, MessagePage, SessionNotFoundException
+from environment import WebSocketServerInformation
+from flow.schema import (BotMessage, ChatEvent, ChatEventType, ChatFrame, ChatFrameType, UserMessage, MessageType,
+                         SessionMessage)
 
 logger = logging.getLogger("uvicorn")
 
@@ -25,6 +41,11 @@ ChatRouter = APIRouter(prefix="/chat")
 
 SecurityCore = SC.from_config()
 
+WEBSOCKET_INFO = WebSocketServerInformation.load()
+
+# Close code sent to a WebSocket client that does not keep up with its chat.
+CLOSE_TRY_AGAIN_LATER = 1013
+
 
 def get_user():
     """
@@ -44,12 +65,12 @@ async def receive_message(message: UserMessage, token: str = Depends(get_user())
     """
     logger.info(f"Received message: {message}")
     try:
-        chat_core = ChatCore(
+        chat_core = CHAT_REGISTRY.get(
             languageSettings=message.language_settings,
             networkSettings=message.network_settings,
             pluginList=message.plugin_list,
         )
-        bot_message = chat_core.process_message(message)
+        bot_message = await chat_core.process_message(message, owner=get_subject(token))
     except Exception as e:
         logger.error(f"Error processing message: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing message: {e}")
@@ -57,6 +78,48 @@ async def receive_message(message: UserMessage, token: str = Depends(get_user())
     return bot_message
 
 
+@ChatRouter.post("/stream")
+async def stream_message(message: UserMessage, token: str = Depends(get_user())) -> StreamingResponse:
+    """
+    Receive a message from the user and stream the response as Server-Sent
+    Events. Each event is named after its ChatEventType and carries the
+    ChatEvent as JSON. The final "message" event carries the same BotMessage
+    that /chat/message returns.
+    """
+    logger.info(f"Received message: {message}")
+    try:
+        chat_core = CHAT_REGISTRY.get(
+            languageSettings=message.language_settings,
+            networkSettings=message.network_settings,
+            pluginList=message.plugin_list,
+        )
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing message: {e}")
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in chat_core.stream_message(message, owner=get_subject(token)):
+                yield server_sent_event(event)
+        except Exception as e:
+            # The response has already started, so the error is sent as the final message.
+            logger.error(f"Error processing message: {e}")
+            yield server_sent_event(ChatEvent(event=ChatEventType.message, message=BotMessage.quick(
+                message_type=MessageType.error,
+                content=f"Error processing message: {e}",
+            )))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def server_sent_event(event: ChatEvent) -> str:
+    """
+    The server_sent_event function formats a ChatEvent as a Server-Sent Event.
+    """
+    return f"event: {event.event.value}\ndata: {event.json(exclude_none=True)}\n\n"
+
+
 @ChatRouter.get("/greeting", response_model=BotMessage)
 async def get_greeting(token: str = Depends(get_user())):
     """
@@ -64,13 +127,350 @@ async def get_greeting(token: str = Depends(get_user())):
     """
     logger.info(f"Received greeting request")
     try:
-        logger.info(f"Token: {token}")
+        logger.debug(f"Greeting requested by {get_subject(token)}")
         message = BotMessage.quick(
             message_type=MessageType.text,
             content="Hello, I am NetGPT. How can I help you today?",
         )
+        # Sessions are only issued to users whose token names them.
+        if get_subject(token) is not None:
+            message.session_id = SESSIONS.create(get_subject(token))
+            SESSIONS.append(message.session_id, get_subject(token), [message])
         logger.info(f"Sending greeting: {message}")
         return message
     except JWTError:
         logger.error(f"Invalid authentication token")
         raise HTTPException(status_code=401, detail="Invalid authentication token")
+
+
+@ChatRouter.post("/sessions/{session_id}/message", response_model=BotMessage)
+async def receive_session_message(session_id: str, message: SessionMessage, background_tasks: BackgroundTasks,
+                                  token: str = Depends(get_user())) -> BotMessage:
+    """
+    Receive a new message in a session and return a response. The message and
+    the response are both added to the session, which is then compacted in
+    the background.
+    """
+    logger.info(f"Received message in session {session_id}: {message.message}")
+    owner = get_owner(token)
+    user_message = session_user_message(session_id, owner, message)
+    try:
+        chat_core = CHAT_REGISTRY.get(
+            languageSettings=message.language_settings,
+            networkSettings=message.network_settings,
+            pluginList=message.plugin_list,
+        )
+        bot_message = await chat_core.process_message(user_message, owner=owner)
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing message: {e}")
+    bot_message.session_id = session_id
+    SESSIONS.append(session_id, owner, [message.message, bot_message])
+    background_tasks.add_task(SESSIONS.compact, session_id, owner, chat_core.language)
+    logger.info(f"Sending message: {bot_message}")
+    return bot_message
+
+
+@ChatRouter.post("/sessions/{session_id}/stream")
+async def stream_session_message(session_id: str, message: SessionMessage,
+                                 token: str = Depends(get_user())) -> StreamingResponse:
+    """
+    Receive a new message in a session and stream the response as Server-Sent
+    Events, as /chat/stream does. The message and the final response are both
+    added to the session, which is then compacted in the background.
+    """
+    logger.info(f"Received message in session {session_id}: {message.message}")
+    owner = get_owner(token)
+    user_message = session_user_message(session_id, owner, message)
+    try:
+        chat_core = CHAT_REGISTRY.get(
+            languageSettings=message.language_settings,
+            networkSettings=message.network_settings,
+            pluginList=message.plugin_list,
+        )
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing message: {e}")
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in chat_core.stream_message(user_message, owner=owner):
+                if event.event == ChatEventType.message:
+                    event.message.session_id = session_id
+                    SESSIONS.append(session_id, owner, [message.message, event.message])
+                yield server_sent_event(event)
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            yield server_sent_event(ChatEvent(event=ChatEventType.message, message=BotMessage.quick(
+                message_type=MessageType.error,
+                content=f"Error processing message: {e}",
+                session_id=session_id,
+            )))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(SESSIONS.compact, session_id, owner, chat_core.language))
+
+
+@ChatRouter.get("/sessions/{session_id}/messages", response_model=MessagePage)
+async def get_session_messages(session_id: str, offset: int = 0, limit: int = None,
+                               token: str = Depends(get_user())) -> MessagePage:
+    """
+    Get one page of a session's messages, oldest first. The limit is capped
+    at the configured page size.
+    """
+    if offset < 0 or (limit is not None and limit < 1):
+        raise HTTPException(status_code=422, detail="The offset must not be negative and the limit must be positive")
+    try:
+        return SESSIONS.history(session_id, get_owner(token), offset=offset, limit=limit)
+    except SessionNotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@ChatRouter.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str, token: str = Depends(get_user())):
+    """
+    Delete a session and its messages.
+    """
+    try:
+        SESSIONS.delete(session_id, get_owner(token))
+    except SessionNotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(status_code=204)
+
+
+def get_subject(token: dict) -> str | None:
+    """
+    The get_subject function returns the user named by the token, if any.
+    """
+    return token.get("sub") if token else None
+
+
+def get_owner(token: dict) -> str:
+    """
+    The get_owner function returns the user that sessions and jobs are kept
+    for, and rejects tokens that do not name one.
+    """
+    if get_subject(token) is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication token")
+    return get_subject(token)
+
+
+def session_user_message(session_id: str, owner: str, message: SessionMessage) -> UserMessage:
+    """
+    The session_user_message function returns the UserMessage made of the
+    session's summary and history followed by the new message.
+    """
+    try:
+        summary, history = SESSIONS.conversation(session_id, owner)
+    except SessionNotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return UserMessage(
+        message_history=history + [message.message],
+        network_settings=message.network_settings,
+        language_settings=message.language_settings,
+        plugin_list=message.plugin_list,
+        summary=summary,
+    )
+
+
+@ChatRouter.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, token: str = None):
+    """
+    Chat over a WebSocket. Browsers cannot set headers on a WebSocket, so the
+    token may be given as the token query parameter instead of the
+    Authorization header. The client sends ChatFrames as JSON, starting with
+    a start frame, and receives ChatEvents as JSON: first a message event
+    carrying the session's greeting or, when resuming, its latest message,
+    then the events of each response as /chat/stream sends them.
+    """
+    token = token or websocket.headers.get("authorization")
+    owner = get_subject(SecurityCore.verify(token)) if token else None
+    if owner is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    connection = ChatConnection(websocket, owner)
+    try:
+        await connection.serve()
+    finally:
+        await connection.close()
+
+
+class ChatConnection:
+    """
+    The ChatConnection class serves one chat WebSocket. Events are sent from
+    a bounded queue, so a client that reads slowly holds the response back
+    rather than letting events pile up. While the queue is full, deltas are
+    merged instead of queued, and a client that does not accept an event
+    within send_timeout seconds is disconnected. One message is answered at
+    a time.
+    """
+
+    def __init__(self, websocket: WebSocket, owner: str):
+        self.websocket = websocket
+        self.owner = owner
+        self.outgoing: asyncio.Queue[ChatEvent] = asyncio.Queue(maxsize=max(1, WEBSOCKET_INFO.queue_size))
+        self.sender = asyncio.ensure_future(self.send())
+        self.turn: Optional[asyncio.Task] = None
+        self.chat_core: Optional[ChatCore] = None
+        self.start: Optional[ChatFrame] = None
+        self.session_id: Optional[str] = None
+        self.compactions: Set[asyncio.Task] = set()
+
+    async def serve(self):
+        """
+        The serve method handles the client's frames until it disconnects.
+        """
+        while not self.sender.done():
+            try:
+                text = await self.websocket.receive_text()
+            except (WebSocketDisconnect, RuntimeError):
+                logger.info(f"Chat WebSocket of {self.owner} disconnected")
+                return
+            try:
+                frame = ChatFrame.parse_raw(text)
+            except ValueError as e:
+                logger.error(f"Invalid chat WebSocket frame: {e}")
+                await self.error(f"Invalid frame: {e}")
+                continue
+            if frame.type == ChatFrameType.start:
+                await self.on_start(frame)
+            elif frame.type == ChatFrameType.message:
+                await self.on_message(frame)
+            elif self.turn is not None:
+                self.turn.cancel()
+
+    async def on_start(self, frame: ChatFrame):
+        """
+        The on_start method sets up the chat and its session. The chat cannot
+        be set up again while a message is being answered.
+        """
+        if self.turn is not None and not self.turn.done():
+            return await self.error("The chat cannot be started again while a message is being answered.")
+        if frame.network_settings is None or frame.language_settings is None:
+            return await self.error("A start frame needs network_settings and language_settings.")
+        try:
+            self.chat_core = CHAT_REGISTRY.get(
+                languageSettings=frame.language_settings,
+                networkSettings=frame.network_settings,
+                pluginList=frame.plugin_list,
+            )
+        except Exception as e:
+            logger.error(f"Error starting chat: {e}")
+            return await self.error(f"Error starting chat: {e}")
+        self.start = frame
+        if frame.session_id is not None:
+            try:
+                latest = SESSIONS.latest(frame.session_id, self.owner)
+            except SessionNotFoundException as e:
+                return await self.error(str(e))
+            self.session_id = frame.session_id
+            message = BotMessage(**latest.dict(), session_id=self.session_id)
+        else:
+            self.session_id = SESSIONS.create(self.owner)
+            message = BotMessage.quick(
+                message_type=MessageType.text,
+                content="Hello, I am NetGPT. How can I help you today?",
+                session_id=self.session_id,
+            )
+            SESSIONS.append(self.session_id, self.owner, [message])
+        await self.outgoing.put(ChatEvent(event=ChatEventType.message, message=message))
+
+    async def on_message(self, frame: ChatFrame):
+        """
+        The on_message method starts answering the user's new message.
+        """
+        if self.chat_core is None or frame.message is None:
+            return await self.error("A message frame needs a message, after a start frame.")
+        if self.turn is not None and not self.turn.done():
+            return await self.error("The previous message is still being answered.")
+        try:
+            summary, history = SESSIONS.conversation(self.session_id, self.owner)
+        except SessionNotFoundException as e:
+            return await self.error(str(e))
+        user_message = UserMessage(
+            message_history=history + [frame.message],
+            network_settings=self.start.network_settings,
+            language_settings=self.start.language_settings,
+            plugin_list=self.start.plugin_list,
+            summary=summary,
+        )
+        self.turn = asyncio.ensure_future(self.answer(frame, user_message))
+
+    async def answer(self, frame: ChatFrame, user_message: UserMessage):
+        """
+        The answer method queues the events of the response to the message,
+        and stores the message and the response in the session.
+        """
+        merged: Optional[ChatEvent] = None
+        try:
+            async for event in self.chat_core.stream_message(user_message, owner=self.owner):
+                if event.event == ChatEventType.delta and self.outgoing.full():
+                    merged = event if merged is None else ChatEvent(event=ChatEventType.delta,
+                                                                    content=merged.content + event.content)
+                    continue
+                if merged is not None:
+                    await self.outgoing.put(merged)
+                    merged = None
+                if event.event == ChatEventType.message:
+                    event.message.session_id = self.session_id
+                    SESSIONS.append(self.session_id, self.owner, [frame.message, event.message])
+                await self.outgoing.put(event)
+        except asyncio.CancelledError:
+            # The connection may be closing, so the notice is only sent if there is room for it.
+            if not self.outgoing.full():
+                self.outgoing.put_nowait(error_event("The response was cancelled.", self.session_id))
+            return
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            await self.error(f"Error processing message: {e}")
+            return
+        compaction = asyncio.ensure_future(SESSIONS.compact(self.session_id, self.owner, self.chat_core.language))
+        self.compactions.add(compaction)
+        compaction.add_done_callback(self.compactions.discard)
+
+    async def send(self):
+        """
+        The send method sends the queued events to the client, disconnecting
+        it if it falls behind.
+        """
+        while True:
+            event = await self.outgoing.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(event.json(exclude_none=True)),
+                                       timeout=WEBSOCKET_INFO.send_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Chat WebSocket of {self.owner} fell behind. Disconnecting it.")
+                await self.websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+                return
+            except Exception as e:
+                logger.info(f"Chat WebSocket of {self.owner} closed: {e}")
+                return
+
+    async def error(self, content: str):
+        """
+        The error method queues a BotMessage indicating an error. It is not
+        stored in the session.
+        """
+        await self.outgoing.put(error_event(content, self.session_id))
+
+    async def close(self):
+        """
+        The close method stops the response being produced and the sender.
+        """
+        for task in (self.turn, self.sender):
+            if task is not None:
+                task.cancel()
+
+
+def error_event(content: str, session_id: str = None) -> ChatEvent:
+    """
+    The error_event function returns a message event carrying a BotMessage
+    indicating an error.
+    """
+    return ChatEvent(event=ChatEventType.message, message=BotMessage.quick(
+        message_type=MessageType.error,
+        content=content,
+        session_id=session_id,
+    ))
@@ -0,0 +1,57 @@
+"""
+The Jobs Router serves requests for following the background jobs that the
+AI has started on the user's behalf, such as ping sweeps and commands sent to
+many devices. A job's result can be fetched for as long as it is retained.
+"""
+
+from __future__ import annotations
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from core.jobs import JOBS, JobNotFoundException, JobResult, JobStatus
+from routes.chat import get_owner, get_user
+
+JobsRouter = APIRouter(prefix="/jobs")
+
+
+@JobsRouter.get("", response_model=List[JobStatus])
+async def list_jobs(token: str = Depends(get_user())):
+    """
+    Return the status of every retained job of the user, the most recent first.
+    """
+    return JOBS.list(get_owner(token))
+
+
+@JobsRouter.get("/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, token: str = Depends(get_user())):
+    """
+    Return the state and progress of a job.
+    """
+    try:
+        return JOBS.status(job_id, get_owner(token))
+    except JobNotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@JobsRouter.get("/{job_id}/result", response_model=JobResult)
+async def get_job_result(job_id: str, token: str = Depends(get_user())):
+    """
+    Return a job along with its result, which is null until the job has succeeded.
+    """
+    try:
+        return JOBS.result(job_id, get_owner(token))
+    except JobNotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@JobsRouter.delete("/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str, token: str = Depends(get_user())):
+    """
+    Cancel a job that has not finished and return its status.
+    """
+    try:
+        return JOBS.cancel(job_id, get_owner(token))
+    except JobNotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
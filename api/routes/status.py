@@ -0,0 +1,98 @@
+"""
+The Status Router serves requests for inspecting the operational state of the
+NetGPT Service, such as the health of the network devices it has contacted
+and the effectiveness of its caches.
+"""
+
+from __future__ import annotations
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from clients.health import HostHealthStatus
+from clients.pool import PoolStatistics
+from clients.schema import DEVICE_OUTPUT_CACHE, HOST_HEALTH, SESSION_POOL
+from core.cache import CacheStatistics
+from core.chat import CHAT_REGISTRY, ChatRegistryStatistics
+from core.engine import EXECUTION_ENGINE
+from core.security import SecurityStatistics
+from flow.responses import RESPONSE_CACHE, ResponseCacheStatistics
+from flow.transport import TRANSPORT, TransportStatistics
+from routes.chat import SecurityCore, get_user
+
+StatusRouter = APIRouter(prefix="/status")
+
+# Returned for statistics that each worker process keeps for itself when capabilities run on worker processes.
+WORKER_STATE_DETAIL = ("The {} is kept by each worker process while capabilities run in process mode, "
+                       "so its statistics are unavailable.")
+
+
+@StatusRouter.get("/devices", response_model=List[HostHealthStatus])
+def get_device_health(token: str = Depends(get_user())):
+    """
+    Return the circuit breaker state of every device that has been contacted.
+    """
+    return HOST_HEALTH.status()
+
+
+@StatusRouter.post("/devices/{host}/reset", response_model=List[HostHealthStatus])
+def reset_device_health(host: str, token: str = Depends(get_user())):
+    """
+    Close the circuit breaker of a device so that it is tried again at once.
+    """
+    if not HOST_HEALTH.reset(host):
+        raise HTTPException(status_code=404, detail=f"Device {host} has not been contacted.")
+    return [status for status in HOST_HEALTH.status() if status.host == host.lower()]
+
+
+@StatusRouter.get("/cache", response_model=CacheStatistics)
+def get_cache_statistics(token: str = Depends(get_user())):
+    """
+    Return the hit and miss statistics of the device output cache.
+    """
+    if EXECUTION_ENGINE.isolated:
+        raise HTTPException(status_code=503, detail=WORKER_STATE_DETAIL.format("device output cache"))
+    return DEVICE_OUTPUT_CACHE.statistics()
+
+
+@StatusRouter.get("/pool", response_model=PoolStatistics)
+def get_pool_statistics(token: str = Depends(get_user())):
+    """
+    Return the session pool's occupancy and how often prewarmed sessions were used.
+    """
+    if EXECUTION_ENGINE.isolated:
+        raise HTTPException(status_code=503, detail=WORKER_STATE_DETAIL.format("session pool"))
+    return SESSION_POOL.statistics()
+
+
+@StatusRouter.get("/transport", response_model=TransportStatistics)
+def get_transport_statistics(token: str = Depends(get_user())):
+    """
+    Return the request, retry and hedge counters of the language model transport.
+    """
+    return TRANSPORT.statistics
+
+
+@StatusRouter.get("/responses", response_model=ResponseCacheStatistics)
+def get_response_cache_statistics(token: str = Depends(get_user())):
+    """
+    Return the hit rate of the language model response cache and what it has saved.
+    """
+    return RESPONSE_CACHE.statistics()
+
+
+@StatusRouter.get("/registry", response_model=ChatRegistryStatistics)
+def get_chat_registry_statistics(token: str = Depends(get_user())):
+    """
+    Return how often an assembled chat was reused rather than built for a request.
+    """
+    return CHAT_REGISTRY.statistics()
+
+
+@StatusRouter.get("/security", response_model=SecurityStatistics)
+def get_security_statistics(token: str = Depends(get_user())):
+    """
+    Return how often a token's cached claims were reused and what verifying a token costs.
+    """
+    return SecurityCore.statistics()
@@ -0,0 +1,80 @@
+"""
+The tests run against the modules of the API, which load their configuration
+from paths relative to the API directory. The client fixture serves the chat
+routes with the authentication server and the language model stubbed out.
+"""
+
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+API_DIRECTORY = Path(__file__).resolve().parents[1]
+
+sys.path.insert(0, str(API_DIRECTORY))
+os.chdir(API_DIRECTORY)
+
+SETTINGS = {
+    "network_settings": {"username": "user", "password": "secret", "deviceType": "Cisco IOS"},
+    "language_settings": {"name": "Open AI", "description": "OpenAI", "fields": {"API Key": "key"}},
+}
+
+
+class OpenIDResponse:
+    def __init__(self, body: dict):
+        self.body = body
+
+    def json(self) -> dict:
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+async def answer(params, api_key):
+    for word in ("Hello ", "there."):
+        yield {"choices": [{"delta": {"content": word}, "finish_reason": None}]}
+    yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+
+@pytest.fixture
+def user_message():
+    def build(text: str) -> dict:
+        return {"message": {"sender": "You", "sections": [{"messageType": "text", "content": text}],
+                            "timestamp": 0},
+                **SETTINGS}
+
+    return build
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    # The security core fetches the authentication server's keys when the routes are imported.
+    monkeypatch.setattr(httpx, "get", lambda url, **kwargs: OpenIDResponse(
+        {"jwks_uri": "https://auth/keys"} if "openid" in url else {"keys": []}))
+    chat = importlib.import_module("routes.chat")
+    open_ai = importlib.import_module("flow.open_ai")
+    monkeypatch.setattr(chat.SecurityCore, "verify", lambda token: {"sub": token.replace("Bearer ", "")})
+    monkeypatch.setattr(open_ai.TRANSPORT, "stream", answer)
+    return chat
+
+
+@pytest.fixture
+def client(monkeypatch, chat, database):
+    session = importlib.import_module("core.session")
+    sessions = session.SessionCore(session.SQLiteSessionBackend(database, ttl=3600, max_sessions=10,
+                                                                max_messages=100))
+    monkeypatch.setattr(chat, "SESSIONS", sessions)
+    application = FastAPI()
+    application.include_router(chat.ChatRouter)
+    return TestClient(application), sessions
@@ -0,0 +1,51 @@
+"""
+The aggregation tests check that identical per-host outputs are grouped and
+that expanding the groups gives back every host's output.
+"""
+
+from flow.aggregation import GROUPS_KEY, aggregate, expand
+
+SHOW_VERSION = "\n".join([
+    "Cisco Nexus Operating System (NX-OS) Software",
+    "  NXOS: version 9.3(8)",
+    "  NXOS image file is: bootflash:///nxos.9.3.8.bin",
+    "  cisco Nexus9000 C93180YC-EX chassis",
+    "  Device name: leaf",
+])
+
+
+def test_identical_text_outputs_share_one_group():
+    output = {f"leaf{n:02}": SHOW_VERSION for n in range(1, 31)}
+
+    aggregated = aggregate(output)
+
+    assert len(aggregated[GROUPS_KEY]) == 1
+    assert aggregated[GROUPS_KEY][0]["hosts"] == list(output)
+    assert expand(aggregated) == output
+
+
+def test_text_outputs_that_differ_slightly_are_given_as_diffs():
+    output = {f"leaf{n:02}": SHOW_VERSION for n in range(1, 31)}
+    output["leaf30"] = SHOW_VERSION.replace("9.3(8)", "9.3(9)")
+    output["leaf31"] = {"error": "TimeoutError: timed out"}
+
+    aggregated = aggregate(output)
+
+    changed = next(group for group in aggregated[GROUPS_KEY] if group["hosts"] == ["leaf30"])
+    assert "output" not in changed and "9.3(9)" in changed["changes"]["output"]["diff"]
+    assert expand(aggregated) == output
+
+
+def test_dict_outputs_are_grouped():
+    output = {f"leaf{n:02}": {"version": "9.3(8)", "uptime": "10 days"} for n in range(1, 11)}
+
+    aggregated = aggregate(output)
+
+    assert [group["hosts"] for group in aggregated[GROUPS_KEY]] == [list(output)]
+    assert expand(aggregated) == output
+
+
+def test_single_host_output_is_unchanged():
+    output = {"leaf01": SHOW_VERSION}
+
+    assert aggregate(output) is output
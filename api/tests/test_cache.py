@@ -0,0 +1,86 @@
+"""
+The cache tests check that concurrent misses share one computation and that
+the least recently used entries are evicted to stay within budget.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.cache import CacheCore
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = CacheCore(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "show version output"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        owner = executor.submit(cache.get_or_compute, "leaf01", compute)
+        started.wait(5)
+        waiters = [executor.submit(cache.get_or_compute, "leaf01", compute) for _ in range(7)]
+        while cache.statistics().coalesced < 7:
+            time.sleep(0.01)
+        release.set()
+        results = [owner.result()] + [waiter.result() for waiter in waiters]
+
+    assert calls == [1]
+    assert results == ["show version output"] * 8
+    statistics = cache.statistics()
+    assert (statistics.misses, statistics.coalesced) == (1, 7)
+    assert cache.get_or_compute("leaf01", compute) == "show version output"
+    assert cache.statistics().hits == 1
+
+
+def test_errors_are_shared_but_not_cached():
+    cache = CacheCore(ttl=60)
+
+    def fail():
+        raise TimeoutError("Timed out.")
+
+    with pytest.raises(TimeoutError):
+        cache.get_or_compute("leaf01", fail)
+    assert cache.get_or_compute("leaf01", lambda: "recovered") == "recovered"
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = CacheCore(ttl=60, max_entries=2)
+    cache.set("leaf01", "one")
+    cache.set("leaf02", "two")
+    assert cache.get("leaf01") == "one"
+    cache.set("leaf03", "three")
+
+    assert cache.get("leaf02") is None
+    assert cache.get("leaf01") == "one"
+    assert cache.get("leaf03") == "three"
+    assert cache.statistics().evictions == 1
+
+
+def test_entries_are_evicted_to_stay_within_the_byte_budget():
+    cache = CacheCore(ttl=60, max_bytes=100)
+    cache.set("leaf01", "x" * 60)
+    cache.set("leaf02", "y" * 60)
+    cache.set("leaf03", "z" * 200)
+
+    assert cache.get("leaf01") is None
+    assert cache.get("leaf02") == "y" * 60
+    assert cache.get("leaf03") is None
+    assert cache.statistics().size_bytes == 60
+
+
+def test_expired_entries_are_missed():
+    cache = CacheCore(ttl=60)
+    cache.set("leaf01", "stale", ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("leaf01") is None
+    assert cache.statistics().expirations == 1
@@ -0,0 +1,73 @@
+"""
+The digest tests check that oversized tool output is chunked on record
+boundaries and summarized into one digest within budget. Tokens are
+estimated from the length of the text, so that the tests do not depend on
+tiktoken.
+"""
+
+import asyncio
+
+import pytest
+
+import flow.tokens
+from flow.digest import chunk, map_reduce
+from flow.tokens import count_tokens
+
+MODEL = "gpt-3.5-turbo-1106"
+
+
+@pytest.fixture(autouse=True)
+def estimated(monkeypatch):
+    monkeypatch.setattr(flow.tokens, "get_encoding", lambda model: None)
+
+
+def test_per_host_output_is_chunked_by_host():
+    output = {f"leaf{n:02}": "Eth1/1 connected 10G" for n in range(1, 41)}
+
+    chunks = chunk(output, 100, MODEL)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(part, MODEL) <= 100 for part in chunks)
+    assert "\n".join(chunks).count("leaf") == 40
+    assert all(part.startswith("leaf") for part in chunks)
+
+
+def test_large_records_are_split_under_their_heading():
+    output = {"leaf01": "\n".join(f"Eth1/{n} connected 10G full" for n in range(1, 200))}
+
+    chunks = chunk(output, 100, MODEL)
+
+    assert len(chunks) > 1
+    assert all(part.startswith("leaf01:\n") for part in chunks)
+    assert all(count_tokens(part, MODEL) <= 100 for part in chunks)
+
+
+def test_an_oversized_heading_takes_at_most_half_a_chunk():
+    output = {"x" * 1000: "\n".join(f"line {n}" for n in range(100))}
+
+    chunks = chunk(output, 40, MODEL)
+
+    assert chunks and all(count_tokens(part, MODEL) <= 40 for part in chunks)
+    assert all(count_tokens(part.split("\n", 1)[0], MODEL) <= 20 for part in chunks)
+
+
+def test_chunks_are_summarized_concurrently_and_combined_within_budget():
+    running, peak, requests = 0, 0, []
+
+    async def summarize(text: str, max_tokens: int) -> str:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        requests.append(max_tokens)
+        return "summary " * max_tokens
+
+    chunks = [f"chunk {n}" for n in range(8)]
+
+    digest = asyncio.run(map_reduce(chunks, summarize, max_tokens=200, model=MODEL, parallelism=3))
+
+    assert peak == 3
+    assert requests[:8] == [64] * 8
+    assert count_tokens(digest, MODEL) <= 200
+    assert digest.startswith("summary")
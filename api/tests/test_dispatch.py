@@ -0,0 +1,74 @@
+"""
+The dispatch tests check that capabilities reach each device of a mixed
+fleet through the platform of its own DeviceType.
+"""
+
+import pytest
+
+import clients.dispatch
+import clients.schema
+from clients import get_network_device_platforms
+from clients.dispatch import PlatformDispatcher
+from clients.health import HostHealthTracker
+from clients.inventory import Inventory, InventoryDevice
+from clients.schema import DeviceType, NetworkDevicePlatform, NetworkSettings
+from core.engine import PROCESS_MODE
+from core.topology import TopologyCore
+
+LLDP = {
+    "core1": {"Gi0/1": [{"hostname": "dist1", "port": "Eth1/49"}]},
+    "dist1": {"Eth1/1": [{"hostname": "leaf1", "port": "Eth1/49"}]},
+    "leaf1": {},
+}
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    topology = TopologyCore()
+    monkeypatch.setattr(clients.schema, "TOPOLOGY", topology)
+    inventory = Inventory([
+        InventoryDevice(hostname="core1", device_type=DeviceType.CISCO_IOS),
+        InventoryDevice(hostname="dist1", device_type=DeviceType.CISCO_NXOS),
+        InventoryDevice(hostname="leaf1", device_type=DeviceType.CISCO_NXOS),
+    ])
+    settings = NetworkSettings(username="user", password="secret", deviceType=DeviceType.CISCO_IOS)
+    return PlatformDispatcher(settings=settings, inventory=inventory, platforms=get_network_device_platforms())
+
+
+def test_lldp_walk_reaches_each_neighbor_through_its_own_platform(monkeypatch, dispatcher):
+    calls = []
+
+    def lldp_neighbors(platform: NetworkDevicePlatform, host: str) -> dict:
+        calls.append((host, platform.vendor))
+        clients.schema.TOPOLOGY.update(host, LLDP[host], scope=platform.topology_scope)
+        return LLDP[host]
+
+    monkeypatch.setattr(NetworkDevicePlatform, "lldp_neighbors", lldp_neighbors)
+
+    result = dispatcher.dispatch("find_path", source="core1", destination="leaf1")
+
+    assert [hop["to"] for hop in result["path"]] == ["dist1", "leaf1"]
+    assert sorted(calls) == [("core1", "Cisco IOS"), ("dist1", "Cisco NXOS"), ("leaf1", "Cisco NXOS")]
+
+
+def test_breakers_of_the_api_process_guard_calls_on_worker_processes(monkeypatch, dispatcher):
+    health = HostHealthTracker(failure_threshold=1)
+    monkeypatch.setattr(clients.dispatch, "HOST_HEALTH", health)
+    monkeypatch.setattr(clients.dispatch.EXECUTION_ENGINE, "mode", PROCESS_MODE)
+    called = []
+
+    def runner(platform, name):
+        def run(hostnames, **kwargs):
+            called.extend(hostnames)
+            return {host: {"error connecting": "TCP connection to device failed."} for host in hostnames}
+        return run
+
+    monkeypatch.setattr(PlatformDispatcher, "_runner", staticmethod(runner))
+
+    first = dispatcher.dispatch("execute_command", hostnames=["dist1", "leaf1"], command="show version")
+    second = dispatcher.dispatch("execute_command", hostnames=["dist1", "leaf1"], command="show version")
+
+    assert called == ["dist1", "leaf1"]
+    assert "error connecting" in first["dist1"]
+    assert second["dist1"]["error"].startswith("CircuitOpenException")
+    assert {status.host for status in health.status()} == {"dist1", "leaf1"}
@@ -0,0 +1,58 @@
+"""
+The health tests check which failures open a host's circuit breaker.
+"""
+
+import errno
+
+import pytest
+from netmiko.exceptions import NetmikoAuthenticationException
+
+from clients.health import CircuitOpenException, HostHealthTracker
+
+
+def fail(tracker: HostHealthTracker, error: BaseException, times: int = 3):
+    for _ in range(times):
+        with pytest.raises(type(error)):
+            with tracker.guard("leaf01"):
+                raise error
+
+
+@pytest.mark.parametrize("error", [
+    OSError(errno.EHOSTUNREACH, "No route to host"),
+    OSError(errno.ENETUNREACH, "Network is unreachable"),
+    ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused"),
+])
+def test_unreachable_devices_open_the_breaker(error):
+    tracker = HostHealthTracker(failure_threshold=3)
+    fail(tracker, error)
+
+    assert tracker.is_open("leaf01")
+    with pytest.raises(CircuitOpenException):
+        with tracker.guard("leaf01"):
+            pass
+
+
+@pytest.mark.parametrize("error", [
+    TimeoutError("Timed out waiting for the output of 'show tech-support'."),
+    NetmikoAuthenticationException("Authentication failed."),
+    ValueError("Invalid input detected."),
+])
+def test_command_and_authentication_errors_leave_the_breaker_closed(error):
+    tracker = HostHealthTracker(failure_threshold=3)
+    fail(tracker, error)
+
+    assert not tracker.is_open("leaf01")
+
+
+def test_outputs_from_worker_processes_feed_the_breaker():
+    tracker = HostHealthTracker(failure_threshold=2)
+    tracker.record("leaf01", {"error connecting": "TCP connection to device failed."})
+    tracker.record("leaf01", {"error": "OSError: [Errno 113] No route to host"})
+
+    with pytest.raises(CircuitOpenException):
+        tracker.check("leaf01")
+
+    tracker.record("leaf02", {"error": "TimeoutError: Timed out waiting for the output of 'show version'."})
+    tracker.record("leaf02", {"error": "TimeoutError: Timed out waiting for the output of 'show version'."})
+    tracker.check("leaf02")
+    assert "leaf02" in tracker.known_hosts()
@@ -0,0 +1,100 @@
+"""
+The job tests check that background jobs are only visible to their owner,
+report their progress and can be cancelled while they wait or run.
+"""
+
+import asyncio
+
+import pytest
+
+from core.jobs import (JobCore, JobException, JobNotFoundException, JobState, add_work, cancel_requested,
+                       complete_work)
+
+
+def test_jobs_belong_to_their_owner():
+    async def scenario():
+        jobs = JobCore()
+        job = jobs.submit("alice", "ping", {"hosts": ["leaf01"]}, lambda: asyncio.sleep(0, result="ok"))
+        await asyncio.sleep(0.01)
+        return jobs, job
+
+    jobs, job = asyncio.run(scenario())
+
+    assert jobs.result(job.id, "alice").result == "ok"
+    assert [status.id for status in jobs.list("alice")] == [job.id]
+    assert jobs.list("bob") == [] and jobs.list(None) == []
+    for owner in ("bob", None):
+        with pytest.raises(JobNotFoundException):
+            jobs.status(job.id, owner)
+        with pytest.raises(JobNotFoundException):
+            jobs.cancel(job.id, owner)
+    assert jobs.status(job.id, "alice").state == JobState.succeeded
+
+
+def test_jobs_need_a_signed_in_user():
+    async def scenario():
+        JobCore().submit(None, "ping", {}, lambda: asyncio.sleep(0))
+
+    with pytest.raises(JobException):
+        asyncio.run(scenario())
+
+
+def test_progress_is_reported_by_the_work():
+    async def work():
+        add_work(4)
+        complete_work(1, message="leaf01 done")
+        await asyncio.sleep(0.05)
+
+    async def scenario():
+        jobs = JobCore()
+        job = jobs.submit("alice", "sweep", {}, work)
+        await asyncio.sleep(0.01)
+        return jobs.status(job.id, "alice")
+
+    status = asyncio.run(scenario())
+
+    assert status.state == JobState.running
+    assert (status.progress, status.message) == (0.25, "leaf01 done")
+
+
+def test_running_and_waiting_jobs_are_cancelled():
+    stopped = []
+
+    async def work():
+        while not cancel_requested():
+            try:
+                await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                stopped.append(cancel_requested())
+                raise
+
+    async def scenario():
+        jobs = JobCore(max_running=1)
+        running = jobs.submit("alice", "sweep", {}, work)
+        waiting = jobs.submit("alice", "sweep", {}, work)
+        await asyncio.sleep(0.01)
+        assert jobs.status(waiting.id, "alice").state == JobState.pending
+        jobs.cancel(running.id, "alice")
+        jobs.cancel(waiting.id, "alice")
+        await asyncio.sleep(0.01)
+        return jobs.status(running.id, "alice"), jobs.status(waiting.id, "alice")
+
+    running, waiting = asyncio.run(scenario())
+
+    assert running.state == waiting.state == JobState.cancelled
+    assert waiting.started is None
+    assert stopped == [True]
+
+
+def test_unfinished_jobs_are_capped():
+    async def scenario():
+        jobs = JobCore(max_jobs=1)
+        jobs.submit("alice", "sweep", {}, lambda: asyncio.sleep(1))
+        try:
+            jobs.submit("bob", "sweep", {}, lambda: asyncio.sleep(1))
+        finally:
+            for task in asyncio.all_tasks() - {asyncio.current_task()}:
+                task.cancel()
+
+    with pytest.raises(JobException):
+        asyncio.run(scenario())
@@ -0,0 +1,71 @@
+"""
+The parsing tests check that command output is parsed into compact records
+with the TextFSM templates from ntc-templates.
+"""
+
+import pytest
+
+import clients.parsing
+from clients.parsing import TemplateCache
+
+CDP_NEIGHBORS = """Capability Codes: R - Router, T - Trans-Bridge, B - Source-Route-Bridge
+                  S - Switch, H - Host, I - IGMP, r - Repeater,
+                  V - VoIP-Phone, D - Remotely-Managed-Device,
+                  s - Supports-STP-Dispute
+
+Device-ID          Local Intrfce  Hldtme Capability  Platform      Port ID
+dist1(FDO123)      Eth1/49        170    R S I s     N9K-C93180YC- Eth1/1
+dist2(FDO456)      Eth1/50        170    R S I s     N9K-C93180YC- Eth1/1
+
+Total entries displayed: 2
+"""
+
+
+@pytest.fixture(scope="module")
+def templates():
+    templates = TemplateCache.from_environment()
+    if templates is None:
+        pytest.skip("ntc-templates is not installed.")
+    return templates
+
+
+def test_output_is_parsed_into_columns_and_rows(templates):
+    parsed = templates.parse("cisco_nxos", "show cdp neighbors", CDP_NEIGHBORS)
+
+    assert parsed.template == "cisco_nxos_show_cdp_neighbors.textfsm"
+    records = parsed.records()
+    assert records["columns"][:2] == ["neighbor_name", "local_interface"]
+    assert [row[:2] for row in records["rows"]] == [["dist1(FDO123)", "Eth1/49"], ["dist2(FDO456)", "Eth1/50"]]
+    assert "truncated" not in records
+    assert parsed.raw_bytes == len(CDP_NEIGHBORS)
+
+
+def test_abbreviated_commands_find_their_template(templates):
+    assert templates.find_template("cisco_nxos", "sh cdp neig") == "cisco_nxos_show_cdp_neighbors.textfsm"
+    assert templates.find_template("cisco_nxos", "show running-config") is None
+    assert templates.parse("cisco_nxos", "show running-config", "hostname leaf01") is None
+
+
+def test_truncated_output_keeps_the_note_of_omitted_lines(templates):
+    rows = CDP_NEIGHBORS.split("\n")[6:]
+    parsed = templates.parse("cisco_nxos", "show cdp neighbors", "[6 earlier lines omitted]\n" + "\n".join(rows))
+
+    assert parsed.records()["truncated"] == "[6 earlier lines omitted]"
+
+
+def test_templates_are_compiled_once(templates):
+    first = templates.parse("cisco_nxos", "show cdp neighbors", CDP_NEIGHBORS)
+    fsm, _ = templates._compiled(first.template)
+    second = templates.parse("cisco_nxos", "show cdp neighbors", CDP_NEIGHBORS)
+
+    assert templates._compiled(second.template)[0] is fsm
+    assert second.rows == first.rows
+
+
+def test_remembered_lookups_are_capped(monkeypatch, templates):
+    monkeypatch.setattr(clients.parsing, "MAX_TEMPLATE_MATCHES", 2)
+    templates = TemplateCache(templates.template_dir)
+    for command in ("show version", "show cdp neighbors", "show interface status"):
+        templates.find_template("cisco_nxos", command)
+
+    assert list(templates._matches) == [("cisco_nxos", "show cdp neighbors"), ("cisco_nxos", "show interface status")]
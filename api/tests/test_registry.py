@@ -0,0 +1,65 @@
+"""
+The registry tests check that the ChatRegistry hands the same ChatCore to
+every request with the same settings, and assembles another one when the
+settings differ, the entry expires or it is evicted.
+"""
+
+import core.chat
+from clients.schema import NetworkSettings
+from conftest import SETTINGS
+from core.chat import ChatRegistry
+from flow.schema import LanguageSettings
+
+
+def settings(**network) -> tuple:
+    return (LanguageSettings(**SETTINGS["language_settings"]),
+            NetworkSettings(**{**SETTINGS["network_settings"], **network}))
+
+
+def test_the_same_settings_reuse_the_chat_core():
+    registry = ChatRegistry()
+
+    first = registry.get(*settings())
+    second = registry.get(*settings())
+
+    assert second is first
+    statistics = registry.statistics()
+    assert (statistics.hits, statistics.misses, statistics.entries) == (1, 1, 1)
+    assert statistics.hit_rate == 0.5
+
+
+def test_other_credentials_get_their_own_chat_core():
+    registry = ChatRegistry()
+
+    first = registry.get(*settings())
+    second = registry.get(*settings(password="other"))
+
+    assert second is not first
+    assert registry.statistics().misses == 2
+    assert all("secret" not in str(key) for key in registry._cores)
+
+
+def test_the_least_recently_used_chat_core_is_evicted():
+    registry = ChatRegistry(max_entries=2)
+    first = registry.get(*settings(username="one"))
+    registry.get(*settings(username="two"))
+    registry.get(*settings(username="one"))
+
+    registry.get(*settings(username="three"))
+
+    assert registry.get(*settings(username="one")) is first
+    statistics = registry.statistics()
+    assert (statistics.evictions, statistics.entries) == (1, 2)
+    assert registry.key(*settings(username="two")) not in registry._cores
+
+
+def test_expired_chat_cores_are_assembled_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(core.chat.time, "monotonic", lambda: now[0])
+    registry = ChatRegistry(ttl=60)
+    first = registry.get(*settings())
+
+    now[0] += 59
+    assert registry.get(*settings()) is first
+    now[0] += 61
+    assert registry.get(*settings()) is not first
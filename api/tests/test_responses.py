@@ -0,0 +1,30 @@
+"""
+The response cache tests check which requests are answered from the cache.
+"""
+
+from environment import ResponseCacheServerInformation
+from flow.responses import CachedResponse, ResponseCache
+
+PARAMS = {
+    "model": "gpt-3.5-turbo-1106",
+    "temperature": 0,
+    "messages": [{"role": "user", "content": "Show the  version of leaf01."}],
+}
+
+
+def test_responses_are_only_replayed_with_the_same_api_key():
+    cache = ResponseCache(ResponseCacheServerInformation())
+    cache.set(PARAMS, "first-key", CachedResponse(content="9.3(8)", prompt_tokens=10, completion_tokens=2))
+
+    layout = dict(PARAMS, messages=[{"role": "user", "content": "Show the version of leaf01."}])
+    assert cache.get(layout, "first-key").content == "9.3(8)"
+    assert cache.get(PARAMS, "second-key") is None
+    assert cache.statistics().tokens_saved == 12
+
+
+def test_sampled_requests_are_not_cached():
+    cache = ResponseCache(ResponseCacheServerInformation())
+
+    assert cache.cacheable(PARAMS)
+    assert not cache.cacheable(dict(PARAMS, temperature=1))
+    assert cache.statistics().skipped == 1
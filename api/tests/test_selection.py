@@ -0,0 +1,59 @@
+"""
+The selection tests check that only the capabilities relevant to a message
+are offered to the language.
+"""
+
+from capabilities import Capability, CapabilityRunner, Property
+from flow.selection import CapabilityIndex, tokenize
+
+CAPABILITIES = {
+    "execute_command": "Execute a CLI show command on network devices.",
+    "get_logs": "Gather logging information from network devices.",
+    "get_neighbors_of": "List the devices directly connected to a network device by LLDP.",
+    "find_path": "Find the path of LLDP links between two network devices.",
+    "get_blast_radius": "List the devices that would be cut off from the network if a device failed.",
+    "ping": "Ping an IP address from the NetGPT server.",
+    "list_jobs": "List the background jobs and their progress.",
+}
+
+
+def runners() -> list:
+    return [
+        CapabilityRunner(capability=Capability(
+            name=name,
+            description=description,
+            callable=lambda argument, **kwargs: None,
+            properties={"severity": Property(type="string", description="The severity of the logs.",
+                                             enum=["warning", "error"])} if name == "get_logs" else None,
+        ), argument=None)
+        for name, description in CAPABILITIES.items()
+    ]
+
+
+def names(selected: list) -> list:
+    return [runner.name for runner in selected]
+
+
+def test_terms_are_lowercased_without_stop_words_or_plurals():
+    assert tokenize("Show the LLDP neighbors of leaf01") == ["show", "lldp", "neighbor", "leaf01"]
+
+
+def test_the_most_relevant_capabilities_are_offered_in_their_order():
+    index = CapabilityIndex(runners(), max_runners=2, always_include=["execute_command"])
+
+    assert names(index.select("What are the LLDP neighbors of leaf01?")) == [
+        "execute_command", "get_neighbors_of", "find_path"]
+    assert names(index.select("Show me the error logs on leaf01")) == ["execute_command", "get_logs"]
+    assert names(index.select("What would be cut off if core1 failed?")) == ["execute_command", "get_blast_radius"]
+
+
+def test_every_capability_is_offered_when_nothing_matches():
+    index = CapabilityIndex(runners(), max_runners=2)
+
+    assert names(index.select("hello there")) == list(CAPABILITIES)
+
+
+def test_a_max_of_zero_offers_every_capability():
+    index = CapabilityIndex(runners(), max_runners=0)
+
+    assert names(index.select("ping 10.0.0.1")) == list(CAPABILITIES)
@@ -0,0 +1,71 @@
+"""
+The session tests drive the session routes end to end over the SQLite
+backend, with the authentication server and the language model stubbed out.
+"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from core.session import SessionCore, SQLiteSessionBackend
+
+def test_session_message_is_answered_and_kept(client, database, user_message):
+    test_client, sessions = client
+    session_id = sessions.create("alice")
+
+    response = test_client.post(f"/chat/sessions/{session_id}/message", json=user_message("hello"),
+                                headers={"Authorization": "Bearer alice"})
+
+    assert response.status_code == 200
+    assert response.json()["session_id"] == session_id
+    assert response.json()["sections"][-1]["content"] == "Hello there."
+    page = test_client.get(f"/chat/sessions/{session_id}/messages", headers={"Authorization": "Bearer alice"})
+    assert page.json()["total"] == 2
+    assert [m["sections"][-1]["content"] for m in page.json()["messages"]] == ["hello", "Hello there."]
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?",
+                                  (session_id,)).fetchone()[0] == 2
+
+
+def test_session_of_another_user_is_not_found(client, user_message):
+    test_client, sessions = client
+    session_id = sessions.create("alice")
+
+    response = test_client.post(f"/chat/sessions/{session_id}/message", json=user_message("hello"),
+                                headers={"Authorization": "Bearer bob"})
+
+    assert response.status_code == 404
+    assert sessions.history(session_id, "alice").total == 0
+
+
+class RecordingLanguage:
+    def __init__(self, summarize_after: int, recent_turns: int):
+        self.configuration = type("Configuration", (), {"summarize_after": summarize_after,
+                                                        "recent_turns": recent_turns})()
+        self.summarized = []
+
+    async def summarize(self, summary, messages):
+        self.summarized.append(messages)
+        return f"{len(messages)} messages"
+
+
+@pytest.mark.parametrize("summarize_after, recent_turns, summarized", [(4, 2, 4), (2, 6, None)])
+def test_compact_keeps_the_recent_turns(database, summarize_after, recent_turns, summarized):
+    from flow.schema import Message
+
+    sessions = SessionCore(SQLiteSessionBackend(database, ttl=3600, max_sessions=10, max_messages=100))
+    session_id = sessions.create("alice")
+    sessions.append(session_id, "alice", [
+        Message(sender="You", sections=[{"messageType": "text", "content": f"message {n}"}], timestamp=n)
+        for n in range(6)
+    ])
+    language = RecordingLanguage(summarize_after, recent_turns)
+
+    asyncio.run(sessions.compact(session_id, "alice", language))
+
+    summary, messages = sessions.conversation(session_id, "alice")
+    if summarized is None:
+        assert language.summarized == [] and summary is None and len(messages) == 6
+    else:
+        assert summary == f"{summarized} messages" and len(messages) == 6 - summarized
@@ -0,0 +1,51 @@
+"""
+The stream tests drive /chat/stream and check the Server-Sent Events of a
+response.
+"""
+
+import json
+from typing import List, Tuple
+
+
+def history(message: dict) -> dict:
+    return dict(message, message_history=[message.pop("message")])
+
+
+def server_sent_events(body: str) -> List[Tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_response_is_streamed_as_deltas_then_the_message(client, user_message):
+    test_client, _ = client
+
+    response = test_client.post("/chat/stream", json=history(user_message("hello")),
+                                headers={"Authorization": "Bearer alice"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = server_sent_events(response.text)
+    assert [name for name, _ in events] == ["delta", "delta", "message"]
+    assert "".join(data["content"] for name, data in events if name == "delta") == "Hello there."
+    assert events[-1][1]["message"]["sections"][-1]["content"] == "Hello there."
+
+
+def test_errors_after_the_stream_has_started_end_it_with_an_error_message(monkeypatch, client, user_message):
+    test_client, _ = client
+
+    async def fail(params, api_key):
+        yield {"choices": [{"delta": {"content": "Hello "}, "finish_reason": None}]}
+        raise ConnectionError("The completion API went away.")
+
+    monkeypatch.setattr("flow.open_ai.TRANSPORT.stream", fail)
+
+    response = test_client.post("/chat/stream", json=history(user_message("hello again")),
+                                headers={"Authorization": "Bearer alice"})
+
+    events = server_sent_events(response.text)
+    assert events[0] == ("delta", {"event": "delta", "content": "Hello "})
+    assert events[-1][0] == "message"
+    assert events[-1][1]["message"]["sections"][0]["messageType"] == "error"
@@ -0,0 +1,76 @@
+"""
+The streaming tests check that device output is cut down to its last lines
+within budget, with a note of how many earlier lines were dropped.
+"""
+
+from typing import List
+
+import pytest
+
+from clients.streaming import BoundedOutput, read_bounded, split_omitted
+
+PROMPT = "leaf01#"
+
+
+class ScriptedDevice:
+    """
+    The ScriptedDevice class stands in for a netmiko session that replies to
+    a command with the given chunks of data.
+    """
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = list(chunks)
+        self.written = []
+
+    def find_prompt(self) -> str:
+        return PROMPT
+
+    def clear_buffer(self):
+        pass
+
+    def normalize_cmd(self, command: str) -> str:
+        return command + "\n"
+
+    def write_channel(self, data: str):
+        self.written.append(data)
+
+    def read_channel(self) -> str:
+        return self.chunks.pop(0) if self.chunks else ""
+
+
+def test_only_the_last_lines_are_kept():
+    output = BoundedOutput(max_lines=3, max_bytes=1024)
+    output.feed("line 1\nline 2\nli")
+    output.feed("ne 3\r\nline 4\nline 5\n")
+
+    assert output.text() == "[2 earlier lines omitted]\nline 3\nline 4\nline 5"
+
+
+def test_lines_are_dropped_to_stay_within_the_byte_budget():
+    output = BoundedOutput(max_lines=100, max_bytes=20)
+    output.feed("".join(f"line {n:02}\n" for n in range(10)))
+
+    assert output.text() == "[8 earlier lines omitted]\nline 08\nline 09"
+    assert output.size <= 20
+
+
+def test_the_note_of_omitted_lines_is_split_from_the_output():
+    assert split_omitted("[12 earlier lines omitted]\nline 13") == ("[12 earlier lines omitted]", "line 13")
+    assert split_omitted("line 1") == (None, "line 1")
+
+
+def test_echo_and_prompt_are_removed_from_the_output():
+    lines = "".join(f"Eth1/{n} connected\n" for n in range(1, 101))
+    device = ScriptedDevice(["show interface st", "atus\n", lines[:500], lines[500:], PROMPT])
+
+    text = read_bounded(device, "show interface status", max_lines=10, max_bytes=4096, timeout=5)
+
+    assert device.written == ["show interface status\n"]
+    assert text.split("\n") == ["[90 earlier lines omitted]"] + [f"Eth1/{n} connected" for n in range(91, 101)]
+
+
+def test_a_prompt_that_never_returns_times_out():
+    device = ScriptedDevice(["show tech-support\n", "still going\n"])
+
+    with pytest.raises(TimeoutError):
+        read_bounded(device, "show tech-support", max_lines=10, max_bytes=4096, timeout=0.2)
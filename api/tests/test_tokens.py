@@ -0,0 +1,108 @@
+"""
+The token tests check that TokenBudget fits a chat request into the context
+window. Tokens are estimated from the length of the text, so that the tests
+do not depend on tiktoken.
+"""
+
+import pytest
+
+import flow.tokens
+from flow.tokens import COMPACTED_TURN_TOKENS, TokenBudget, count_tokens, truncate
+
+MODEL = "gpt-3.5-turbo-1106"
+SYSTEM = {"role": "system", "content": "You are NetGPT."}
+
+
+@pytest.fixture(autouse=True)
+def estimated(monkeypatch):
+    monkeypatch.setattr(flow.tokens, "get_encoding", lambda model: None)
+
+
+def budget(context_tokens: int, max_tokens: int = 100, recent_turns: int = 2) -> TokenBudget:
+    return TokenBudget(model=MODEL, context_tokens=context_tokens, max_tokens=max_tokens,
+                       recent_turns=recent_turns, max_tool_output_tokens=2000)
+
+
+def turn(role: str, words: int) -> dict:
+    return {"role": role, "content": " ".join(["word"] * words)}
+
+
+def step(call_id: str, words: int) -> list:
+    return [
+        {"role": "assistant", "content": None,
+         "tool_calls": [{"id": call_id, "type": "function",
+                         "function": {"name": "execute_command", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": call_id, "content": " ".join(["output"] * words)},
+    ]
+
+
+def used(token_budget: TokenBudget, messages: list) -> int:
+    return sum(token_budget.count(message) for message in messages) + flow.tokens.TOKENS_PER_REPLY
+
+
+def test_max_tokens_is_clamped_to_what_the_model_generates():
+    assert budget(context_tokens=16384, max_tokens=8000).max_tokens == 4096
+    assert TokenBudget(model="unknown", context_tokens=16384, max_tokens=8000, recent_turns=2,
+                       max_tool_output_tokens=2000).max_tokens == 8000
+
+
+def test_requests_that_fit_are_sent_as_they_are():
+    messages = [turn("user", 10), turn("assistant", 10), turn("user", 10)]
+
+    assert budget(context_tokens=4096).fit(SYSTEM, messages) == [SYSTEM] + messages
+
+
+def test_older_turns_are_compacted_and_dropped_before_the_latest_message():
+    messages = [turn("user", 400), turn("assistant", 400), turn("user", 400), turn("assistant", 400),
+                turn("user", 50)]
+    token_budget = budget(context_tokens=900)
+
+    fitted = token_budget.fit(SYSTEM, messages)
+
+    assert used(token_budget, fitted) <= token_budget.prompt_tokens
+    assert fitted[0] == SYSTEM and fitted[-2:] == messages[-2:]
+    assert len(fitted) - 1 < len(messages)
+    assert all(count_tokens(m["content"], MODEL) <= COMPACTED_TURN_TOKENS for m in fitted[1:-2])
+
+
+def test_the_tool_exchange_is_compacted_then_dropped_oldest_first():
+    messages = [turn("user", 20)]
+    tail = step("call_1", 1000) + step("call_2", 1000) + step("call_3", 1000)
+    token_budget = budget(context_tokens=1600)
+
+    fitted = token_budget.fit(SYSTEM, messages, tail=tail)
+
+    assert used(token_budget, fitted) <= token_budget.prompt_tokens
+    exchange = fitted[2:]
+    # Every tool result still follows the assistant message that called it.
+    calls = [m["tool_calls"][0]["id"] for m in exchange if m["role"] == "assistant"]
+    results = [m["tool_call_id"] for m in exchange if m["role"] == "tool"]
+    assert calls == results and calls[-1] == "call_3"
+    assert exchange[-1]["content"].startswith("output")
+
+
+def test_the_latest_results_share_what_is_left_when_nothing_else_can_go():
+    messages = [turn("user", 20)]
+    tail = step("call_1", 4000)
+    tail[0]["tool_calls"].append({"id": "call_2", "type": "function",
+                                  "function": {"name": "get_logs", "arguments": "{}"}})
+    tail.append({"role": "tool", "tool_call_id": "call_2", "content": " ".join(["log"] * 4000)})
+    token_budget = budget(context_tokens=1200)
+
+    fitted = token_budget.fit(SYSTEM, messages, tail=tail)
+
+    assert used(token_budget, fitted) <= token_budget.prompt_tokens
+    results = [m for m in fitted if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in results] == ["call_1", "call_2"]
+    assert all("tokens omitted" in m["content"] for m in results)
+
+
+def test_truncated_text_keeps_its_start_and_end_within_the_budget():
+    text = "\n".join(f"line {n}" for n in range(1000))
+
+    truncated = truncate(text, 100, MODEL)
+
+    assert truncated.startswith("line 0\n") and truncated.endswith("line 999")
+    assert "tokens omitted" in truncated
+    assert count_tokens(truncated, MODEL) <= 100
+    assert truncate("short", 100, MODEL) == "short"
@@ -0,0 +1,41 @@
+"""
+The topology tests check that the TopologyCore only answers with links that
+were learned within the caller's scope.
+"""
+
+from core.topology import TopologyCore
+
+
+def learn(topology: TopologyCore, scope: str):
+    topology.update("core1.example.net", {"Eth1": [{"hostname": "dist1", "port": "Eth49"}]}, scope=scope)
+    topology.update("dist1", {"Eth1": [{"hostname": "leaf1", "port": "Eth49"}]}, scope=scope)
+
+
+def test_links_are_only_visible_within_their_scope():
+    topology = TopologyCore()
+    learn(topology, scope="first")
+
+    assert [hop["to"] for hop in topology.path("core1", "leaf1", scope="first")] == ["dist1", "leaf1"]
+    assert topology.blast_radius("dist1", scope="first") == ["leaf1"]
+    assert topology.path("core1", "leaf1", scope="second") is None
+    assert topology.neighbors("dist1", scope="second") == []
+    assert topology.blast_radius("dist1", scope="second") is None
+    assert topology.stale(["core1", "dist1"], scope="second") == ["core1", "dist1"]
+    assert topology.stale(["core1", "dist1"], scope="first") == []
+
+
+def test_unreachable_hosts_are_not_retried_but_stay_hidden():
+    topology = TopologyCore()
+    learn(topology, scope="first")
+    topology.touch("dist1", scope="second")
+
+    assert topology.stale(["dist1"], scope="second") == []
+    assert topology.neighbors("dist1", scope="second") == []
+
+
+def test_addresses_do_not_register_short_names():
+    topology = TopologyCore()
+    topology.update("10.0.0.1", {"Eth1": [{"hostname": "10.0.0.2", "port": "Eth1"}]}, scope="first")
+
+    assert "10.0.0.1" in topology
+    assert "10" not in topology
@@ -0,0 +1,43 @@
+"""
+The WebSocket tests drive /chat/ws and check that a chat cannot be started
+again while one of its messages is being answered.
+"""
+
+import asyncio
+import json
+import threading
+
+import flow.open_ai
+from conftest import SETTINGS
+
+
+def test_start_frames_are_rejected_while_a_message_is_answered(monkeypatch, client, user_message):
+    test_client, sessions = client
+    released = threading.Event()
+
+    async def held(params, api_key):
+        yield {"choices": [{"delta": {"content": "Hello "}, "finish_reason": None}]}
+        while not released.is_set():
+            await asyncio.sleep(0.01)
+        yield {"choices": [{"delta": {"content": "there."}, "finish_reason": None}]}
+        yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+    monkeypatch.setattr(flow.open_ai.TRANSPORT, "stream", held)
+
+    with test_client.websocket_connect("/chat/ws?token=alice") as websocket:
+        websocket.send_text(json.dumps({"type": "start", **SETTINGS}))
+        session_id = websocket.receive_json()["message"]["session_id"]
+        websocket.send_text(json.dumps({"type": "message", "message": user_message("hello")["message"]}))
+        assert websocket.receive_json() == {"event": "delta", "content": "Hello "}
+
+        websocket.send_text(json.dumps({"type": "start", **SETTINGS}))
+        rejected = websocket.receive_json()["message"]
+        released.set()
+        events = [websocket.receive_json(), websocket.receive_json()]
+
+    assert rejected["sections"][0]["messageType"] == "error"
+    assert "cannot be started again" in rejected["sections"][0]["content"]
+    assert rejected["session_id"] == session_id
+    assert [event["event"] for event in events] == ["delta", "message"]
+    assert events[-1]["message"]["session_id"] == session_id
+    assert [m.sender for m in sessions.history(session_id, "alice").messages] == ["NetGPT", "You", "NetGPT"]